@@ -1,9 +1,18 @@
 import wn
 import json
 import os
+import sys
 from collections import defaultdict as dd
 from pathlib import Path
 
+### shared helpers live with the wordnet task
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'tasks' / 'wordnet'))
+from sensekeys import load_sensekeys
+from chainnet import read_tropes
+from ililemmas import load_ili_lemmas, sense_ilis
+from affixes import affix_links, pattern_counts
+from bootstrap import ensure
+
 data_dir = '.' #Chainnet directory
 outdir = 'build'
 os.makedirs(outdir, exist_ok=True)
@@ -16,49 +25,19 @@ wn.config.data_directory = 'wn_data'
    
 
 
-def read_data(data_dir, wn):
+def read_data(data_dir, my_wn):
     """
-    store all the tropes as a set
+    read all the tropes into a compact store, iterate over it for
     (trope, word, source_sense_id, target_sense_id)
     """
-    ### make mapping
-    skey = dict()
-    for s in ewn.senses(pos='n'):
-        #print (s.id, s.metadata()['identifier'])
-        skey[s.metadata()['identifier']] = s.id
-
-    tropes =set()    
-    # Read in metaphors
-    with open(f"{data_dir}/chainnet_metaphor.json", "r") as fp:
-        metaphor = json.load(fp)
-
-    print('Read Metaphors')
-
-    meta = dd(lambda: dd(list))
-
-    for e in metaphor['content']:
-        w = e['wordform']
-        fr_s = e['from_sense']
-        to_s = e['to_sense']
-        tropes.add(('metaphor', w, skey[fr_s], skey[to_s]))
-
-    # Read in metonymy
-    with open(f"{data_dir}/chainnet_metonymy.json", "r") as fp:
-        metonymy = json.load(fp)
-
-    print('Read Metonymy')
-
-    for e in metonymy['content']:
-        w = e['wordform']
-        fr_s = e['from_sense']
-        to_s = e['to_sense']
-        tropes.add(('metonym', w, skey[fr_s], skey[to_s]))
-    return tropes   
+    ### sense key -> sense id (built once per lexicon, then memory-mapped)
+    skey = load_sensekeys(my_wn)
+    return read_tropes(data_dir, skey)
 
 def analyze_tropes(wn, tropes):
-    ""
+    """
     loop through the tropes
-    
+    """
 
 
 
@@ -66,66 +45,48 @@ if __name__ == "__main__":
 ##
 ## Calculate derivational links between other senses
 ##
-    print('Downloading OMW 1.4')
-    wn.download('omw:1.4')
+    ### all of OMW 1.4: installed, restored from a snapshot, or
+    ### (last resort) downloaded
+    ensure('omw:1.4', lexicons=['omw-en:1.4'])
     ewn=wn.Wordnet(lexicon='omw-en:1.4')
     
     tropes = read_data(data_dir, ewn)
 
 
-    def sid2ili (key):
-        """ give an ili from a sense id """
-        return ewn.sense(id=key).synset().ili.id
+    ### sense id -> ili for all the tropes in one go
+    ilis = sense_ilis('omw-en:1.4', [sid for (_, _, src_id, tgt_id) in tropes
+                                     for sid in (src_id, tgt_id)])
  
     ### list them 
     for  (trope, word, src_id, tgt_id) in tropes:
         print(trope, word, src_id, tgt_id)
     
+    ### ili -> {wordnet: [lemmas]} for every 1.4 wordnet, built once and
+    ### stored in wn_data/index/
+    table = load_ili_lemmas('1.4')
+
+    ### suffix, prefix and zero derivation links in every wordnet,
+    ### for all the tropes in one pass (see affixes.py)
+    print('Finding affixes and suffixes')
+    rows = [(trope, ilis[src_id], ilis[tgt_id])
+            for (trope, word, src_id, tgt_id) in tropes
+            if src_id in ilis and tgt_id in ilis]
+    links = affix_links(table, [i1 for (_, i1, _) in rows], [i2 for (_, _, i2) in rows])
+    patterns = pattern_counts(links)
+    freq = {(w, link): n for w, _, link, n in patterns.itertuples(index=False)}
+
     drvdir = Path(outdir) / 'deriv-links.tsv'
     drv = open(drvdir, 'w')
 
     print("rel", "src", "tgt", "wn", "link",
-          "src-lem", "tgt=lem",
+          "src-lem", "tgt=lem", "kind", "freq",
           sep = '\t', file=drv)
-
-    print('Finding affixes and suffixes')
-    for (trope, word, src_id, tgt_id) in tropes:
-        for wnet in  wn.lexicons():
-            if wnet.version !='1.4':
-                continue
-            wnlabel = f'{wnet.id}:1.4'
-
-            twn = wn.Wordnet(lexicon=wnlabel)    
-            labels = dd(list)
-            i1 = sid2ili(src_id)
-            i2 = sid2ili(tgt_id)
-            if twn.synsets(ili=i1):
-                ll1 = twn.synsets(ili=i1)[0].lemmas()
-            else:
-                ll1 = []
-            if twn.synsets(ili=i2):
-                ll2 = twn.synsets(ili=i2)[0].lemmas()
-            else:
-                ll2 = []
-            for l1 in ll1:
-                for l2 in ll2:
-                    label = ''
-                    if l1==l2: ### ignore identical ones
-                            continue
-                    if l1.startswith(l2):
-                        label = wnet.id + '+' +  l1[len(l2):]
-                        labels[label].append((i1, l1, i2, l2))
-                    elif  l2.startswith(l1):
-                        label = wnet.id + '-' + l2[len(l1):]
-                        labels[label].append((i1, l1, i2, l2))
-
-                    if label:
-                        print(trope, i1, i2, wnet.id,
-                              label, l1, l2,
-                              sep = '\t', file=drv)
-
-
-    
-
-
-        
+    for pair, wnid, kind, link, affix, l1, l2 in links.itertuples(index=False):
+        trope, i1, i2 = rows[pair]
+        print(trope, i1, i2, wnid,
+              link, l1, l2, kind, freq[(wnid, link)],
+              sep = '\t', file=drv)
+    drv.close()
+
+    ### how often each pattern turns up in each wordnet
+    patterns.to_csv(Path(outdir) / 'deriv-patterns.tsv', sep='\t', index=False)
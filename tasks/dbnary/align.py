@@ -0,0 +1,354 @@
+"""
+Align DBnary senses with WordNet senses, block by block, in parallel
+
+synset-align compares every DBnary sense of a lemma with every WordNet
+sense of that lemma by gloss similarity.  Here the candidates are
+blocked first: a block is one DBnary entry and the wn entries that
+ingest.py linked it to (same lemma and part of speech, table wordnet),
+so only senses of the same lemma and POS are ever compared.
+
+For all the candidate pairs of a job (many blocks), the gloss features
+are computed at once with numpy:
+
+  overlap   content words the two glosses share
+  jaccard   overlap / content words in either gloss
+  cosine    cosine of the tf-idf vectors (idf from the wn definitions)
+
+best marks, for each DBnary sense, the wn sense(s) with the highest
+non-zero cosine.  Jobs run in a process pool; each worker reads the
+DBnary store and the wn database itself.
+
+The alignments are written as columns, one .npy per column, in a
+directory (load them with load_alignments()):
+
+  dbnary_sense, wn_sense, wn_synset, sense_key, lemma, pos   strings
+  dbnary_rank, wn_rank   order of the sense in its entry (from 1)
+  overlap, jaccard, cosine, best
+
+    python align.py build/dbnary-en.db --lexicon oewn:2024 -o build/align-en
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+
+import numpy as np
+
+# shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from sensekeys import connect_ro, lexicon_specifier
+from taxonomy import csr_ranges
+from pools import pool_context
+
+WORD = re.compile(r'[^\W\d_]{2,}')
+STOPWORDS = frozenset("""
+a an the of to in on at by for from with without into onto as or and but not no
+is are was were be been being has have had do does did that which who whom whose
+this these those it its one ones someone something any some such other than
+esp especially etc eg ie used usually often very more most""".split())
+BLOCKS = 2000
+QUERY = 500
+STRINGS = ('dbnary_sense', 'wn_sense', 'wn_synset', 'sense_key', 'lemma', 'pos')
+NUMBERS = {'dbnary_rank': np.int16, 'wn_rank': np.int16, 'overlap': np.int16,
+           'jaccard': np.float32, 'cosine': np.float32, 'best': np.bool_}
+
+_worker = dict()
+
+
+def content_words(text):
+    """
+    the set of lower-cased content words of a gloss, sorted
+    """
+    return sorted({w for w in WORD.findall((text or '').lower()) if w not in STOPWORDS})
+
+
+def wn_idf(conn, specifier):
+    """
+    {word: idf} over the definitions of the lexicon, and the idf of an
+    unseen word
+    """
+    df = Counter()
+    n = 0
+    rows = conn.execute("""SELECT d.definition FROM definitions AS d
+                           JOIN lexicons AS l ON l.rowid = d.lexicon_rowid
+                           WHERE l.specifier = ?""", (specifier,))
+    for (definition,) in rows:
+        n += 1
+        df.update(content_words(definition))
+    idf = {w: math.log((n + 1) / (c + 1)) + 1 for w, c in df.items()}
+    return idf, math.log(n + 1) + 1
+
+
+def sense_key(metadata):
+    if not metadata:
+        return ''
+    if isinstance(metadata, bytes):
+        metadata = metadata.decode('utf-8')
+    return json.loads(metadata).get('identifier') or ''
+
+
+def _init_worker(store, specifier, wn_db, idf, unseen):
+    _worker['store'] = sqlite3.connect(f"{Path(store).resolve().as_uri()}?mode=ro", uri=True)
+    _worker['wn'] = connect_ro(wn_db)
+    _worker['specifier'] = specifier
+    _worker['vocab'] = {w: i for i, w in enumerate(idf)}
+    ### the last term id is for words the wn definitions never use
+    _worker['idf'] = np.array(list(idf.values()) + [unseen])
+
+
+def _chunks(items, size=QUERY):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def read_block_senses(blocks):
+    """
+    DBnary senses of the entries, in sense number order ('2a' after '2',
+    '10' after '9'), and wn senses of the linked wn entries
+    """
+    store, wn_conn = _worker['store'], _worker['wn']
+    entries = sorted({e for e, _ in blocks})
+    wn_entries = sorted({w for _, w in blocks})
+    dbnary = dict()
+    for chunk in _chunks(entries):
+        marks = ','.join('?' * len(chunk))
+        for entry, sense, definition, lemma, pos in store.execute(
+                f"""SELECT s.entry, s.sense, s.definition, e.lemma, e.pos
+                    FROM senses AS s JOIN entries AS e ON e.entry = s.entry
+                    WHERE s.entry IN ({marks})
+                    ORDER BY s.entry, s.number IS NULL, CAST(s.number AS INTEGER),
+                             s.number, s.rowid""", chunk):
+            dbnary.setdefault(entry, []).append((sense, definition, lemma, pos))
+    wordnet = dict()
+    for chunk in _chunks(wn_entries):
+        marks = ','.join('?' * len(chunk))
+        for entry, sense, synset, metadata, definition in wn_conn.execute(
+                f"""SELECT e.id, s.id, y.id, s.metadata,
+                           (SELECT d.definition FROM definitions AS d
+                            WHERE d.synset_rowid = s.synset_rowid LIMIT 1)
+                    FROM senses AS s
+                    JOIN entries AS e ON e.rowid = s.entry_rowid
+                    JOIN synsets AS y ON y.rowid = s.synset_rowid
+                    JOIN lexicons AS l ON l.rowid = e.lexicon_rowid
+                    WHERE l.specifier = ? AND e.id IN ({marks})
+                    ORDER BY s.entry_rowid, s.entry_rank, s.rowid""",
+                (_worker['specifier'], *chunk)):
+            wordnet.setdefault(entry, []).append((sense, synset, sense_key(metadata), definition))
+    return dbnary, wordnet
+
+
+def gloss_table(glosses):
+    """
+    term ids and weights of a list of glosses as CSR arrays, with each
+    row's norm
+    """
+    vocab, idf = _worker['vocab'], _worker['idf']
+    unseen = len(idf) - 1
+    indptr = [0]
+    terms = []
+    for g in glosses:
+        terms.extend(vocab.get(w, unseen) for w in content_words(g))
+        indptr.append(len(terms))
+    indptr = np.array(indptr, dtype=np.int64)
+    terms = np.array(terms, dtype=np.int64)
+    weight = idf[terms] if len(terms) else np.zeros(0)
+    rows = np.repeat(np.arange(len(glosses)), np.diff(indptr))
+    norm = np.sqrt(np.bincount(rows, weights=weight ** 2, minlength=len(glosses)))
+    return indptr, terms, weight, norm
+
+
+def pair_features(left, right, a, b):
+    """
+    overlap, jaccard and cosine of the gloss pairs (left[a[k]], right[b[k]])
+    """
+    l_ptr, l_terms, l_weight, l_norm = left
+    r_ptr, r_terms, r_weight, r_norm = right
+    n_terms = len(_worker['idf'])
+    unseen = n_terms - 1
+
+    def expand(ptr, terms, weight, rows):
+        ### (pair, term) keys of every term of every pair's gloss
+        lens = ptr[rows + 1] - ptr[rows]
+        pair = np.repeat(np.arange(len(rows)), lens)
+        idx = csr_ranges(ptr, rows)
+        return pair * n_terms + terms[idx], weight[idx], terms[idx], lens
+
+    l_keys, l_w, l_t, l_len = expand(l_ptr, l_terms, l_weight, a)
+    r_keys, r_w, r_t, r_len = expand(r_ptr, r_terms, r_weight, b)
+    ### unseen words stand for different words: they never match
+    l_keys = np.where(l_t == unseen, -1, l_keys)
+    _, li, ri = np.intersect1d(l_keys, r_keys, assume_unique=False, return_indices=True)
+    keep = l_keys[li] >= 0
+    li, ri = li[keep], ri[keep]
+    pair = l_keys[li] // n_terms
+    overlap = np.bincount(pair, minlength=len(a))
+    dot = np.bincount(pair, weights=l_w[li] * r_w[ri], minlength=len(a))
+    union = l_len + r_len - overlap
+    jaccard = np.divide(overlap, union, out=np.zeros(len(a)), where=union > 0)
+    denom = l_norm[a] * r_norm[b]
+    cosine = np.divide(dot, denom, out=np.zeros(len(a)), where=denom > 0)
+    return overlap, jaccard, cosine
+
+
+def align_blocks(blocks):
+    """
+    features of every candidate pair of a list of (entry, wn entry) blocks
+    """
+    dbnary, wordnet = read_block_senses(blocks)
+    d_rows, w_rows = [], []
+    d_index, w_index = dict(), dict()
+    cols = {name: [] for name in STRINGS}
+    a, b, d_rank, w_rank = [], [], [], []
+    for entry, wn_entry in blocks:
+        for i, (sense, definition, lemma, pos) in enumerate(dbnary.get(entry, ()), 1):
+            if sense not in d_index:
+                d_index[sense] = len(d_rows)
+                d_rows.append(definition)
+            for j, (wn_sense, synset, key, wn_def) in enumerate(wordnet.get(wn_entry, ()), 1):
+                if wn_sense not in w_index:
+                    w_index[wn_sense] = len(w_rows)
+                    w_rows.append(wn_def)
+                a.append(d_index[sense])
+                b.append(w_index[wn_sense])
+                d_rank.append(i)
+                w_rank.append(j)
+                for name, value in zip(STRINGS, (sense, wn_sense, synset, key, lemma, pos)):
+                    cols[name].append(value or '')
+    a = np.array(a, dtype=np.int64)
+    b = np.array(b, dtype=np.int64)
+    if not len(a):
+        return empty_columns()
+    overlap, jaccard, cosine = pair_features(gloss_table(d_rows), gloss_table(w_rows), a, b)
+    ### best: the highest non-zero cosine of each DBnary sense
+    top = np.zeros(len(d_rows))
+    np.maximum.at(top, a, cosine)
+    best = (cosine > 0) & (cosine == top[a])
+    out = {name: np.array(values, dtype=str) for name, values in cols.items()}
+    numbers = {'dbnary_rank': d_rank, 'wn_rank': w_rank, 'overlap': overlap,
+               'jaccard': jaccard, 'cosine': cosine, 'best': best}
+    out.update({name: np.asarray(numbers[name], dtype=t) for name, t in NUMBERS.items()})
+    return out
+
+
+def empty_columns():
+    out = {name: np.zeros(0, dtype=str) for name in STRINGS}
+    out.update({name: np.zeros(0, dtype=t) for name, t in NUMBERS.items()})
+    return out
+
+
+def read_blocks(store, specifier):
+    conn = sqlite3.connect(f"{Path(store).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        have = conn.execute("SELECT value FROM meta WHERE key = 'lexicon'").fetchone()
+        if have is None or have[0] != specifier:
+            sys.exit(f"{store} is not linked to {specifier}: run ingest.py with --lexicon {specifier}")
+        return conn.execute("SELECT entry, wn_entry FROM wordnet ORDER BY entry, wn_entry").fetchall()
+    finally:
+        conn.close()
+
+
+def make_jobs(blocks, size=BLOCKS):
+    """
+    cut the (entry, wn entry) blocks, sorted by entry, into jobs of about
+    size blocks, never between two blocks of the same entry (best is
+    taken over the senses of one job)
+    """
+    job = []
+    for _, group in groupby(blocks, key=itemgetter(0)):
+        group = list(group)
+        if job and len(job) + len(group) > size:
+            yield job
+            job = []
+        job.extend(group)
+    if job:
+        yield job
+
+
+def save_alignments(columns, path):
+    path = Path(path)
+    tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    tmp.mkdir(parents=True, exist_ok=True)
+    try:
+        for name, values in columns.items():
+            np.save(tmp / f'{name}.npy', values)
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump({'rows': len(columns['best']), 'columns': list(columns)}, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+    finally:
+        ### gone after a successful replace; a failed save leaves nothing behind
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_alignments(path):
+    """
+    {column: array}, memory-mapped
+    """
+    path = Path(path)
+    with open(path / 'meta.json') as fh:
+        meta = json.load(fh)
+    return {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in meta['columns']}
+
+
+def align(store, lexicon, out, workers=None, blocks_per_job=BLOCKS, wn_db=None):
+    """
+    align a whole DBnary store with a wn lexicon; returns the columns
+    """
+    specifier = lexicon_specifier(lexicon)
+    blocks = read_blocks(store, specifier)
+    start = time.perf_counter()
+    conn = connect_ro(wn_db)
+    try:
+        idf, unseen = wn_idf(conn, specifier)
+    finally:
+        conn.close()
+    jobs = list(make_jobs(blocks, blocks_per_job))
+    print(f"{len(blocks):,} blocks in {len(jobs)} jobs, idf over {len(idf):,} words")
+    parts = []
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs))), mp_context=pool_context(),
+                             initializer=_init_worker,
+                             initargs=(store, specifier, wn_db, idf, unseen)) as pool:
+        for k, part in enumerate(pool.map(align_blocks, jobs), 1):
+            parts.append(part)
+            if k % 10 == 0 or k == len(jobs):
+                print(f"{k}/{len(jobs)} jobs, {sum(len(p['best']) for p in parts):,} pairs, "
+                      f"{time.perf_counter() - start:.0f}s")
+    parts = parts or [empty_columns()]
+    columns = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+    save_alignments(columns, out)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Align DBnary senses with WordNet senses")
+    parser.add_argument('store', help="SQLite store from ingest.py (made with --lexicon)")
+    parser.add_argument('--lexicon', required=True, help="wn lexicon, e.g. oewn:2024")
+    parser.add_argument('-o', '--out', help="output directory (default: build/align-<store name>)")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument('--blocks-per-job', type=int, default=BLOCKS)
+    args = parser.parse_args()
+
+    out = args.out or Path('build') / f"align-{Path(args.store).stem}"
+    start = time.perf_counter()
+    columns = align(args.store, args.lexicon, out, args.workers, args.blocks_per_job)
+    best = columns['best']
+    print(f"{len(best):,} candidate pairs, {int(best.sum()):,} best alignments, "
+          f"{len(set(columns['dbnary_sense'][best].tolist())):,} DBnary senses aligned, "
+          f"in {time.perf_counter() - start:.0f}s")
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
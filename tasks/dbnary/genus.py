@@ -0,0 +1,351 @@
+"""
+Find the genus (hypernym) term of dictionary definitions, at scale
+
+A definition usually starts with its genus: "A domesticated carnivorous
+mammal ..." -> mammal, "Someone who runs" -> person, "Any of various
+kinds of small bird ..." -> bird.  For every sense we
+
+  1. drop leading labels ("(zoology)") and determiners ("a", "any of
+     various", "one of the"), and skip empty heads ("kind of", "type
+     of", ...); "someone/somebody/one who" give person
+  2. take the first noun phrase (up to "of", "that", "with", ",", ...)
+     and look up its head in the wn noun index: the longest ending of
+     the phrase (3, 2 or 1 words) that is a noun lemma, after the usual
+     morphy endings (dogs -> dog, women -> woman); for verb definitions
+     ("To move fast") the first word that is a verb lemma
+  3. map the genus to its synsets (in sense order), and each synset to
+     a class: the first of the programmable roots (default person and
+     animal, see taxonomy.DEFAULT_ROOTS) it is, or is under
+
+and flag the words whose senses fall in different classes (PERSON vs
+ANIMAL, ...).  Lemma lookups are cached (bounded), definitions are read
+from the DBnary store (or a TSV file) with a cursor, and only a fixed
+number of chunks is in flight in the process pool, so memory stays
+constant however many definitions there are.  The rules are for
+English definitions.
+
+Output (TSV):
+  OUT          word, pos, sense, genus, pattern, synsets (first few),
+               class, classes (of all the genus synsets)
+  OUT.flags    word, pos, classes, senses: words with senses in more
+               than one class
+
+    python genus.py --store build/dbnary-en.db --lexicon oewn:2024 -o build/genus-en.tsv
+    python genus.py --tsv definitions.tsv --lexicon oewn:2024 --class person=00007846-n \\
+        --class animal=00015388-n --class plant=00017222-n
+"""
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import groupby, islice
+from pathlib import Path
+
+import numpy as np
+
+# shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from sensekeys import connect_ro, lexicon_specifier
+from taxonomy import DEFAULT_ROOTS, ancestor_index, load_taxonomy
+from pools import pool_context
+
+CHUNK = 2000
+REPORT = 100000
+LOOKUP_CACHE = 1 << 17
+SHOW_SYNSETS = 3
+### wn part of speech for DBnary (lexinfo) ones
+POS = {'noun': 'n', 'properNoun': 'n', 'verb': 'v', 'n': 'n', 'v': 'v'}
+
+LABEL = re.compile(r'^\s*(?:\([^)]*\)\s*|\[[^\]]*\]\s*)+')
+TOKEN = re.compile(r"[^\W\d_][\w'-]*|\S")
+DETERMINERS = frozenset("""a an the any some each every certain one's its their his her
+various several numerous many other""".split())
+### "any of", "one of", "a number of" ...
+QUANTITIES = frozenset('any one some each number group'.split())
+EMPTY_HEADS = frozenset('kind kinds type types sort sorts variety form species breed '
+                        'style genus class'.split())
+PERSONS = frozenset('someone somebody anyone person'.split())
+BOUNDARIES = frozenset("""of that which who whom whose where when with without for in on at
+from by to into as or and but used having especially esp usually typically
+often such like consisting containing made being is are was""".split())
+### WordNet's morphy rules for nouns
+NOUN_ENDINGS = (('s', ''), ('ses', 's'), ('xes', 'x'), ('zes', 'z'), ('ches', 'ch'),
+                ('shes', 'sh'), ('men', 'man'), ('ies', 'y'))
+
+_worker = dict()
+
+
+def read_lemma_index(specifier, tax, conn):
+    """
+    {(lemma, pos): synset numbers in sense order} for the nouns and verbs
+    """
+    rows = conn.execute("""SELECT lower(f.form), e.pos, y.id FROM forms AS f
+                           JOIN entries AS e ON e.rowid = f.entry_rowid
+                           JOIN senses AS s ON s.entry_rowid = e.rowid
+                           JOIN synsets AS y ON y.rowid = s.synset_rowid
+                           JOIN lexicons AS l ON l.rowid = e.lexicon_rowid
+                           WHERE l.specifier = ? AND e.pos IN ('n', 'v')
+                           ORDER BY e.rowid, s.entry_rank, s.rowid""", (specifier,))
+    index = dict()
+    for form, pos, synset in rows:
+        i = tax.ordinal(synset)
+        if i >= 0:
+            found = index.setdefault((form, pos), [])
+            if i not in found:
+                found.append(i)
+    return {k: tuple(v) for k, v in index.items()}
+
+
+def synset_classes(specifier, roots):
+    """
+    class name of every synset (by number): the first root it is, or is
+    under ('' if none)
+    """
+    ai = ancestor_index(specifier, roots)
+    names = list(roots)
+    labels = np.array(ai.labels(names=names), dtype=object)
+    ### a root is not under itself, but it is in its own class
+    for name, r in zip(ai.names, ai.roots):
+        if r >= 0 and labels[r] == '':
+            labels[r] = name
+    return labels
+
+
+def _init_worker(specifier, roots):
+    tax = load_taxonomy(specifier)
+    conn = connect_ro()
+    try:
+        _worker['lemmas'] = read_lemma_index(specifier, tax, conn)
+    finally:
+        conn.close()
+    _worker['ids'] = tax.ids
+    _worker['classes'] = synset_classes(specifier, roots)
+    lookup.cache_clear()
+
+
+@lru_cache(maxsize=LOOKUP_CACHE)
+def lookup(phrase, pos):
+    """
+    (lemma, synset numbers) of a word or phrase, trying the morphy
+    endings for nouns; None if it is not in the index
+    """
+    lemmas = _worker['lemmas']
+    candidates = [phrase]
+    if pos == 'n':
+        candidates += [phrase[:-len(end)] + base for end, base in NOUN_ENDINGS
+                       if phrase.endswith(end) and len(phrase) > len(end)]
+    for c in candidates:
+        found = lemmas.get((c, pos))
+        if found:
+            return c, found
+    return None
+
+
+def noun_phrase(words):
+    """
+    the words of the first noun phrase, after the determiners and empty
+    heads; and the pattern that got there
+    """
+    pattern = 'head'
+    i = 0
+    while i < len(words):
+        w = words[i]
+        if w in QUANTITIES and i + 1 < len(words) and words[i + 1] == 'of':
+            i += 2
+        elif w in DETERMINERS:
+            i += 1
+        elif w in EMPTY_HEADS and i + 1 < len(words) and words[i + 1] == 'of':
+            pattern = 'kind-of'
+            i += 2
+        else:
+            break
+    if i < len(words) and (words[i] in PERSONS or
+                           (words[i] == 'one' and words[i + 1:i + 2] in (['who'], ['that']))):
+        return ['person'], 'person'
+    phrase = []
+    for w in words[i:]:
+        if w in BOUNDARIES or not w[0].isalpha():
+            break
+        phrase.append(w)
+    return phrase, pattern
+
+
+def find_genus(definition, pos='n'):
+    """
+    (genus lemma, pattern, synset numbers) of a definition, or
+    (None, pattern, ()) if no genus is found
+    """
+    text = LABEL.sub('', definition or '')
+    words = [w.lower() for w in TOKEN.findall(text)]
+    if pos == 'v':
+        if words[:1] == ['to']:
+            words = words[1:]
+        for w in words[:4]:
+            found = lookup(w, 'v')
+            if found:
+                return found[0], 'verb', found[1]
+        return None, 'verb', ()
+    phrase, pattern = noun_phrase(words)
+    ### the longest ending of the phrase that is a lemma, then earlier words
+    for end in range(len(phrase), 0, -1):
+        for n in (3, 2, 1):
+            if n > end:
+                continue
+            found = lookup(' '.join(phrase[end - n:end]), 'n')
+            if found:
+                return found[0], pattern, found[1]
+    return None, pattern, ()
+
+
+def genus_rows(chunk):
+    """
+    one output row per (word, pos, sense, definition) of a chunk
+    """
+    ids, classes = _worker['ids'], _worker['classes']
+    out = []
+    for word, pos, sense, definition in chunk:
+        genus, pattern, synsets = find_genus(definition, POS.get(pos, 'n'))
+        labels = [classes[i] for i in synsets]
+        cls = next((c for c in labels if c), '')
+        out.append((word, pos, sense, genus or '', pattern,
+                    ' '.join(ids[i] for i in synsets[:SHOW_SYNSETS]),
+                    cls, ' '.join(sorted(set(c for c in labels if c)))))
+    return out
+
+
+def read_store(path, pos=('noun', 'properNoun')):
+    """
+    (word, pos, sense, definition) from a DBnary store, the senses of
+    each word together
+    """
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    marks = ','.join('?' * len(pos))
+    try:
+        yield from conn.execute(f"""SELECT e.lemma, e.pos, s.sense, s.definition
+                                    FROM senses AS s JOIN entries AS e ON e.entry = s.entry
+                                    WHERE e.pos IN ({marks}) AND s.definition IS NOT NULL
+                                    ORDER BY e.lemma COLLATE NOCASE, e.pos, s.rowid""", pos)
+    finally:
+        conn.close()
+
+
+def read_tsv(path):
+    """
+    (word, pos, sense, definition) from a TSV file, lines of the same
+    word together
+    """
+    with open(path, encoding='utf-8') as fh:
+        for row in csv.reader(fh, delimiter='\t', quoting=csv.QUOTE_NONE):
+            if len(row) >= 4 and not row[0].startswith('#'):
+                yield tuple(row[:4])
+
+
+def bounded_map(pool, fn, chunks, in_flight):
+    """
+    pool.map that keeps at most in_flight chunks submitted, in order
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(fn, chunk))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def chunked(rows, size=CHUNK):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def extract(rows, lexicon, out, roots=None, workers=None):
+    """
+    write the genus of every sense to out and the flagged words to
+    out.flags; returns (senses, with a genus, flagged words)
+    """
+    specifier = lexicon_specifier(lexicon)
+    roots = roots or {n: DEFAULT_ROOTS[n] for n in ('person', 'animal')}
+    ### build (or check) the cached taxonomy once, before the workers
+    load_taxonomy(specifier)
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    flags_path = out.with_name(out.name + '.flags')
+    workers = workers or os.cpu_count() or 1
+    n = found = flagged = 0
+    report = REPORT
+    start = time.perf_counter()
+    with open(out, 'w', encoding='utf-8', newline='') as fh, \
+            open(flags_path, 'w', encoding='utf-8', newline='') as flags_fh, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(), initializer=_init_worker,
+                                initargs=(specifier, roots)) as pool:
+        w = csv.writer(fh, delimiter='\t')
+        w.writerow(['word', 'pos', 'sense', 'genus', 'pattern', 'synsets', 'class', 'classes'])
+        fw = csv.writer(flags_fh, delimiter='\t')
+        fw.writerow(['word', 'pos', 'classes', 'senses'])
+        results = (r for chunk in bounded_map(pool, genus_rows, chunked(rows), 2 * workers)
+                   for r in chunk)
+        ### rows of one word are together, so the flags need only one word at a time
+        for (word, pos), senses in groupby(results, key=lambda r: (r[0].lower(), r[1])):
+            classes = dict()
+            for r in senses:
+                w.writerow(r)
+                n += 1
+                found += bool(r[3])
+                if r[6]:
+                    classes.setdefault(r[6], []).append(r[2])
+            if len(classes) > 1:
+                flagged += 1
+                fw.writerow([word, pos, ' '.join(sorted(classes)),
+                             ' '.join(f"{c}:{s}" for c in sorted(classes) for s in classes[c])])
+            if n >= report:
+                report += REPORT
+                print(f"{n:,} senses, {n / (time.perf_counter() - start):,.0f}/s", file=sys.stderr)
+    return n, found, flagged
+
+
+def parse_class(text):
+    name, _, ref = text.partition('=')
+    if not ref:
+        raise argparse.ArgumentTypeError(f"expected NAME=SYNSET, got {text!r}")
+    return name, ref
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the genus term of definitions")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--store', help="DBnary store from ingest.py")
+    source.add_argument('--tsv', help="TSV of word, pos, sense id, definition (words together)")
+    parser.add_argument('--lexicon', required=True, help="wn lexicon, e.g. oewn:2024")
+    parser.add_argument('-o', '--out', default=os.path.join('build', 'genus.tsv'))
+    parser.add_argument('--class', dest='classes', type=parse_class, action='append',
+                        help="NAME=SYNSET (ILI, synset id or offset-pos), repeatable "
+                             "(default: person and animal)")
+    parser.add_argument('--verbs', action='store_true', help="also the verb senses of the store")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.store:
+        pos = ('noun', 'properNoun') + (('verb',) if args.verbs else ())
+        rows = read_store(args.store, pos)
+    else:
+        rows = read_tsv(args.tsv)
+    start = time.perf_counter()
+    n, found, flagged = extract(rows, args.lexicon, args.out,
+                                dict(args.classes) if args.classes else None, args.workers)
+    print(f"{n:,} senses, {found:,} with a genus, {flagged:,} words flagged, "
+          f"in {time.perf_counter() - start:.0f}s")
+    print(f"Wrote {args.out} and {args.out}.flags")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Stream a DBnary dump into a compact, indexed SQLite store
+
+DBnary dumps (en_dbnary_ontolex.ttl.bz2, cs_dbnary_ontolex.ttl.bz2, ...)
+are read statement by statement with rdfstream.py, never as a whole
+graph.  Only the statements we need are kept, in a staging table on
+disk, and turned into these tables at the end:
+
+  entries       entry, page, lemma, pos (lexinfo), dbnary_pos, language
+  senses        sense, entry, number, definition
+  translations  translation, entry, sense, language, written, gloss
+  relations     source (entry, sense or page), relation (hypernym,
+                hyponym, synonym, ...), target (page), target_lemma
+  wordnet       entry, wn_entry, wn_pos: entries whose lemma and part
+                of speech are in a wn lexicon (--lexicon)
+  meta          the dump, counts, throughput and peak memory
+
+Throughput and peak memory are printed as we go and kept in meta.
+
+    python ingest.py en_dbnary_ontolex.ttl.bz2 -o build/dbnary-en.db --lexicon oewn:2024
+    python ingest.py cs_dbnary_ontolex.ttl.bz2 -o build/dbnary-cs.db
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+from rdfstream import Literal, open_dump, triples
+
+# shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+ONTOLEX = 'http://www.w3.org/ns/lemon/ontolex#'
+LIME = 'http://www.w3.org/ns/lemon/lime#'
+LEXINFO = 'http://www.lexinfo.net/ontology/2.0/lexinfo#'
+SKOS = 'http://www.w3.org/2004/02/skos/core#'
+DCT = 'http://purl.org/dc/terms/'
+DBNARY = 'http://kaiko.getalp.org/dbnary#'
+
+RELATIONS = ('hypernym', 'hyponym', 'synonym', 'antonym', 'holonym', 'meronym',
+             'troponym', 'approximateSynonym')
+### the predicates we keep, and the code they get in the staging table
+KEEP = {p: i for i, p in enumerate(
+    [RDF + 'type', RDF + 'value', ONTOLEX + 'canonicalForm', ONTOLEX + 'writtenRep',
+     ONTOLEX + 'sense', SKOS + 'definition', LEXINFO + 'partOfSpeech',
+     DBNARY + 'partOfSpeech', LIME + 'language', DCT + 'language', DBNARY + 'describes',
+     DBNARY + 'senseNumber', DBNARY + 'isTranslationOf', DBNARY + 'targetLanguage',
+     DBNARY + 'targetLanguageCode', DBNARY + 'writtenForm', DBNARY + 'gloss']
+    + [DBNARY + r for r in RELATIONS])}
+TYPES = {ONTOLEX + 'LexicalEntry', ONTOLEX + 'Word', ONTOLEX + 'MultiWordExpression',
+         ONTOLEX + 'LexicalSense', DBNARY + 'Translation', DBNARY + 'Page'}
+### lexinfo parts of speech -> wn parts of speech
+WN_POS = {'noun': 'n', 'properNoun': 'n', 'verb': 'v', 'adjective': 'a', 'adverb': 'r'}
+BATCH = 50000
+REPORT = 1000000
+
+SCHEMA = """
+CREATE TABLE staging (s TEXT, p INTEGER, o TEXT, lang TEXT);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def local_name(iri):
+    """
+    the last part of an IRI, decoded (lexinfo#noun -> noun, .../eng/ice_cream -> ice cream)
+    """
+    if iri is None:
+        return None
+    name = iri.rstrip('/').rsplit('/', 1)[-1].rsplit('#', 1)[-1]
+    return unquote(name).replace('_', ' ')
+
+
+def peak_memory():
+    """
+    peak resident memory of this process in MB (None if unknown)
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ### kB on Linux, bytes on macOS
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024
+
+
+def stage(conn, path, report=REPORT):
+    """
+    stream the dump into the staging table; returns statistics
+    """
+    start = time.perf_counter()
+    n = kept = 0
+    rows = []
+    insert = "INSERT INTO staging VALUES (?, ?, ?, ?)"
+    with open_dump(path) as dump:
+        for s, p, o in triples(dump):
+            n += 1
+            c = KEEP.get(p)
+            if c is not None and (c != 0 or o in TYPES):
+                if isinstance(o, Literal):
+                    rows.append((s, c, o.value, o.lang))
+                else:
+                    rows.append((s, c, o, None))
+                if len(rows) >= BATCH:
+                    conn.executemany(insert, rows)
+                    kept += len(rows)
+                    rows = []
+            if n % report == 0:
+                progress(n, kept + len(rows), dump.tell(), time.perf_counter() - start)
+        conn.executemany(insert, rows)
+        kept += len(rows)
+        size = dump.tell()
+    seconds = time.perf_counter() - start
+    progress(n, kept, size, seconds)
+    conn.commit()
+    return {'triples': n, 'kept': kept, 'bytes': size, 'seconds': round(seconds, 1),
+            'triples_per_second': round(n / seconds) if seconds else None,
+            'mb_per_second': round(size / (1 << 20) / seconds, 2) if seconds else None}
+
+
+def progress(n, kept, size, seconds):
+    peak = peak_memory()
+    print(f"{n:,} triples, {kept:,} kept, {size / (1 << 20):,.0f} MB read, "
+          f"{n / max(seconds, 1e-9):,.0f} triples/s, "
+          f"{size / (1 << 20) / max(seconds, 1e-9):.1f} MB/s"
+          + (f", peak {peak:,.0f} MB" if peak is not None else ""), file=sys.stderr)
+
+
+def build_tables(conn):
+    """
+    resolve the staged statements into the lexical tables
+    """
+    conn.create_function('local_name', 1, local_name, deterministic=True)
+    conn.execute("CREATE INDEX staging_ps ON staging (p, s)")
+    conn.execute("CREATE INDEX staging_po ON staging (p, o)")
+    t = {name: KEEP[iri] for name, iri in (
+        ('type', RDF + 'type'), ('value', RDF + 'value'),
+        ('canonical', ONTOLEX + 'canonicalForm'), ('rep', ONTOLEX + 'writtenRep'),
+        ('sense', ONTOLEX + 'sense'), ('definition', SKOS + 'definition'),
+        ('pos', LEXINFO + 'partOfSpeech'), ('dbpos', DBNARY + 'partOfSpeech'),
+        ('lime', LIME + 'language'), ('dct', DCT + 'language'),
+        ('describes', DBNARY + 'describes'), ('number', DBNARY + 'senseNumber'),
+        ('of', DBNARY + 'isTranslationOf'), ('target', DBNARY + 'targetLanguage'),
+        ('target_code', DBNARY + 'targetLanguageCode'),
+        ('written', DBNARY + 'writtenForm'), ('gloss', DBNARY + 'gloss'))}
+    entry_types = ','.join(f"'{x}'" for x in (ONTOLEX + 'LexicalEntry', ONTOLEX + 'Word',
+                                             ONTOLEX + 'MultiWordExpression'))
+
+    ### one value per (subject, predicate): the first staged
+    def first(alias, p, subject):
+        return (f"(SELECT {alias}.o FROM staging AS {alias} "
+                f"WHERE {alias}.p = {p} AND {alias}.s = {subject} LIMIT 1)")
+
+    ### a literal, or the rdf:value of the node it points to
+    def text(alias, p, subject):
+        return (f"(SELECT COALESCE(v.o, {alias}.o) FROM staging AS {alias} "
+                f"LEFT JOIN staging AS v ON v.p = {t['value']} AND v.s = {alias}.o "
+                f"WHERE {alias}.p = {p} AND {alias}.s = {subject} LIMIT 1)")
+
+    conn.executescript(f"""
+    CREATE TABLE entries AS
+      SELECT DISTINCT e.s AS entry,
+             (SELECT pg.s FROM staging AS pg
+              WHERE pg.p = {t['describes']} AND pg.o = e.s LIMIT 1) AS page,
+             (SELECT r.o FROM staging AS c JOIN staging AS r ON r.p = {t['rep']} AND r.s = c.o
+              WHERE c.p = {t['canonical']} AND c.s = e.s LIMIT 1) AS lemma,
+             local_name({first('ps', t['pos'], 'e.s')}) AS pos,
+             {first('dp', t['dbpos'], 'e.s')} AS dbnary_pos,
+             COALESCE({first('ll', t['lime'], 'e.s')},
+                      local_name({first('dl', t['dct'], 'e.s')})) AS language
+      FROM staging AS e WHERE e.p = {t['type']} AND e.o IN ({entry_types});
+
+    CREATE TABLE senses AS
+      SELECT DISTINCT se.o AS sense, se.s AS entry,
+             {first('n', t['number'], 'se.o')} AS number,
+             {text('d', t['definition'], 'se.o')} AS definition
+      FROM staging AS se WHERE se.p = {t['sense']};
+    CREATE INDEX senses_sense ON senses (sense);
+
+    CREATE TABLE translations AS
+      SELECT DISTINCT tr.s AS translation,
+             COALESCE((SELECT entry FROM senses WHERE sense = tr.o LIMIT 1), tr.o) AS entry,
+             (SELECT sense FROM senses WHERE sense = tr.o LIMIT 1) AS sense,
+             COALESCE({first('tc', t['target_code'], 'tr.s')},
+                      local_name({first('tl', t['target'], 'tr.s')})) AS language,
+             {first('w', t['written'], 'tr.s')} AS written,
+             {text('g', t['gloss'], 'tr.s')} AS gloss
+      FROM staging AS tr WHERE tr.p = {t['of']};
+    """)
+    conn.execute("CREATE TABLE relations (source TEXT, relation TEXT, target TEXT, target_lemma TEXT)")
+    for name in RELATIONS:
+        conn.execute("""INSERT INTO relations
+                        SELECT DISTINCT s, ?, o, local_name(o) FROM staging WHERE p = ?""",
+                     (name, KEEP[DBNARY + name]))
+    conn.executescript("""
+    CREATE INDEX entries_entry ON entries (entry);
+    CREATE INDEX entries_lemma ON entries (lemma COLLATE NOCASE);
+    CREATE INDEX entries_page ON entries (page);
+    CREATE INDEX senses_entry ON senses (entry);
+    CREATE INDEX translations_entry ON translations (entry);
+    CREATE INDEX translations_written ON translations (written COLLATE NOCASE);
+    CREATE INDEX relations_source ON relations (source);
+    CREATE INDEX relations_relation ON relations (relation, target_lemma);
+    """)
+    conn.commit()
+
+
+def link_wordnet(conn, lexicon):
+    """
+    the wordnet table: entries whose lemma (ignoring case) and part of
+    speech are those of an entry in a wn lexicon (its lemma, rank 0, not
+    its other forms: "geese" is not linked to goose)
+    """
+    from sensekeys import connect_ro, lexicon_specifier
+
+    specifier = lexicon_specifier(lexicon)
+    wn_conn = connect_ro()
+    try:
+        rows = wn_conn.execute("""SELECT lower(f.form), e.pos, e.id FROM forms AS f
+                                  JOIN entries AS e ON e.rowid = f.entry_rowid
+                                  JOIN lexicons AS l ON l.rowid = e.lexicon_rowid
+                                  WHERE l.specifier = ? AND f.rank = 0""", (specifier,))
+        conn.execute("CREATE TEMP TABLE wn_forms (form TEXT, pos TEXT, wn_entry TEXT)")
+        while True:
+            chunk = rows.fetchmany(BATCH)
+            if not chunk:
+                break
+            conn.executemany("INSERT INTO wn_forms VALUES (?, ?, ?)", chunk)
+    finally:
+        wn_conn.close()
+    ### wn has satellites (s) as well as adjectives (a)
+    conn.execute("UPDATE wn_forms SET pos = 'a' WHERE pos = 's'")
+    conn.execute("CREATE INDEX temp.wn_forms_form ON wn_forms (form, pos)")
+    cases = ' '.join(f"WHEN '{k}' THEN '{v}'" for k, v in WN_POS.items())
+    conn.executescript(f"""
+    CREATE TABLE wordnet AS
+      SELECT DISTINCT e.entry, w.wn_entry, w.pos AS wn_pos
+      FROM entries AS e
+      JOIN wn_forms AS w ON w.form = lower(e.lemma) AND w.pos = CASE e.pos {cases} END;
+    CREATE INDEX wordnet_entry ON wordnet (entry);
+    CREATE INDEX wordnet_wn_entry ON wordnet (wn_entry);
+    """)
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('lexicon', ?)", (specifier,))
+    conn.commit()
+
+
+def ingest(dump, out, lexicon=None, keep_staging=False, report=REPORT):
+    """
+    build the store for one dump at out (replacing it); returns the
+    statistics kept in meta
+    """
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + f'.{os.getpid()}.tmp')
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+        stats = stage(conn, dump, report)
+        start = time.perf_counter()
+        build_tables(conn)
+        if lexicon:
+            link_wordnet(conn, lexicon)
+        for table in ('entries', 'senses', 'translations', 'relations'):
+            stats[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if lexicon:
+            stats['wordnet'] = conn.execute("SELECT COUNT(*) FROM wordnet").fetchone()[0]
+        if not keep_staging:
+            conn.execute("DROP TABLE staging")
+            conn.commit()
+            conn.execute("VACUUM")
+        stats['index_seconds'] = round(time.perf_counter() - start, 1)
+        stats['peak_mb'] = peak_memory()
+        stats['dump'] = str(dump)
+        conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                         [(k, json.dumps(v)) for k, v in stats.items()])
+        conn.commit()
+        conn.close()
+        os.replace(tmp, out)
+    finally:
+        conn.close()
+        ### gone after a successful replace; a failed build leaves nothing behind
+        if tmp.exists():
+            tmp.unlink()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a DBnary dump into SQLite")
+    parser.add_argument('dump', help="DBnary dump (.ttl, .nt, optionally .bz2 or .gz)")
+    parser.add_argument('-o', '--out', help="SQLite file (default: build/<dump name>.db)")
+    parser.add_argument('--lexicon', help="wn lexicon to link the lemmas to, e.g. oewn:2024")
+    parser.add_argument('--keep-staging', action='store_true',
+                        help="keep the raw statements (table staging)")
+    args = parser.parse_args()
+
+    out = args.out or Path('build') / (Path(args.dump).name.split('.')[0] + '.db')
+    stats = ingest(args.dump, out, args.lexicon, args.keep_staging)
+    for k in ('entries', 'senses', 'translations', 'relations', 'wordnet'):
+        if k in stats:
+            print(f"{k:>14}: {stats[k]:,}")
+    print(f"{stats['triples']:,} triples in {stats['seconds']}s "
+          f"({stats['triples_per_second']:,}/s, {stats['mb_per_second']} MB/s), "
+          f"indexing {stats['index_seconds']}s, peak memory {stats['peak_mb']} MB")
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Streaming Turtle / N-Triples reader
+
+rdflib parses a whole dump into an in-memory Graph, which does not fit
+for the multi-gigabyte DBnary dumps.  Here the file is read in chunks
+(.bz2 and .gz are decompressed on the fly), cut into tokens, and the
+statements are yielded one (subject, predicate, object) at a time.  Only
+the prefixes, and the current subject and predicate, are kept.
+
+Terms are:
+
+  IRIs         plain strings, with prefixes expanded
+  blank nodes  '_:label' (anonymous [ ... ] nodes get '_:g<n>')
+  literals     Literal(value, lang, datatype)
+
+The Turtle handled is what the DBnary dumps (and N-Triples) use:
+@prefix/@base (and PREFIX/BASE), ';' and ',' lists, 'a', blank node
+property lists, collections, short and long strings, language tags,
+datatypes, numbers and booleans.
+
+    from rdfstream import open_dump, triples
+    with open_dump('en_dbnary_ontolex.ttl.bz2') as dump:
+        for s, p, o in triples(dump):
+            ...
+"""
+import bz2
+import gzip
+import io
+import re
+from collections import namedtuple
+from urllib.parse import urljoin
+
+CHUNK = 1 << 20
+### a token this close to the end of the buffer may be cut: read more first
+MARGIN = 256
+LONG_QUOTES = ('"""', "'''")
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+Literal = namedtuple('Literal', 'value lang datatype')
+
+TOKEN = re.compile(r'''
+    (?P<skip>[ \t\r\n]+|\#[^\n]*)
+  | (?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+  | (?P<long>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!\'\'))*\'\'\')
+  | (?P<string>"(?:[^"\\\n\r]|\\.)*"|'(?:[^'\\\n\r]|\\.)*')
+  | (?P<directive>@prefix|@base)\b
+  | (?P<lang>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+  | (?P<datatype>\^\^)
+  | (?P<bnode>_:[\w-](?:[\w.-]*[\w-])?)
+  | (?P<number>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.?\d+[eE][+-]?\d+|\d*\.\d+|\d+))
+  | (?P<pname>(?:[A-Za-z][\w.-]*)?:(?:(?:[\w:%-]|\\[-_~.!$&'()*+,;=/?\#@%])
+                                    (?:(?:[\w.:%-]|\\[-_~.!$&'()*+,;=/?\#@%])*
+                                       (?:[\w:%-]|\\[-_~.!$&'()*+,;=/?\#@%]))?)?)
+  | (?P<word>[A-Za-z]+)
+  | (?P<punct>[;,.\[\]()])
+''', re.VERBOSE)
+
+ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.DOTALL)
+SIMPLE = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f',
+          '"': '"', "'": "'", '\\': '\\'}
+PNAME_ESCAPE = re.compile(r'\\(.)')
+
+
+class ParseError(ValueError):
+    pass
+
+
+def unescape(text):
+    def sub(m):
+        if m.group(1) or m.group(2):
+            return chr(int(m.group(1) or m.group(2), 16))
+        return SIMPLE.get(m.group(3), m.group(3))
+    return ESCAPE.sub(sub, text) if '\\' in text else text
+
+
+class Reader:
+    """
+    chunked text stream, and how much of the underlying file is read
+    """
+
+    def __init__(self, path, chunk=CHUNK):
+        self.path = path
+        self.chunk = chunk
+        self.raw = open(path, 'rb')
+        name = str(path).lower()
+        if name.endswith('.bz2'):
+            stream = bz2.open(self.raw)
+        elif name.endswith('.gz'):
+            stream = gzip.open(self.raw)
+        else:
+            stream = self.raw
+        self.text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+    def read(self):
+        return self.text.read(self.chunk)
+
+    def tell(self):
+        """
+        bytes of the file (compressed, if it is) read so far
+        """
+        return self.raw.tell()
+
+    def close(self):
+        self.text.close()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_dump(path, chunk=CHUNK):
+    return Reader(path, chunk)
+
+
+def tokens(reader):
+    """
+    yield (kind, text) tokens, reading more whenever a token could run
+    past the end of what has been read (1.5 cut as 1. reads as 1 then .),
+    or a long string is not closed yet (its opening quotes would read as
+    an empty string)
+    """
+    buf = ''
+    pos = 0
+    eof = False
+    while True:
+        m = TOKEN.match(buf, pos)
+        if m is None or (not eof and (m.end() > len(buf) - MARGIN or
+                                      (m.lastgroup == 'string' and
+                                       buf.startswith(LONG_QUOTES, pos)))):
+            if eof:
+                if pos < len(buf):
+                    raise ParseError(f"cannot read {buf[pos:pos + 40]!r}")
+                return
+            data = reader.read()
+            buf = buf[pos:] + data
+            pos = 0
+            eof = not data
+            continue
+        pos = m.end()
+        kind = m.lastgroup
+        if kind != 'skip':
+            yield kind, m.group(kind)
+
+
+class Parser:
+    """
+    recursive descent over the token stream, one statement at a time
+    """
+
+    def __init__(self, reader):
+        self.tokens = tokens(reader)
+        self.ahead = None
+        self.prefixes = dict()
+        self.base = None
+        self.blank = 0
+
+    def peek(self):
+        if self.ahead is None:
+            self.ahead = next(self.tokens, ('eof', ''))
+        return self.ahead
+
+    def next(self):
+        tok = self.peek()
+        self.ahead = None
+        return tok
+
+    def expect(self, text):
+        kind, value = self.next()
+        if value != text:
+            raise ParseError(f"expected {text!r}, got {value!r}")
+
+    def fresh(self):
+        self.blank += 1
+        return f'_:g{self.blank}'
+
+    def iri(self, text):
+        text = unescape(text[1:-1])
+        if self.base and ':' not in text:
+            return urljoin(self.base, text)
+        return text
+
+    def pname(self, text):
+        prefix, _, local = text.partition(':')
+        if prefix not in self.prefixes:
+            raise ParseError(f"unknown prefix {prefix!r}")
+        return self.prefixes[prefix] + PNAME_ESCAPE.sub(r'\1', local)
+
+    def statements(self):
+        """
+        yield every (subject, predicate, object) of the document
+        """
+        while True:
+            kind, value = self.peek()
+            if kind == 'eof':
+                return
+            if kind == 'directive' or (kind == 'word' and value.upper() in ('PREFIX', 'BASE')):
+                self.directive()
+                continue
+            self.next()
+            if value == '[':
+                subject = self.fresh()
+                if self.peek()[1] != ']':
+                    yield from self.predicate_objects(subject)
+                self.expect(']')
+                if self.peek()[1] != '.':
+                    yield from self.predicate_objects(subject)
+            elif value == '(':
+                subject = yield from self.collection()
+                yield from self.predicate_objects(subject)
+            else:
+                subject = self.term(kind, value)
+                yield from self.predicate_objects(subject)
+            self.expect('.')
+
+    def directive(self):
+        kind, value = self.next()
+        sparql = kind == 'word'
+        if value.lower().endswith('prefix'):
+            _, name = self.next()
+            _, iri = self.next()
+            self.prefixes[name[:-1]] = self.iri(iri)
+        else:
+            _, iri = self.next()
+            self.base = self.iri(iri)
+        if not sparql:
+            self.expect('.')
+
+    def predicate_objects(self, subject):
+        while True:
+            kind, value = self.next()
+            predicate = RDF + 'type' if (kind, value) == ('word', 'a') else self.term(kind, value)
+            while True:
+                obj = yield from self.object()
+                yield subject, predicate, obj
+                if self.peek()[1] != ',':
+                    break
+                self.next()
+            ### ';' may repeat, and may end the list
+            if self.peek()[1] != ';':
+                return
+            while self.peek()[1] == ';':
+                self.next()
+            if self.peek()[1] in ('.', ']'):
+                return
+
+    def object(self):
+        kind, value = self.next()
+        if value == '[':
+            node = self.fresh()
+            if self.peek()[1] != ']':
+                yield from self.predicate_objects(node)
+            self.expect(']')
+            return node
+        if value == '(':
+            return (yield from self.collection())
+        return self.term(kind, value)
+
+    def collection(self):
+        items = []
+        while self.peek()[1] != ')':
+            items.append((yield from self.object()))
+        self.next()
+        head = RDF + 'nil'
+        for item in reversed(items):
+            node = self.fresh()
+            yield node, RDF + 'first', item
+            yield node, RDF + 'rest', head
+            head = node
+        return head
+
+    def term(self, kind, value):
+        if kind == 'iri':
+            return self.iri(value)
+        if kind == 'pname':
+            return self.pname(value)
+        if kind == 'bnode':
+            return value
+        if kind in ('string', 'long'):
+            quote = 3 if kind == 'long' else 1
+            text = unescape(value[quote:-quote])
+            lang = datatype = None
+            if self.peek()[0] == 'lang':
+                lang = self.next()[1][1:].lower()
+            elif self.peek()[0] == 'datatype':
+                self.next()
+                k, v = self.next()
+                datatype = self.term(k, v)
+            return Literal(text, lang, datatype)
+        if kind == 'number':
+            datatype = 'double' if 'e' in value.lower() else 'decimal' if '.' in value else 'integer'
+            return Literal(value, None, XSD + datatype)
+        if kind == 'word' and value in ('true', 'false'):
+            return Literal(value, None, XSD + 'boolean')
+        raise ParseError(f"unexpected {value!r}")
+
+
+def triples(reader):
+    """
+    yield (subject, predicate, object) for every statement of a dump
+    """
+    return Parser(reader).statements()
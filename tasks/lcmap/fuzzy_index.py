@@ -0,0 +1,135 @@
+"""
+Fuzzy index over a vocabulary, with the answers of difflib.get_close_matches()
+
+get_close_matches(word, vocabulary, n, cutoff) runs a SequenceMatcher
+against every word of the vocabulary, for every query.  With thousands
+of queries and a real vocabulary (the Master Metaphor List, MetaNet)
+that is hours.
+
+SequenceMatcher.ratio() is 2*M/T (M matched characters, T the two
+lengths together) and can never be more than
+
+  real_quick_ratio()  2*min(len)/T            (length filter)
+  quick_ratio()       2*(shared characters)/T (character count filter)
+
+so the index keeps the vocabulary sorted by length, with a (words x
+characters) count matrix.  A query only looks at the words of a
+possible length, counts the characters they share with it in one numpy
+step, and computes the real ratio() only for the words whose bound
+still reaches the cutoff, best bounds first, stopping once no bound can
+beat (or tie) the n-th best ratio found.  Ties are broken as
+get_close_matches() breaks them, so the results are the same.
+
+    from fuzzy_index import FuzzyIndex
+    index = FuzzyIndex(all_mml_words)           # any iterable of strings
+    index.close_matches('defence', n=1, cutoff=0.8)   # ['defend']
+    index.best_many(lemmas, cutoff=0.8)         # {lemma: best match or None}
+"""
+import heapq
+from difflib import SequenceMatcher
+
+import numpy as np
+
+
+def _ratio(matches, total):
+    ### as difflib computes it, so that the bounds compare exactly with ratio()
+    return 2.0 * matches / total if total else 1.0
+
+
+def _ratios(matches, totals):
+    ### the same, for arrays (float64 gives the same numbers)
+    matches = np.asarray(matches, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    out = np.ones(len(totals))
+    np.divide(2.0 * matches, totals, out=out, where=totals > 0)
+    return out
+
+
+class FuzzyIndex:
+    """
+    Length-sorted vocabulary and character counts, built once.
+    """
+
+    def __init__(self, words):
+        ### duplicates are kept: get_close_matches() returns them too
+        self.words = sorted(words, key=len)
+        self.lengths = np.array([len(w) for w in self.words], dtype=np.int64)
+        self.alphabet = {c: i for i, c in enumerate(sorted({c for w in self.words for c in w}))}
+        self.counts = np.zeros((len(self.words), len(self.alphabet)), dtype=np.int32)
+        for i, w in enumerate(self.words):
+            for c in w:
+                self.counts[i, self.alphabet[c]] += 1
+        ### the slice of the vocabulary with each length
+        self.sizes = sorted(set(self.lengths.tolist()))
+        self.starts = {n: int(np.searchsorted(self.lengths, n)) for n in self.sizes}
+        self.ends = {n: int(np.searchsorted(self.lengths, n, 'right')) for n in self.sizes}
+
+    def __len__(self):
+        return len(self.words)
+
+    def candidates(self, word, cutoff):
+        """
+        Vocabulary numbers whose quick_ratio() with word reaches cutoff,
+        and those bounds, best first.
+        """
+        la = len(word)
+        ### real_quick_ratio: 2*min(la, lb)/(la + lb) >= cutoff holds for a
+        ### run of lengths around la, i.e. a slice of the sorted vocabulary
+        ok = [lb for lb in self.sizes if _ratio(min(la, lb), la + lb) >= cutoff]
+        if not ok:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        lo, hi = self.starts[ok[0]], self.ends[ok[-1]]
+        lb = self.lengths[lo:hi]
+        ### quick_ratio: characters in common, counted with multiplicity
+        query = dict()
+        for c in word:
+            if c in self.alphabet:
+                query[self.alphabet[c]] = query.get(self.alphabet[c], 0) + 1
+        if query:
+            cols = np.array(list(query), dtype=np.int64)
+            need = np.array(list(query.values()), dtype=np.int32)
+            shared = np.minimum(self.counts[lo:hi, cols], need).sum(axis=1)
+        else:
+            shared = np.zeros(hi - lo, dtype=np.int64)
+        bound = _ratios(shared, lb + la)
+        rows = np.flatnonzero(bound >= cutoff)
+        order = np.argsort(-bound[rows], kind='stable')
+        return rows[order] + lo, bound[rows[order]]
+
+    def close_matches(self, word, n=3, cutoff=0.6):
+        """
+        The same list as difflib.get_close_matches(word, vocabulary, n, cutoff).
+        """
+        if not n > 0:
+            raise ValueError("n must be > 0: %r" % (n,))
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError("cutoff must be in [0.0, 1.0]: %r" % (cutoff,))
+        rows, bound = self.candidates(word, cutoff)
+        result = []
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        for i, b in zip(rows.tolist(), bound.tolist()):
+            ### a tie with the n-th best could still win on the string
+            if len(result) >= n and b < min(result)[0]:
+                break
+            x = self.words[i]
+            s.set_seq1(x)
+            score = s.ratio()
+            if score >= cutoff:
+                result.append((score, x))
+                if len(result) > n:
+                    result = heapq.nlargest(n, result)
+        return [x for score, x in heapq.nlargest(n, result)]
+
+    def best(self, word, cutoff=0.6):
+        """
+        get_close_matches(word, vocabulary, n=1, cutoff)[0], or None.
+        """
+        found = self.close_matches(word, n=1, cutoff=cutoff)
+        return found[0] if found else None
+
+    def best_many(self, words, cutoff=0.6):
+        """
+        best() for many words at once (each distinct word is looked up once).
+        """
+        return {w: self.best(w, cutoff) for w in dict.fromkeys(words)}
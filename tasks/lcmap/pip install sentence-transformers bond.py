@@ -1,45 +1,65 @@
 import pandas as pd
+import hashlib
 import json
 import os 
-from difflib import get_close_matches
+import sqlite3
+import sys
+
+import wn
+
+from fuzzy_index import FuzzyIndex
+from vector_store import HashEmbedder, SentenceTransformerEmbedder, VectorStore, top_k
+
+# shared ChainNet loader and sense key index live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from chainnet import Tropes, iter_content
+from sensekeys import chunked_in_query, connect_ro, load_sensekeys
 
 # --- 1. CONFIGURATION ---
 FILE_TO_PROCESS = r"C:\Users\Mahdal\Desktop\Bond\chainnet_metonymy.json"
 MML_PATH = r"C:\Users\Mahdal\Desktop\Bond\master_metaphor_list.txt"
 
+# "string": fuzzy match the word against the MML words
+# "semantic": embed the glosses and the MML concepts, take the nearest
+MAPPING = "string"
+# local sentence-transformers model (e.g. a saved all-MiniLM-L6-v2);
+# None uses the hashing embedder (no model, for tests)
+MODEL_DIR = r"C:\Users\Mahdal\Desktop\Bond\models\all-MiniLM-L6-v2"
+# wn lexicon for the glosses of the ChainNet senses (None: words only)
+LEXICON = "oewn:2024"
+EMBED_DIR = os.path.join("build", "embeddings")
+TOP_K = 3
+
 # --- 2. DATA LOADING ---
 
 def load_chainnet(filepath):
-    chainnet_entries = []
+    """
+    Stream a ChainNet file into a compact trope store (sense keys kept as
+    is). Every record is kept, duplicates too; a missing wordform is
+    'unknown', a missing sense 'N/A'. There is no sense index here, so no
+    trope is skipped for an unknown key. If the file cannot be read, the
+    store is empty (never partly loaded).
+    """
     if not os.path.exists(filepath):
         print(f"❌ ERROR: File not found: {filepath}")
-        return []
+        return Tropes()
 
     file_name = os.path.basename(filepath).lower()
     default_type = "metonymy" if "metonymy" in file_name else "metaphor"
 
     print(f"   -> Reading file: {os.path.basename(filepath)} (Type: {default_type})")
 
+    chainnet_entries = Tropes(dedup=False, skip_unknown=False)
+    source = os.path.basename(filepath)
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        items = data.get('content', []) if isinstance(data, dict) else data
-        
-        for item in items:
-            lemma = item.get('wordform', 'unknown')
-            sense_id = item.get('from_sense', 'N/A')
-
-            chainnet_entries.append({
-                'lemma': str(lemma).strip().lower(),
-                'type': default_type,
-                'sense_id': sense_id
-            })
-        
+        for item in iter_content(filepath):
+            chainnet_entries.add(default_type, item.get('wordform', 'unknown'),
+                                 item.get('from_sense', 'N/A'), item.get('to_sense', 'N/A'),
+                                 source)
         print(f"   -> Loaded {len(chainnet_entries)} entries.")
-                    
     except Exception as e:
         print(f"   ❌ Error reading JSON: {e}")
+        return Tropes()
 
     return chainnet_entries
 
@@ -66,27 +86,99 @@ def link_metaphors(chainnet_data, mml_data):
         for w in words:
             all_mml_words[w] = cm
 
-    for entry in chainnet_data:
-        lemma = entry['lemma']
+    # Fuzzy index over the MML words, built once; each distinct lemma is
+    # looked up once (same answers as get_close_matches(n=1, cutoff=0.8))
+    index = FuzzyIndex(all_mml_words)
+    lemmas = [str(wordform).strip().lower() for _, wordform, _, _ in chainnet_data]
+    close = index.best_many((l for l in lemmas if l not in all_mml_words), cutoff=0.8)
+
+    for (trope, wordform, sense_id, _), lemma in zip(chainnet_data, lemmas):
         best_match = None
         
         if lemma in all_mml_words:
             best_match = all_mml_words[lemma]
-        else:
-            match = get_close_matches(lemma, list(all_mml_words.keys()), n=1, cutoff=0.8)
-            if match:
-                best_match = all_mml_words[match[0]]
+        elif close[lemma]:
+            best_match = all_mml_words[close[lemma]]
 
         if best_match:
             links.append({
                 'Word': lemma,
-                'Type': entry['type'],
+                'Type': trope,
                 'MML_Concept': best_match,
-                'Sense_ID': entry['sense_id']
+                'Sense_ID': sense_id
             })
             
     return links
 
+def sense_glosses(sense_keys, lexicon):
+    """{sense key: definition} from the wn database (empty if it or the lexicon is not there)."""
+    try:
+        skey = load_sensekeys(lexicon)
+    except (wn.Error, sqlite3.OperationalError) as e:
+        print(f"   ⚠️ No glosses ({e}), embedding the words only.")
+        return {}
+    ids = {skey[k]: k for k in set(sense_keys) if k in skey}
+    glosses = {}
+    conn = connect_ro()
+    try:
+        for sid, definition in chunked_in_query(conn, """SELECT s.id, d.definition FROM senses AS s
+                                                         JOIN definitions AS d ON d.synset_rowid = s.synset_rowid
+                                                         WHERE s.id IN ({marks})""", ids):
+            glosses.setdefault(ids[sid], definition)
+    finally:
+        conn.close()
+    return glosses
+
+def mml_texts(mml_data):
+    """One text per conceptual metaphor: the label and its example words."""
+    return {cm: f"{cm.lower()}: {', '.join(words)}" for cm, words in mml_data.items()}
+
+def link_semantic(chainnet_data, mml_data, embedder, glosses=None, k=TOP_K):
+    """
+    Map each trope to the k nearest conceptual metaphors, comparing the
+    gloss of its metaphorical (target) sense with the MML concepts.
+    Vectors are cached in EMBED_DIR, so only new texts are embedded.
+    """
+    glosses = glosses or {}
+    store = VectorStore(EMBED_DIR, embedder)
+
+    concepts = mml_texts(mml_data)
+    labels = list(concepts)
+    # the key changes with the text, so edited concepts are embedded again
+    concept_keys = [f"mml:{cm}:{hashlib.sha256(concepts[cm].encode('utf-8')).hexdigest()[:12]}"
+                    for cm in labels]
+    concept_vecs = store.embed(concept_keys, [concepts[cm] for cm in labels])
+
+    rows = list(chainnet_data)
+    senses = list(dict.fromkeys(tgt for _, _, _, tgt in rows))
+    words = {tgt: str(w).strip().lower() for _, w, _, tgt in rows}
+    sense_texts = [f"{words[t]}: {glosses[t]}" if t in glosses else words[t] for t in senses]
+    print(f"   -> Embedding {len(senses)} senses and {len(labels)} concepts "
+          f"({len(store)} vectors cached)...")
+    # likewise for the senses: a gloss (or the word) that changes, or
+    # glosses found after a words-only run, give new keys
+    sense_keys = [f"sense:{t}:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}"
+                  for t, text in zip(senses, sense_texts)]
+    sense_vecs = store.embed(sense_keys, sense_texts)
+
+    idx, scores = top_k(sense_vecs, concept_vecs, k)
+    nearest = {t: [(labels[j], float(sc)) for j, sc in zip(idx[i], scores[i])]
+               for i, t in enumerate(senses)}
+
+    links = []
+    for trope, wordform, sense_id, target_id in rows:
+        for rank, (cm, score) in enumerate(nearest[target_id], 1):
+            links.append({
+                'Word': str(wordform).strip().lower(),
+                'Type': trope,
+                'MML_Concept': cm,
+                'Rank': rank,
+                'Score': round(score, 4),
+                'Sense_ID': sense_id,
+                'Target_Sense_ID': target_id
+            })
+    return links
+
 # --- 4. EXECUTION ---
 
 if __name__ == "__main__":
@@ -98,7 +190,12 @@ if __name__ == "__main__":
     if not chainnet:
         print("❌ No data to load.")
     else:
-        results = link_metaphors(chainnet, mml)
+        if MAPPING == "semantic":
+            embedder = SentenceTransformerEmbedder(MODEL_DIR) if MODEL_DIR else HashEmbedder()
+            glosses = sense_glosses([t for _, _, _, t in chainnet], LEXICON) if LEXICON else {}
+            results = link_semantic(chainnet, mml, embedder, glosses)
+        else:
+            results = link_metaphors(chainnet, mml)
         
         if results:
             df = pd.DataFrame(results)
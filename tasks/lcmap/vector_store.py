@@ -0,0 +1,234 @@
+"""
+Local embedding store and nearest-neighbour search for semantic mapping
+
+Texts (ChainNet sense glosses, conceptual metaphor labels with their
+example words) are embedded on the CPU, in batches, by an embedder:
+
+  SentenceTransformerEmbedder  a sentence-transformers model stored in a
+                               local directory (nothing is downloaded)
+  HashEmbedder                 hashed words and character trigrams: no
+                               model, deterministic, for tests
+
+Every embedder has a fingerprint (for a local model, the hash of its
+files), and the vectors are cached per fingerprint:
+
+  DIR/<fingerprint>/keys.txt      one key per row ('sense:can%1:06:00:::<text sha>')
+  DIR/<fingerprint>/vectors.f32   float32 rows, opened with np.memmap
+  DIR/<fingerprint>/meta.json     embedder name and dimension
+
+New rows are appended (vectors first, then keys, so a row only counts
+once its key is written), so only texts that were never embedded with
+this model are embedded again.  Vectors are L2 normalized, and top_k()
+finds the nearest rows by cosine, exactly, in blocks.
+
+    from vector_store import HashEmbedder, VectorStore, top_k
+    store = VectorStore('build/embeddings', HashEmbedder())
+    senses = store.embed(['sense:a', 'sense:b'], ['a gloss', 'another gloss'])
+    labels = store.embed(keys, texts)
+    idx, scores = top_k(senses, labels, k=3)
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from stages import digest_file
+
+BATCH = 64
+WORD = re.compile(r'\w+')
+
+
+def normalize(vectors):
+    """
+    rows scaled to unit length (zero rows stay zero)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class HashEmbedder:
+    """
+    Feature hashing of lower-cased words and character trigrams
+    (with a hash that does not change between runs).
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f'hash-{dim}'
+        self.fingerprint = hashlib.sha256(self.name.encode('utf-8')).hexdigest()
+
+    def features(self, text):
+        words = WORD.findall(text.lower())
+        grams = [w[i:i + 3] for w in (f'#{w}#' for w in words) for i in range(len(w) - 2)]
+        return [f'w:{w}' for w in words] + [f'c:{g}' for g in grams]
+
+    def encode(self, texts, batch_size=BATCH):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for f in self.features(text):
+                h = int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), 'little')
+                out[i, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return normalize(out)
+
+
+class SentenceTransformerEmbedder:
+    """
+    A sentence-transformers model from a local directory, run on the CPU.
+    """
+
+    def __init__(self, model_dir, batch_size=BATCH):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("semantic mapping needs sentence-transformers "
+                              "(pip install sentence-transformers)") from None
+        model_dir = Path(model_dir)
+        if not model_dir.is_dir():
+            raise FileNotFoundError(f"no model directory: {model_dir}")
+        self.model = SentenceTransformer(str(model_dir), device='cpu')
+        self.batch_size = batch_size
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_dir.name
+        self.fingerprint = model_hash(model_dir)
+
+    def encode(self, texts, batch_size=None):
+        vectors = self.model.encode(list(texts), batch_size=batch_size or self.batch_size,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return normalize(vectors)
+
+
+def model_hash(model_dir):
+    """
+    sha256 over the names and contents of every file of a model
+    """
+    h = hashlib.sha256()
+    model_dir = Path(model_dir)
+    for f in sorted(p for p in model_dir.rglob('*') if p.is_file()):
+        h.update(f"{f.relative_to(model_dir).as_posix()}:{digest_file(f)}\0".encode('utf-8'))
+    return h.hexdigest()
+
+
+class VectorStore:
+    """
+    Append-only, memory-mapped cache of the vectors of one embedder.
+    """
+
+    def __init__(self, path, embedder):
+        self.embedder = embedder
+        self.path = Path(path) / embedder.fingerprint[:16]
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = {'embedder': embedder.name, 'fingerprint': embedder.fingerprint,
+                'dim': embedder.dim}
+        meta_path = self.path / 'meta.json'
+        if meta_path.exists():
+            with open(meta_path) as fh:
+                if json.load(fh) != meta:
+                    raise ValueError(f"{self.path} holds vectors of another model")
+        else:
+            with open(meta_path, 'w') as fh:
+                json.dump(meta, fh)
+        self.dim = embedder.dim
+        self.keys = []
+        if (self.path / 'keys.txt').exists():
+            with open(self.path / 'keys.txt', encoding='utf-8') as fh:
+                self.keys = fh.read().split('\n')[:-1]
+        ### drop rows (or keys) left over from an interrupted append
+        vec_path = self.path / 'vectors.f32'
+        size = vec_path.stat().st_size if vec_path.exists() else 0
+        if size != len(self.keys) * 4 * self.dim:
+            rows = size // (4 * self.dim)
+            self.keys = self.keys[:min(rows, len(self.keys))]
+            self._truncate()
+        self.index = {k: i for i, k in enumerate(self.keys)}
+        self._matrix = None
+
+    def _truncate(self):
+        with open(self.path / 'vectors.f32', 'ab') as fh:
+            fh.truncate(len(self.keys) * 4 * self.dim)
+        with open(self.path / 'keys.txt', 'w', encoding='utf-8') as fh:
+            fh.write(''.join(f'{k}\n' for k in self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    @property
+    def matrix(self):
+        """
+        all the rows, memory-mapped
+        """
+        if self._matrix is None or len(self._matrix) != len(self.keys):
+            if not self.keys:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            self._matrix = np.memmap(self.path / 'vectors.f32', dtype=np.float32,
+                                     mode='r', shape=(len(self.keys), self.dim))
+        return self._matrix
+
+    def add(self, keys, vectors):
+        """
+        append rows for new keys
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(self.path / 'vectors.f32', 'ab') as fh:
+            fh.write(vectors.tobytes())
+        with open(self.path / 'keys.txt', 'a', encoding='utf-8') as fh:
+            fh.write(''.join(f'{k}\n' for k in keys))
+        for k in keys:
+            self.index[k] = len(self.keys)
+            self.keys.append(k)
+
+    def embed(self, keys, texts, batch_size=BATCH):
+        """
+        the vectors of keys (a new array, in order), embedding the texts
+        of the keys not in the store yet, batch by batch
+        """
+        todo = dict()
+        for k, t in zip(keys, texts):
+            if '\n' in k:
+                raise ValueError(f"key with a newline: {k!r}")
+            if k not in self.index:
+                todo.setdefault(k, t)
+        todo = list(todo.items())
+        for i in range(0, len(todo), batch_size):
+            chunk = todo[i:i + batch_size]
+            self.add([k for k, _ in chunk],
+                     self.embedder.encode([t for _, t in chunk], batch_size))
+        rows = np.fromiter((self.index[k] for k in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(self.matrix[rows])
+
+
+def top_k(queries, items, k=5, block=4096):
+    """
+    indices and cosines of the k nearest items of each query (rows of
+    unit vectors), best first, by exact search in blocks of queries
+
+    Returns:
+        (len(queries) x k) int array, (len(queries) x k) float array
+        (k is cut to len(items))
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    items = np.asarray(items, dtype=np.float32)
+    k = min(k, len(items))
+    idx = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    if k == 0:
+        return idx, scores
+    for lo in range(0, len(queries), block):
+        sims = queries[lo:lo + block] @ items.T
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k] if k < len(items) else \
+            np.tile(np.arange(len(items)), (len(sims), 1))
+        best = np.take_along_axis(sims, part, axis=1)
+        ### best first; ties by item number
+        order = np.lexsort((part, -best), axis=1)
+        idx[lo:lo + block] = np.take_along_axis(part, order, axis=1)
+        scores[lo:lo + block] = np.take_along_axis(best, order, axis=1)
+    return idx, scores
@@ -1,10 +1,138 @@
 import wn
+import argparse
 import json
 import os
 import sys
 from collections import Counter
 
 sys.path.append(os.getcwd())
+### shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from bootstrap import ensure
+from sensekeys import chunked_in_query, connect_ro, index_path, lexicon_fingerprint
+from stages import digest_file
+
+LEXICON_ID = 'omw-en:1.4.cn'
+CORELEX_FILE = "synset_to_type.json"
+### bump if the way sense ids are mapped to CoreLex types changes
+CORELEX_INDEX_VERSION = 2
+TROPES = ('metaphor', 'metonym')
+### shifts written (and their definitions looked up) per batch
+BATCH = 500
+
+
+def find_corelex_file():
+    """
+    the CoreLex map in the usual places, and only then anywhere below
+    the current directory
+    """
+    for f in [CORELEX_FILE, os.path.join("data", CORELEX_FILE)]:
+        if os.path.exists(f):
+            return f
+    for root, _, files in os.walk("."):
+        if CORELEX_FILE in files:
+            return os.path.join(root, CORELEX_FILE)
+    return None
+
+
+def build_corelex_index(lexicon_id, corelex, conn):
+    """
+    sense id -> CoreLex type for every noun sense of the lexicon
+
+    A sense is the n-th noun sense that ewn.senses(lemma) gives for the
+    lemma of its entry, and its type is that of the CoreLex key
+    lemma.n.NN (or lemma.n.N).  The lookup is wn's: entries with the
+    lemma as any of their forms, or as the normalized form of one
+    ('turkey' also finds Turkey, 'Turkey' only finds Turkey), and the
+    entries indexed with those; senses ordered by part of speech and
+    rank in the entry (ties in database order)
+    """
+    by_form = dict()
+    for entry, form, normalized in conn.execute(
+            """SELECT f.entry_rowid, f.form, f.normalized_form FROM forms AS f
+               JOIN lexicons AS l ON l.rowid = f.lexicon_rowid
+               WHERE l.specifier = ?""", (lexicon_id,)):
+        by_form.setdefault(form, set()).add(entry)
+        if normalized is not None and normalized != form:
+            by_form.setdefault(normalized, set()).add(entry)
+    ### entries grouped under one index lemma are found together
+    indexed, groups = dict(), dict()
+    for entry, lemma in conn.execute(
+            """SELECT x.entry_rowid, x.lemma FROM entry_index AS x
+               JOIN entries AS e ON e.rowid = x.entry_rowid
+               JOIN lexicons AS l ON l.rowid = e.lexicon_rowid
+               WHERE l.specifier = ?""", (lexicon_id,)):
+        indexed[entry] = lemma
+        groups.setdefault(lemma, set()).add(entry)
+
+    senses = dict()
+    lemmas = dict()
+    entry_of = dict()
+    order = dict()
+    for entry, lemma, sense_id in conn.execute(
+            """SELECT e.rowid, f.form, s.id
+               FROM senses AS s
+               JOIN entries AS e ON e.rowid = s.entry_rowid
+               JOIN forms AS f ON f.entry_rowid = e.rowid AND f.rank = 0
+               JOIN synsets AS ss ON ss.rowid = s.synset_rowid
+               JOIN lexicons AS l ON l.rowid = s.lexicon_rowid
+               WHERE l.specifier = ? AND ss.pos = 'n'
+               ORDER BY e.pos, s.entry_rank, s.rowid""", (lexicon_id,)):
+        senses.setdefault(entry, []).append(sense_id)
+        lemmas[entry] = lemma
+        entry_of[sense_id] = entry
+        ### the order ewn.senses() merges the entries of a lemma in
+        order[sense_id] = len(order)
+
+    by_lemma = dict()
+    for entry, lemma in lemmas.items():
+        by_lemma.setdefault(lemma, set()).add(entry)
+    index = dict()
+    for lemma, own in by_lemma.items():
+        entries = set(by_form.get(lemma, ()))
+        entries |= {e for x in entries if x in indexed for e in groups[indexed[x]]}
+        found = sorted((sid for e in entries for sid in senses.get(e, ())), key=order.get)
+        for position, sense_id in enumerate(found, 1):
+            if entry_of[sense_id] not in own:
+                ### a sense of another entry ('Turkey' among 'turkey')
+                continue
+            ctype = corelex.get(f"{lemma}.n.{position:02d}") or corelex.get(f"{lemma}.n.{position}")
+            if ctype:
+                index[sense_id] = ctype
+    return index
+
+
+def load_corelex_index(lexicon_id, corelex_path):
+    """
+    the sense id -> CoreLex type index, built once and stored next to
+    the wn database; rebuilt if the lexicon or the CoreLex map changes
+    """
+    path = index_path(lexicon_id, 'corelex.json')
+    key = {'lexicon': lexicon_fingerprint(lexicon_id),
+           'corelex': digest_file(corelex_path),
+           'version': CORELEX_INDEX_VERSION}
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            return cached['index']
+
+    with open(corelex_path, 'r', encoding='utf-8') as f:
+        corelex = json.load(f)
+    print(f"Loaded CoreLex map with {len(corelex)} entries")
+
+    conn = connect_ro()
+    try:
+        index = build_corelex_index(lexicon_id, corelex, conn)
+    finally:
+        conn.close()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'index': index}, f)
+    os.replace(tmp, path)
+    return index
+
 
 def setup_resources():
     print("Preparing components")
@@ -22,73 +150,118 @@ def setup_resources():
             print(f"Found lexicon file: {f}")
             break
 
-    lexicon_id = 'omw-en:1.4.cn'
+    lexicon_id = LEXICON_ID
 
+    ### installed already, or restored from a prebuilt snapshot of the
+    ### database, and only then parsed from the LMF file
     try:
-        ewn = wn.Wordnet(lexicon_id)
-        print(f"Lexicon '{lexicon_id}' loaded")
+        how = ensure(lexicon_id, lmf=[custom_wn_file] if custom_wn_file else [],
+                     download=False)
     except wn.Error:
-        if custom_wn_file:
-            print("Installing lexicon")
-            wn.add(custom_wn_file)
-            ewn = wn.Wordnet(lexicon_id)
-            print("Lexicon installed")
-        else:
-            print("Lexicon missing and file not found")
-            sys.exit(1)
-
-    corelex_file = "synset_to_type.json"
-    found_path = None
+        print("Lexicon missing and file not found")
+        sys.exit(1)
+    ewn = wn.Wordnet(lexicon_id)
+    if how in ('snapshot', 'lmf'):
+        print("Lexicon installed")
+    else:
+        print(f"Lexicon '{lexicon_id}' loaded")
 
-    for root, _, files in os.walk("."):
-        if corelex_file in files:
-            found_path = os.path.join(root, corelex_file)
-            break
+    found_path = find_corelex_file()
 
     if not found_path:
         print("Could not find 'synset_to_type.json'")
         sys.exit(1)
 
-    with open(found_path, 'r', encoding='utf-8') as f:
-        corelex = json.load(f)
-
-    print(f"Loaded CoreLex map with {len(corelex)} entries")
-    return ewn, corelex
-
-
-def get_corelex_type(word, sense_id, noun_senses, corelex_map):
-    try:
-        index = next((i for i, s in enumerate(noun_senses) if s.id == sense_id), -1)
-        if index == -1:
-            return None
-
-        key_v1 = f"{word}.n.{index+1:02d}"
-        key_v2 = f"{word}.n.{index+1}"
+    types = load_corelex_index(lexicon_id, found_path)
 
-        return corelex_map.get(key_v1) or corelex_map.get(key_v2)
-
-    except:
-        return None
+    print(f"CoreLex types for {len(types)} senses")
+    return ewn, types
 
 
 def get_noun_senses(ewn, lemma):
     return [s for s in ewn.senses(lemma) if s.synset().pos == 'n']
 
 
-def resolve_target_type(ewn, target_sense, corelex):
-    tgt_lemma = target_sense.word().lemma()
-    tgt_senses = get_noun_senses(ewn, tgt_lemma)
-
-    return get_corelex_type(
-        tgt_lemma,
-        target_sense.id,
-        tgt_senses,
-        corelex
-    )
+def definitions(conn, sense_ids):
+    """
+    {sense id: definition of its synset}
+    """
+    return dict(chunked_in_query(conn, """SELECT s.id, d.definition FROM senses AS s
+                                          JOIN definitions AS d ON d.synset_rowid = s.synset_rowid
+                                          WHERE s.id IN ({marks})""", sense_ids))
+
+
+def iter_tropes(conn, lexicon_id, tropes=TROPES):
+    """
+    yield (relation, word, source sense id, target sense id) for every
+    metaphor/metonym relation in the lexicon
+    """
+    marks = ','.join('?' * len(tropes))
+    yield from conn.execute(f"""SELECT rt.type, f.form, src.id, tgt.id
+                                FROM sense_relations AS r
+                                JOIN relation_types AS rt ON rt.rowid = r.type_rowid
+                                JOIN lexicons AS l ON l.rowid = r.lexicon_rowid
+                                JOIN senses AS src ON src.rowid = r.source_rowid
+                                JOIN senses AS tgt ON tgt.rowid = r.target_rowid
+                                JOIN forms AS f ON f.entry_rowid = src.entry_rowid AND f.rank = 0
+                                WHERE l.specifier = ? AND rt.type IN ({marks})
+                                ORDER BY r.rowid""", (lexicon_id, *tropes))
+
+
+def write_shifts(conn, batch, out, detected_shifts):
+    defs = definitions(conn, [sid for row in batch for sid in row[2:4]])
+    for relation, word, src_id, tgt_id, src_type, tgt_type in batch:
+        print(relation, word, src_id, tgt_id, src_type, tgt_type,
+              defs.get(src_id, "Definition unavailable"),
+              defs.get(tgt_id, "Definition unavailable"),
+              sep='\t', file=out)
+        detected_shifts[(relation, src_type, tgt_type)] += 1
+
+
+def scan_lexicon(types, out_path, lexicon_id=LEXICON_ID):
+    """
+    check every metaphor/metonym relation in the lexicon for a change
+    of CoreLex type, writing the shifts to out_path as they are found
+    returns a Counter of (relation, source type, target type)
+    """
+    conn = connect_ro()
+    detected_shifts = Counter()
+    n = 0
+    try:
+        with open(out_path, 'w', encoding='utf-8') as out:
+            print("relation", "word", "src", "tgt", "src_type", "tgt_type",
+                  "src_def", "tgt_def", sep='\t', file=out)
+            batch = []
+            for relation, word, src_id, tgt_id in iter_tropes(conn, lexicon_id):
+                n += 1
+                src_type, tgt_type = types.get(src_id), types.get(tgt_id)
+                if src_type and tgt_type and src_type != tgt_type:
+                    batch.append((relation, word, src_id, tgt_id, src_type, tgt_type))
+                if len(batch) >= BATCH:
+                    write_shifts(conn, batch, out, detected_shifts)
+                    batch = []
+            write_shifts(conn, batch, out, detected_shifts)
+    finally:
+        conn.close()
+    print(f"Checked {n} relations, wrote {sum(detected_shifts.values())} shifts to {out_path}")
+    return detected_shifts
 
 
 def main():
-    ewn, corelex = setup_resources()
+    parser = argparse.ArgumentParser(description="CoreLex type shifts in ChainNet tropes")
+    parser.add_argument('--all', metavar='OUT', nargs='?', const='shifts.tsv',
+                        help="scan every metaphor and metonym in the lexicon, "
+                             "writing the shifts to OUT (default shifts.tsv)")
+    args = parser.parse_args()
+
+    ewn, types = setup_resources()
+
+    if args.all:
+        counts = scan_lexicon(types, args.all)
+        print("Analysis")
+        for (relation, src, tgt), count in counts.most_common(10):
+            print(f"{relation}\t{src} -> {tgt}: {count}")
+        return
 
     target_words = [
         'chestnut', 'pig', 'star', 'mouth', 'head', 'face', 'arm',
@@ -108,10 +281,10 @@ def main():
             if 'metaphor' not in relations:
                 continue
 
-            src_type = get_corelex_type(word, sense.id, noun_senses, corelex)
+            src_type = types.get(sense.id)
 
             for target_sense in relations['metaphor']:
-                tgt_type = resolve_target_type(ewn, target_sense, corelex)
+                tgt_type = types.get(target_sense.id)
 
                 if src_type and tgt_type and src_type != tgt_type:
                     print(f"{word}\t{src_type}\t{tgt_type}")
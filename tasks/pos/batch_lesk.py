@@ -0,0 +1,187 @@
+"""
+Batched Lesk word sense disambiguation with cached gloss signatures.
+
+nltk.wsd.lesk(context, word) scores each synset of the word by how many
+of the words of its definition (definition().split()) are in the
+context, and takes the best one (the first of the best, in the order
+wordnet.synsets(word) gives them).  Called once per marked word, it
+re-tokenizes the sentence each time and splits the same definitions
+again and again.
+
+Here the signature of every synset is split once, kept as a sparse
+(synsets x words) matrix in CSR arrays and saved in build/lesk-signatures/
+(rebuilt if the WordNet version changes).  A context is tokenized once,
+and the overlaps of all the candidate synsets of all the marked words
+are counted in one vectorized step.  The choices are the same as lesk()'s.
+
+    from batch_lesk import load_lesk
+    wsd = load_lesk()
+    wsd.sense_keys(text, ['light', 'understand'])   # [sense key or None, ...]
+"""
+import json
+import os
+import shutil
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from nltk.corpus import wordnet
+from nltk.tokenize import word_tokenize
+
+# shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from taxonomy import csr_ranges
+
+SIGNATURE_VERSION = 1
+DEFAULT_PATH = Path('build') / 'lesk-signatures'
+# the caches are bounded: run_extension.py workers see the whole lexicon
+CANDIDATE_CACHE = 1 << 16
+CHOSEN_CACHE = 1 << 14
+
+
+class Lesk:
+    """
+    Lesk disambiguation over precomputed signatures, with (bounded)
+    caches for the candidate synsets of each word and for the sense keys
+    of each (context, words).
+    """
+
+    def __init__(self, names, vocab, indptr, terms, meta, wordnet=wordnet):
+        self.names = names
+        self.synset_index = {name: i for i, name in enumerate(names)}
+        self.vocab = vocab
+        self.term_index = {t: i for i, t in enumerate(vocab)}
+        self.indptr = indptr
+        self.terms = terms
+        self.meta = meta
+        self.wn = wordnet
+        self._candidates = lru_cache(maxsize=CANDIDATE_CACHE)(self._find_candidates)
+        self._chosen = lru_cache(maxsize=CHOSEN_CACHE)(self._choose)
+
+    def _find_candidates(self, word):
+        synsets = self.wn.synsets(word)
+        rows = np.array([self.synset_index[s.name()] for s in synsets], dtype=np.int64)
+        return synsets, rows
+
+    def candidates(self, word):
+        """
+        The synsets lesk() would consider for a word, and their rows.
+        """
+        return self._candidates(word)
+
+    def overlaps(self, context, rows):
+        """
+        Number of signature words of each row that are in the context
+        (a set of tokens).
+        """
+        ids = [self.term_index[t] for t in context if t in self.term_index]
+        mark = np.zeros(len(self.vocab), dtype=np.int64)
+        mark[ids] = 1
+        lens = self.indptr[rows + 1] - self.indptr[rows]
+        owner = np.repeat(np.arange(len(rows)), lens)
+        return np.bincount(owner, weights=mark[self.terms[csr_ranges(self.indptr, rows)]],
+                           minlength=len(rows)).astype(np.int64)
+
+    def disambiguate(self, tokens, words):
+        """
+        The synset lesk(tokens, word) picks for each word (None if the
+        word has no synsets).
+        """
+        context = set(tokens)
+        todo = list(dict.fromkeys(words))
+        cands = [self.candidates(w) for w in todo]
+        rows = np.concatenate([r for _, r in cands] + [np.zeros(0, dtype=np.int64)])
+        scores = self.overlaps(context, rows)
+        chosen = dict()
+        start = 0
+        for word, (synsets, r) in zip(todo, cands):
+            if len(r):
+                chosen[word] = synsets[int(np.argmax(scores[start:start + len(r)]))]
+            else:
+                chosen[word] = None
+            start += len(r)
+        return [chosen[w] for w in words]
+
+    def sense_keys(self, text, words):
+        """
+        Sense key of each word in the context of text, as
+        sense_key_from_context() gives it: the key of the lemma with that
+        name in the synset lesk() picks, or None.
+        """
+        return list(self._chosen(text, tuple(words)))
+
+    def _choose(self, text, words):
+        keys = []
+        for word, synset in zip(words, self.disambiguate(word_tokenize(text), list(words))):
+            key = None
+            if synset is not None:
+                for lemma_ in synset.lemmas():
+                    if lemma_.name() == word:
+                        key = lemma_.key()
+                        break
+            keys.append(key)
+        return tuple(keys)
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        np.save(tmp / 'indptr.npy', self.indptr)
+        np.save(tmp / 'terms.npy', self.terms)
+        for name in ('names', 'vocab'):
+            with open(tmp / f'{name}.json', 'w', encoding='utf-8') as fh:
+                json.dump(getattr(self, name), fh)
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump(self.meta, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, wordnet=wordnet):
+        path = Path(path)
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        lists = dict()
+        for name in ('names', 'vocab'):
+            with open(path / f'{name}.json', encoding='utf-8') as fh:
+                lists[name] = json.load(fh)
+        return cls(lists['names'], lists['vocab'],
+                   np.load(path / 'indptr.npy', mmap_mode='r'),
+                   np.load(path / 'terms.npy', mmap_mode='r'), meta, wordnet)
+
+
+def signature_meta(wordnet):
+    return {'wordnet': wordnet.get_version(), 'version': SIGNATURE_VERSION}
+
+
+def build_lesk(wordnet=wordnet):
+    """
+    Split every definition once into its signature (a set of words).
+    """
+    names, vocab = [], dict()
+    indptr, terms = [0], []
+    for synset in wordnet.all_synsets():
+        names.append(synset.name())
+        signature = {vocab.setdefault(t, len(vocab)) for t in synset.definition().split()}
+        terms.extend(sorted(signature))
+        indptr.append(len(terms))
+    return Lesk(names, list(vocab), np.array(indptr, dtype=np.int64),
+                np.array(terms, dtype=np.int32), signature_meta(wordnet), wordnet)
+
+
+@lru_cache(maxsize=None)
+def load_lesk(wordnet=wordnet, path=DEFAULT_PATH):
+    """
+    Return the Lesk signatures saved at path, building them first if
+    they are missing or were made from another WordNet (once per process).
+    """
+    path = Path(path)
+    if (path / 'meta.json').exists():
+        wsd = Lesk.load(path, wordnet)
+        if wsd.meta == signature_meta(wordnet):
+            return wsd
+    print(f"Building the Lesk signatures in {path}")
+    build_lesk(wordnet).save(path)
+    return Lesk.load(path, wordnet)
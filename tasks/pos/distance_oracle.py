@@ -0,0 +1,321 @@
+"""
+Landmark distance oracle for the WordNet hypernym/hyponym graph.
+
+For questions like "how far is every sense of A from every sense of B",
+over whole vocabularies, even a fast search per pair (synset_distance.py)
+is too slow.  So we precompute, once, the exact distance from a few
+landmark synsets to every synset (one breadth-first search per landmark)
+and keep it as a (landmarks x synsets) uint8 matrix on disk, opened with
+mmap.  For any pair u, v and any landmark l, by the triangle inequality
+
+    |d(l, u) - d(l, v)|  <=  d(u, v)  <=  d(l, u) + d(l, v)
+
+so the tightest of these over all landmarks bounds the distance, for a
+whole array of pairs in a few numpy operations.  When the bounds meet
+the answer is exact; otherwise query(..., exact=True) runs a search on
+the compiled graph, limited to the upper bound.  Synsets in different
+connected components are infinitely far apart (no path).
+
+The graph is the one sense_key_distance() searches: each synset is
+linked to its hypernyms() and hyponyms() (taken as undirected).
+Landmarks are picked farthest first (each new one as far as possible
+from the ones already chosen), from components of at least
+min_component synsets, largest components first.
+
+    from distance_oracle import load_oracle
+    oracle = load_oracle()                  # built and saved on first use
+    res = oracle.query(src, tgt)            # synsets or names (dog.n.01)
+    res['lower'], res['upper'], res['exact']
+    oracle.word_distances('light', 'understanding')
+"""
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+from nltk.corpus import wordnet
+
+# shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from taxonomy import csr_ranges, to_csr
+
+ORACLE_VERSION = 1
+N_LANDMARKS = 32
+MIN_COMPONENT = 100
+# distance to synsets a landmark cannot reach
+FAR = 255
+DEFAULT_PATH = Path('build') / 'distance-oracle'
+
+
+def read_graph(wordnet):
+    """
+    Synset names and the undirected hypernym/hyponym graph as CSR arrays.
+    """
+    synsets = list(wordnet.all_synsets())
+    names = [s.name() for s in synsets]
+    index = {name: i for i, name in enumerate(names)}
+    src, tgt = [], []
+    for i, s in enumerate(synsets):
+        for n in s.hypernyms() + s.hyponyms():
+            j = index[n.name()]
+            if i != j:
+                src += [i, j]
+                tgt += [j, i]
+    indptr, adj = to_csr(len(names), np.array(src, dtype=np.int32),
+                         np.array(tgt, dtype=np.int32))
+    return names, indptr, adj
+
+
+def bfs(indptr, adj, start):
+    """
+    Distances from start to every synset (FAR where unreachable).
+    """
+    dist = np.full(len(indptr) - 1, FAR, dtype=np.int32)
+    dist[start] = 0
+    frontier = np.array([start], dtype=np.int64)
+    depth = 0
+    while len(frontier):
+        depth += 1
+        nb = adj[csr_ranges(indptr, frontier)]
+        nb = np.unique(nb[dist[nb] == FAR])
+        dist[nb] = min(depth, FAR - 1)
+        frontier = nb
+    return dist
+
+
+def components(indptr, adj):
+    """
+    Connected component label of every synset (the smallest member).
+    """
+    n = len(indptr) - 1
+    label = np.arange(n)
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    while True:
+        new = label.copy()
+        np.minimum.at(new, src, label[adj])
+        new = new[new]
+        if np.array_equal(new, label):
+            return label
+        label = new
+
+
+def pick_landmarks(indptr, adj, comp, n_landmarks, min_component):
+    """
+    Farthest-first landmarks, and the distances from each of them.
+    """
+    n = len(indptr) - 1
+    size = np.bincount(comp, minlength=n)[comp]
+    degree = np.diff(indptr)
+    eligible = size >= min_component
+    nearest = np.full(n, np.iinfo(np.int32).max, dtype=np.int64)
+    landmarks, rows = [], []
+    for _ in range(n_landmarks):
+        if not eligible.any():
+            break
+        # farthest from the landmarks so far (unreached components
+        # first, the largest of them), then the best connected
+        order = np.lexsort((degree, size, nearest))
+        order = order[eligible[order]]
+        best = order[-1]
+        dist = bfs(indptr, adj, best)
+        landmarks.append(best)
+        rows.append(dist)
+        reached = dist < FAR
+        nearest[reached] = np.minimum(nearest[reached], dist[reached])
+        eligible[best] = False
+    matrix = np.array(rows, dtype=np.uint8).reshape(len(rows), n)
+    return np.array(landmarks, dtype=np.int64), matrix
+
+
+class DistanceOracle:
+    """
+    Distance bounds between any two synsets, from the landmark matrix.
+    """
+
+    def __init__(self, names, arrays, meta, wordnet=wordnet):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.indptr = arrays['indptr']
+        self.adj = arrays['adj']
+        self.comp = arrays['comp']
+        self.landmarks = arrays['landmarks']
+        self.dist = arrays['dist']
+        self.meta = meta
+        self.wn = wordnet
+
+    def __len__(self):
+        return len(self.names)
+
+    def ordinal(self, synset):
+        """
+        Synset number for a synset or synset name (-1 if unknown).
+        """
+        name = synset if isinstance(synset, str) else synset.name()
+        return self.index.get(name, -1)
+
+    def ordinals(self, synsets):
+        return np.fromiter((self.ordinal(s) for s in synsets), dtype=np.int64)
+
+    def bounds(self, src, tgt):
+        """
+        Lower and upper bounds on the distances of arrays of synset
+        numbers, as float arrays (inf: no path).
+        """
+        src = np.asarray(src, dtype=np.int64)
+        tgt = np.asarray(tgt, dtype=np.int64)
+        du = np.asarray(self.dist[:, src], dtype=np.int64)
+        dv = np.asarray(self.dist[:, tgt], dtype=np.int64)
+        both = (du < FAR) & (dv < FAR)
+        lower = np.where(both, np.abs(du - dv), 0).max(axis=0, initial=0).astype(float)
+        upper = np.where(both, du + dv, np.inf).min(axis=0, initial=np.inf)
+        same = src == tgt
+        apart = np.asarray(self.comp)[src] != np.asarray(self.comp)[tgt]
+        lower[same], upper[same] = 0, 0
+        lower[apart], upper[apart] = np.inf, np.inf
+        return lower, upper
+
+    def neighbours(self, i):
+        return self.adj[self.indptr[i]:self.indptr[i + 1]]
+
+    def search(self, u, v, limit=None):
+        """
+        Exact distance by a bidirectional search on the compiled graph
+        (None if more than limit apart).
+        """
+        if u == v:
+            return 0
+        dists = ({u: 0}, {v: 0})
+        frontiers = ([u], [v])
+        depth = [0, 0]
+        while frontiers[0] and frontiers[1]:
+            if limit is not None and depth[0] + depth[1] >= limit:
+                break
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            dist, other = dists[side], dists[1 - side]
+            depth[side] += 1
+            best = None
+            nxt = []
+            for current in frontiers[side]:
+                for n in self.neighbours(current).tolist():
+                    if n in dist:
+                        continue
+                    dist[n] = depth[side]
+                    nxt.append(n)
+                    if n in other and (best is None or depth[side] + other[n] < best):
+                        best = depth[side] + other[n]
+            if best is not None:
+                return best
+            frontiers = (nxt, frontiers[1]) if side == 0 else (frontiers[0], nxt)
+        return None
+
+    def query(self, src, tgt, exact=False):
+        """
+        Distances for parallel lists of synsets (or names, or numbers).
+
+        Returns a dict of arrays:
+            lower, upper  bounds from the landmarks (inf: no path)
+            exact         True where the bounds meet
+            gap           upper - lower (0 when exact)
+            distance      the distance where known (inf: no path, nan:
+                          unknown); with exact=True, the bounds that do
+                          not meet are resolved by a search
+        """
+        src = np.asarray(src if _numeric(src) else self.ordinals(src), dtype=np.int64)
+        tgt = np.asarray(tgt if _numeric(tgt) else self.ordinals(tgt), dtype=np.int64)
+        if (src < 0).any() or (tgt < 0).any():
+            raise ValueError("synset not in the oracle")
+        lower, upper = self.bounds(src, tgt)
+        tight = lower == upper
+        distance = np.where(tight, upper, np.nan)
+        if exact:
+            for k in np.flatnonzero(~tight):
+                limit = None if np.isinf(upper[k]) else int(upper[k])
+                d = self.search(int(src[k]), int(tgt[k]), limit)
+                distance[k] = np.inf if d is None else d
+        with np.errstate(invalid='ignore'):
+            gap = np.where(tight, 0, upper - lower)
+        return {'lower': lower, 'upper': upper, 'exact': tight,
+                'gap': gap, 'distance': distance}
+
+    def word_distances(self, word1, word2, pos=None, exact=True):
+        """
+        Distances between every synset of word1 and every synset of word2.
+
+        Returns (synsets of word1, synsets of word2, dict of
+        len(word1 synsets) x len(word2 synsets) arrays as in query())
+        """
+        ss1 = self.wn.synsets(word1, pos=pos)
+        ss2 = self.wn.synsets(word2, pos=pos)
+        a = np.repeat(self.ordinals(ss1), len(ss2))
+        b = np.tile(self.ordinals(ss2), len(ss1))
+        res = self.query(a, b, exact=exact)
+        shape = (len(ss1), len(ss2))
+        return ss1, ss2, {k: v.reshape(shape) for k, v in res.items()}
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in ('indptr', 'adj', 'comp', 'landmarks', 'dist'):
+            np.save(tmp / f'{name}.npy', getattr(self, name))
+        with open(tmp / 'names.txt', 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(self.names))
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump(self.meta, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, wordnet=wordnet):
+        path = Path(path)
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        with open(path / 'names.txt', encoding='utf-8') as fh:
+            names = fh.read().split('\n')
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r')
+                  for name in ('indptr', 'adj', 'comp', 'landmarks', 'dist')}
+        return cls(names, arrays, meta, wordnet)
+
+
+def _numeric(x):
+    return isinstance(x, np.ndarray) and x.dtype.kind in 'iu'
+
+
+def oracle_meta(wordnet, n_landmarks, min_component):
+    return {'wordnet': wordnet.get_version(), 'version': ORACLE_VERSION,
+            'n_landmarks': n_landmarks, 'min_component': min_component}
+
+
+def build_oracle(wordnet=wordnet, n_landmarks=N_LANDMARKS, min_component=MIN_COMPONENT):
+    """
+    Compile the graph and the landmark distances (a minute or so).
+    """
+    names, indptr, adj = read_graph(wordnet)
+    comp = components(indptr, adj)
+    landmarks, dist = pick_landmarks(indptr, adj, comp, n_landmarks, min_component)
+    meta = oracle_meta(wordnet, n_landmarks, min_component)
+    meta['synsets'] = len(names)
+    arrays = {'indptr': indptr, 'adj': adj, 'comp': comp,
+              'landmarks': landmarks, 'dist': dist}
+    return DistanceOracle(names, arrays, meta, wordnet)
+
+
+def load_oracle(wordnet=wordnet, n_landmarks=N_LANDMARKS, min_component=MIN_COMPONENT,
+                path=DEFAULT_PATH):
+    """
+    Return the DistanceOracle saved at path, building it first if it is
+    missing or was made from another WordNet or with other settings.
+    """
+    path = Path(path)
+    want = oracle_meta(wordnet, n_landmarks, min_component)
+    if (path / 'meta.json').exists():
+        oracle = DistanceOracle.load(path, wordnet)
+        if all(oracle.meta.get(k) == v for k, v in want.items()):
+            return oracle
+    print(f"Building the distance oracle ({n_landmarks} landmarks) in {path}")
+    oracle = build_oracle(wordnet, n_landmarks, min_component)
+    oracle.save(path)
+    return DistanceOracle.load(path, wordnet)
@@ -1,9 +1,12 @@
 import re
 import nltk
-from nltk.tokenize import word_tokenize
-from nltk.wsd import lesk
+import numpy as np
 from nltk.corpus import wordnet as wn
 
+from gloss_index import load_gloss_index
+from highlighter import Highlighter
+from batch_lesk import load_lesk
+
 # Uncomment these lines to download required NLTK data on first run
 # nltk.download('punkt')
 # nltk.download('wordnet')
@@ -41,48 +44,22 @@ def highlight(text, word_list):
     
     Returns:
     str: The text with highlighted words.
-    """
-    import re
-
-    # sort the word list by length descending to find the longest match first
-    word_list = sorted(word_list, key=len, reverse=True)
-
-    def replace_word(word):
-        for w in word_list:
-            if w.lower() in word.lower():
-                # replace only the first occurrence and preserve original casing
-                start = word.lower().find(w.lower())
-                end = start + len(w)
-                return word[:start] + f'<<{word[start:end]}>>' + word[end:]
-        return word
 
-    # tokenize text into words and punctuation
-    tokens = re.findall(r'\w+|\W+', text)
-    highlighted = [replace_word(token) if token.isalnum() else token for token in tokens]
-
-    return ''.join(highlighted)
+    To highlight many texts with the same words, compile them once with
+    Highlighter(word_list) (highlighter.py) and reuse it.
+    """
+    return Highlighter(word_list).highlight(text)
 
 
-def sense_key_from_context(text, word):
+def sense_key_from_context(text, word, wsd=None):
     """
     Returns the WordNet sense key for a given word (lemma name) in the context of a sentence.
-    """
-    # get most probable synset (meaning) based on context
-    synset = lesk(word_tokenize(text), word)
-    if not synset:
-        return None
-
-    matched_lemma = None
 
-    for lemma_ in synset.lemmas():
-        if lemma_.name() == word:
-            matched_lemma = lemma_
-            break
-
-    if matched_lemma:
-        return matched_lemma.key()
-    else:
-        return None
+    The most probable synset is the one NLTK's lesk() picks, found with
+    the cached signatures in batch_lesk.py.
+    """
+    wsd = wsd or load_lesk(wn)
+    return wsd.sense_keys(text, [word])[0]
 
 
 def sense_key_from_marked_words(text, pattern=r'<<(.+?)>>'):
@@ -94,11 +71,11 @@ def sense_key_from_marked_words(text, pattern=r'<<(.+?)>>'):
     :return: List of sense keys (None if a sense is not found)
     """
     marked_words = re.findall(pattern, text)
-    sense_keys = [sense_key_from_context(text, word) for word in marked_words]
-    return sense_keys
+    # one tokenization of the text for all the words
+    return load_lesk(wn).sense_keys(text, marked_words)
 
 
-def extend_metaphor(metaphor_word, source_word):
+def extend_metaphor(metaphor_word, source_word, index=None, wsd=None):
     """
     Returns matches between the lexical forms of a metaphor word and the source word
     in the definitions and examples of synsets.
@@ -108,7 +85,13 @@ def extend_metaphor(metaphor_word, source_word):
         (word, pos, 'definition/example match', highlighted_text, sense_key),
         ...
     ]
+
+    The glosses that mention a source form are looked up in the gloss
+    index (gloss_index.py), and the source senses are estimated with
+    batched Lesk (batch_lesk.py); both are built on first use.
     """
+    index = index or load_gloss_index(wn)
+    wsd = wsd or load_lesk(wn)
 
     metaphoric_words = word_related_forms(metaphor_word)
     source_words = word_related_forms(source_word)
@@ -121,6 +104,10 @@ def extend_metaphor(metaphor_word, source_word):
     )
 
     matches = set()
+    highlighter = Highlighter(source_words)
+
+    # docs (definitions and examples) that may contain a source form
+    candidates = index.candidates(source_words)
 
     for metaphoric_w in metaphoric_words:
         metaphor_synsets = wn.synsets(metaphoric_w) # dává všechny významy daného slova
@@ -144,29 +131,26 @@ def extend_metaphor(metaphor_word, source_word):
                 if meta_lem.name() == metaphoric_w:
                     metaphor_sense_key = meta_lem.key() # sense_key = jedinečný identifikátor konkrétního významu daného lemma
 
-                    for source_w in source_words:
-                        if source_w in meta_definition:
+                    # only the glosses of this synset that the index says may mention a source form
+                    docs = np.intersect1d(index.synset_docs(syn), candidates)
 
-                            highlighted_sentence = highlight(meta_definition, source_words)
-                            source_sense_key = tuple(sense_key_from_marked_words(highlighted_sentence))
+                    for doc in docs:
+                        gloss = int(index.doc_gloss[doc])
+                        text = meta_definition if gloss < 0 else meta_examples[gloss]
+                        if not any(source_w in text for source_w in source_words):
+                            continue
 
-                            # here we want to connet metaphor_sense_key (metaphor lemma + metaphor synset) with 
-                            # with estimated source_sense_key (source lemma + estimated source synset)
-                            matches.add(
-                                (metaphoric_w, meta_pos, "definition match", metaphor_sense_key,  highlighted_sentence, source_sense_key)
-                            )
+                        # here we want to connet metaphor_sense_key (metaphor lemma + metaphor synset) with 
+                        # with estimated source_sense_key (source lemma + estimated source synset)
+                        spans = highlighter.spans(text)
+                        highlighted_sentence = highlighter.highlight(text, spans)
+                        source_sense_key = tuple(wsd.sense_keys(highlighted_sentence,
+                                                                [span.text for span in spans]))
 
-                        for ex in meta_examples:
-                            if source_w in ex:
-
-                            # here we want to connet metaphor_sense_key (metaphor lemma + metaphor synset) with 
-                            # with estimated source_sense_key (source lemma + estimated source synset)
-                                highlighted_sentence = highlight(ex, source_words)
-                                source_sense_key = tuple(sense_key_from_marked_words(highlighted_sentence))
-
-                                matches.add(
-                                    (metaphoric_w, meta_pos, "example match", metaphor_sense_key, highlighted_sentence, source_sense_key)
-                                )
+                        match_type = "definition match" if gloss < 0 else "example match"
+                        matches.add(
+                            (metaphoric_w, meta_pos, match_type, metaphor_sense_key, highlighted_sentence, source_sense_key)
+                        )
 
     return sorted(matches)
 
@@ -192,9 +176,12 @@ def main():
         ("death", "end")
     ]
 
+    index = load_gloss_index(wn)
+    wsd = load_lesk(wn)
+
     for metaphor_word, source_word in word_pairs:
         print(f"\n⚫ Analysis: {metaphor_word} & {source_word}")
-        extensions = extend_metaphor(metaphor_word, source_word)
+        extensions = extend_metaphor(metaphor_word, source_word, index, wsd)
 
         if extensions:
             for metaphoric_w, pos, match_type, metaphor_sense_key, sentence, source_sense_key in extensions:
@@ -4,6 +4,11 @@ import toml
 from delphin import tdl, predicate
 import wn
 import sys, re
+import os
+
+### shared helpers live with the wordnet task
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wordnet'))
+from topics import lexfile_topics, load_topics
 
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -27,6 +32,9 @@ def load_verbs(pos, vpath, topic):
 topic = load_verbs('v', 'verbs.tsv', topic)
 topic = load_verbs('n', 'nouns.tsv', topic)
 
+### the topic of every synset, worked out once (and cached next to wn.db)
+topics = load_topics(en, topic, lexfile_topics(tml))
+
 def print_top (pos, topic, root):
     """
     show the top hierarchy
@@ -92,31 +100,14 @@ def print_top (pos, topic, root):
 
 #quit()    
 
-def get_topic(synset, tml=tml, topic=topic):
+def get_topic(synset, topics=topics):
     """
     return the TLA of the topic of a synset
-    for verb or noun, use hypernyms 
+    for verb or noun, the deepest topic anchor at or above it
     for the rest use lexicographer files
+    (looked up in the precomputed topic index, see topics.py)
     """
-    pos = synset.pos
-    top_abv = 'UNKNOWN'
-    candidates = []
-    if pos in 'vn':
-        ancestors = synset.hypernym_paths()
-        if ancestors == []: # no hypernym
-            top_abv =  topic[synset.id][1]
-        else:
-            for a in ancestors:
-                for ss in a:
-                #print (ancestors[0])
-                    if ss.id in topic:
-                        candidates.append(ss.id)
-            candidates.sort(key = lambda x: topic[x][0])
-            top_abv =  topic[candidates[-1]][1]
-    else:
-        top = synset.lexfile()
-        top_abv = tml[top.split('.')[0]][top.split('.')[1]]['abv']
-    return top_abv
+    return topics.get(synset)
 
 print(f"The topic for sense one of dog is: {get_topic(en.synsets('dog')[0])}")
 print(f"The topic for sense one of illuminate is: {get_topic(en.synsets('illuminate')[0])}")
@@ -0,0 +1,254 @@
+"""
+Inverted index over the definitions and examples of WordNet synsets.
+
+extend_metaphor() asks, for every form of the metaphor word, which of
+its synsets have a definition or example that contains a form of the
+source word.  Testing every form against every gloss is fine for a
+dozen hand-picked pairs but not for all of ChainNet, so we index all the
+glosses once:
+
+  docs       one per definition and per example: the synset (a line in
+             names.txt) and which gloss (-1 for the definition, k for
+             example k)
+  tokens     lower-cased \\w+ runs, with the docs and the positions
+             (token number in the doc) they occur at, as CSR arrays
+  lemmas     the same for the base form (wordnet.morphy) of the tokens
+
+stored in build/gloss-index/ (rebuilt if the WordNet version changes).
+
+extend_metaphor() tests `form in text`, which also matches inside
+longer words ('understand' in 'misunderstanding').  candidates(forms)
+gives every doc that could contain one of the forms that way (docs with
+a token containing each \\w+ part of the form), found through the token
+vocabulary, so only those docs need the substring test.
+
+    from gloss_index import load_gloss_index
+    index = load_gloss_index()
+    index.docs_with_token('light')           # doc numbers
+    index.docs_with_lemma('understand')
+    docs = index.candidates({'understand', 'understanding'})
+    index.synset_docs(synset)                 # the docs of one synset
+"""
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+from nltk.corpus import wordnet
+
+INDEX_VERSION = 1
+DEFAULT_PATH = Path('build') / 'gloss-index'
+TOKEN = re.compile(r'\w+')
+ARRAYS = ('doc_synset', 'doc_gloss', 'tok_indptr', 'tok_doc', 'tok_pos',
+          'lem_indptr', 'lem_doc', 'lem_pos')
+
+
+def tokenize(text):
+    """
+    Lower-cased \\w+ runs of a text.
+    """
+    return TOKEN.findall(text.lower())
+
+
+def postings(n_terms, term, doc, pos):
+    """
+    CSR arrays (indptr, docs, positions) of (term, doc, position) triples,
+    sorted by term, then doc, then position.
+    """
+    term = np.array(term, dtype=np.int32)
+    doc = np.array(doc, dtype=np.int32)
+    pos = np.array(pos, dtype=np.int32)
+    order = np.lexsort((pos, doc, term))
+    indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term, minlength=n_terms), out=indptr[1:])
+    return indptr, doc[order], pos[order]
+
+
+class GlossIndex:
+    """
+    Token and lemma postings for every definition and example.
+    """
+
+    def __init__(self, names, tokens, lemmas, arrays, meta, wordnet=wordnet):
+        self.names = names
+        self.synset_index = {name: i for i, name in enumerate(names)}
+        self.tokens = tokens
+        self.token_index = {t: i for i, t in enumerate(tokens)}
+        self.lemmas = lemmas
+        self.lemma_index = {t: i for i, t in enumerate(lemmas)}
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.wn = wordnet
+        self._first_doc = None
+        self._containing = dict()
+
+    def __len__(self):
+        return len(self.doc_synset)
+
+    @staticmethod
+    def _postings(indptr, docs, pos, i, positions=False):
+        if i is None:
+            empty = np.zeros(0, dtype=np.int32)
+            return (empty, empty) if positions else empty
+        lo, hi = indptr[i], indptr[i + 1]
+        if positions:
+            return docs[lo:hi], pos[lo:hi]
+        return np.unique(docs[lo:hi])
+
+    def docs_with_token(self, token, positions=False):
+        """
+        Docs with the (lower-cased) token: doc numbers, or with
+        positions=True parallel arrays of docs and token positions.
+        """
+        return self._postings(self.tok_indptr, self.tok_doc, self.tok_pos,
+                              self.token_index.get(token.lower()), positions)
+
+    def docs_with_lemma(self, lemma, positions=False):
+        """
+        Docs with a token whose base form is lemma.
+        """
+        return self._postings(self.lem_indptr, self.lem_doc, self.lem_pos,
+                              self.lemma_index.get(lemma.lower()), positions)
+
+    def _docs_containing(self, part):
+        """
+        Docs with a token that has part as a substring (memoised).
+        """
+        docs = self._containing.get(part)
+        if docs is None:
+            hits = [i for i, t in enumerate(self.tokens) if part in t]
+            if hits:
+                docs = np.unique(np.concatenate(
+                    [self.tok_doc[self.tok_indptr[i]:self.tok_indptr[i + 1]] for i in hits]))
+            else:
+                docs = np.zeros(0, dtype=np.int32)
+            self._containing[part] = docs
+        return docs
+
+    def candidates(self, forms):
+        """
+        Doc numbers whose text may contain one of the forms as a
+        substring (a superset: check with `form in text`).
+        Lemma names are taken as they are ('_' is part of a token), so
+        'warm_up' only matches where the text has 'warm_up'.
+        """
+        found = []
+        for form in forms:
+            parts = tokenize(form)
+            docs = None
+            for part in parts:
+                d = self._docs_containing(part)
+                docs = d if docs is None else np.intersect1d(docs, d, assume_unique=True)
+                if not len(docs):
+                    break
+            if docs is not None and len(docs):
+                found.append(docs)
+        if not found:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate(found))
+
+    def synset_docs(self, synset):
+        """
+        Doc numbers of a synset (or synset name): its definition, then
+        its examples.
+        """
+        name = synset if isinstance(synset, str) else synset.name()
+        i = self.synset_index.get(name)
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        if self._first_doc is None:
+            self._first_doc = np.searchsorted(self.doc_synset, np.arange(len(self.names) + 1))
+        return np.arange(self._first_doc[i], self._first_doc[i + 1])
+
+    def doc_text(self, doc, synset=None):
+        """
+        The text of a doc (from WordNet, not stored in the index).
+        """
+        synset = synset or self.wn.synset(self.names[self.doc_synset[doc]])
+        gloss = int(self.doc_gloss[doc])
+        return synset.definition() if gloss < 0 else synset.examples()[gloss]
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(tmp / f'{name}.npy', getattr(self, name))
+        for name in ('names', 'tokens', 'lemmas'):
+            with open(tmp / f'{name}.txt', 'w', encoding='utf-8') as fh:
+                fh.write('\n'.join(getattr(self, name)))
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump(self.meta, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, wordnet=wordnet):
+        path = Path(path)
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        lists = dict()
+        for name in ('names', 'tokens', 'lemmas'):
+            with open(path / f'{name}.txt', encoding='utf-8') as fh:
+                text = fh.read()
+            lists[name] = text.split('\n') if text else []
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in ARRAYS}
+        return cls(lists['names'], lists['tokens'], lists['lemmas'], arrays, meta, wordnet)
+
+
+def index_meta(wordnet):
+    return {'wordnet': wordnet.get_version(), 'version': INDEX_VERSION}
+
+
+def build_gloss_index(wordnet=wordnet):
+    """
+    Tokenize every definition and example once (a minute or so).
+    """
+    names = []
+    doc_synset, doc_gloss = [], []
+    tokens, lemmas, base = dict(), dict(), dict()
+    tok_rows = ([], [], [])
+    lem_rows = ([], [], [])
+    for s, synset in enumerate(wordnet.all_synsets()):
+        names.append(synset.name())
+        for gloss, text in enumerate([synset.definition()] + synset.examples()):
+            d = len(doc_synset)
+            doc_synset.append(s)
+            doc_gloss.append(gloss - 1)
+            for p, tok in enumerate(tokenize(text)):
+                t = tokens.setdefault(tok, len(tokens))
+                tok_rows[0].append(t)
+                tok_rows[1].append(d)
+                tok_rows[2].append(p)
+                if tok not in base:
+                    base[tok] = wordnet.morphy(tok) or tok
+                lm = lemmas.setdefault(base[tok], len(lemmas))
+                lem_rows[0].append(lm)
+                lem_rows[1].append(d)
+                lem_rows[2].append(p)
+    tok_indptr, tok_doc, tok_pos = postings(len(tokens), *tok_rows)
+    lem_indptr, lem_doc, lem_pos = postings(len(lemmas), *lem_rows)
+    arrays = {'doc_synset': np.array(doc_synset, dtype=np.int32),
+              'doc_gloss': np.array(doc_gloss, dtype=np.int16),
+              'tok_indptr': tok_indptr, 'tok_doc': tok_doc, 'tok_pos': tok_pos,
+              'lem_indptr': lem_indptr, 'lem_doc': lem_doc, 'lem_pos': lem_pos}
+    return GlossIndex(names, list(tokens), list(lemmas), arrays, index_meta(wordnet), wordnet)
+
+
+def load_gloss_index(wordnet=wordnet, path=DEFAULT_PATH):
+    """
+    Return the GlossIndex saved at path, building it first if it is
+    missing or was made from another WordNet.
+    """
+    path = Path(path)
+    if (path / 'meta.json').exists():
+        index = GlossIndex.load(path, wordnet)
+        if index.meta == index_meta(wordnet):
+            return index
+    print(f"Building the gloss index in {path}")
+    build_gloss_index(wordnet).save(path)
+    return GlossIndex.load(path, wordnet)
@@ -0,0 +1,124 @@
+"""
+Multi-pattern highlighter (Aho-Corasick).
+
+highlight() in extend_metaphor used to try every related form against
+every word of a gloss.  Here the forms are compiled once into an
+Aho-Corasick automaton, and each text is matched in a single pass over
+its characters, whatever the number of forms.
+
+The matching rules are those of highlight():
+
+  * only alphanumeric words (\\w+ runs for which str.isalnum() is true)
+    are looked at, and a form must fall inside one word
+  * matching ignores case
+  * in each word, the longest form found wins (the first given among
+    forms of the same length), at its first occurrence in the word
+  * at most one span per word
+
+so forms with a space, hyphen or underscore (warm_up) never match.
+
+    from highlighter import Highlighter
+    hl = Highlighter(source_forms)
+    for span in hl.spans(text):
+        span.start, span.end, span.text, span.form
+    hl.highlight(text)        # the same string highlight() gave
+"""
+import re
+from collections import namedtuple
+
+WORDS = re.compile(r'\w+|\W+')
+
+Span = namedtuple('Span', 'start end text form')
+
+
+class Highlighter:
+    """
+    Compiled matcher for one set of forms, reusable across texts.
+    """
+
+    def __init__(self, forms):
+        # same order as highlight(): longest first, ties in the given order
+        self.forms = sorted(forms, key=len, reverse=True)
+        self.goto = [dict()]
+        self.fail = [0]
+        # (rank of form, length) of the forms that end in each state
+        self.out = [[]]
+        for rank, form in enumerate(self.forms):
+            pattern = form.lower()
+            if not pattern or not pattern.isalnum():
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append(dict())
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append((rank, len(pattern)))
+        self._link()
+
+    def _link(self):
+        """
+        Failure links, breadth first; each state also gets the outputs of
+        the state its failure link points to.
+        """
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def match_word(self, word):
+        """
+        (start, end, rank) of the form highlighted in one word, or None.
+        """
+        best = None
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, ch in enumerate(word.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for rank, length in out[state]:
+                # lower rank wins; the first end of a form is its first start
+                if best is None or rank < best[2]:
+                    best = (i + 1 - length, i + 1, rank)
+        return best
+
+    def spans(self, text):
+        """
+        The highlighted spans of a text, in order.
+        """
+        found = []
+        offset = 0
+        for token in WORDS.findall(text):
+            if token.isalnum():
+                m = self.match_word(token)
+                if m is not None:
+                    start, end, rank = m
+                    found.append(Span(offset + start, offset + end,
+                                      token[start:end], self.forms[rank]))
+            offset += len(token)
+        return found
+
+    def highlight(self, text, spans=None):
+        """
+        The text with the spans marked as <<...>>.
+        """
+        spans = self.spans(text) if spans is None else spans
+        parts = []
+        last = 0
+        for span in spans:
+            parts.append(text[last:span.start])
+            parts.append(f'<<{text[span.start:span.end]}>>')
+            last = span.end
+        parts.append(text[last:])
+        return ''.join(parts)
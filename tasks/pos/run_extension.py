@@ -0,0 +1,194 @@
+"""
+Run extend_metaphor() over many (metaphor word, source word) pairs, in
+parallel, with checkpoints.
+
+The pairs come from a TSV file (metaphor word, source word per line) or
+from a ChainNet metaphor file: for each metaphor there, the word is
+paired with each of the other lemmas of its metaphorical (to_sense)
+synset, e.g. light / understanding.
+
+The pairs are cut into shards of --shard-size pairs, and the shards are
+shared out over a pool of processes.  Each finished shard is written to
+
+    OUT/shards/shard-00012.tsv         the matches, one row each
+    OUT/shards/shard-00012.timing.tsv  seconds and matches for each pair
+
+(the .tsv is renamed into place last, so its presence means the shard
+is done).  Run the same command again after an interruption and only
+the missing shards are done.  OUT/plan.json records the pairs and the
+shard size; a different list of pairs needs a different OUT (or
+--restart).
+
+    python run_extension.py --chainnet ../../example/chainnet_metaphor.json --workers 8
+    python run_extension.py --pairs pairs.tsv --out build/extension-pairs
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+# shared helpers live with the wordnet task
+sys.path.append(str(HERE.parent / 'wordnet'))
+from chainnet import iter_content
+from pools import pool_context
+
+COLUMNS = ['metaphor_word', 'source_word', 'form', 'pos', 'match_type',
+           'metaphor_sense_key', 'text', 'source_sense_keys']
+
+_worker = dict()
+
+
+def load_extension():
+    """
+    Import extend_metaphor 5.py (its name is not a module name).
+    """
+    spec = importlib.util.spec_from_file_location('extend_metaphor', HERE / 'extend_metaphor 5.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_pairs(path):
+    """
+    (metaphor word, source word) pairs from a TSV file.
+    """
+    with open(path, encoding='utf-8') as fh:
+        return [tuple(row[:2]) for row in csv.reader(fh, delimiter='\t')
+                if len(row) >= 2 and not row[0].startswith('#')]
+
+
+def chainnet_pairs(path, wordnet):
+    """
+    (word, other lemma of the metaphorical sense) for every metaphor in
+    a ChainNet file, without duplicates, in file order.
+    """
+    pairs = dict()
+    for e in iter_content(path):
+        try:
+            synset = wordnet.lemma_from_key(e['to_sense']).synset()
+        except Exception:
+            continue
+        word = e['wordform']
+        for lemma in synset.lemma_names():
+            if lemma.lower() != word.lower():
+                pairs[(word, lemma)] = None
+    return list(pairs)
+
+
+def _init_worker():
+    ext = load_extension()
+    _worker['ext'] = ext
+    _worker['index'] = ext.load_gloss_index(ext.wn)
+    _worker['wsd'] = ext.load_lesk(ext.wn)
+
+
+def shard_path(out, k):
+    return Path(out) / 'shards' / f'shard-{k:05d}.tsv'
+
+
+def run_shard(job):
+    """
+    Extend every pair of one shard and write its rows and timings.
+    """
+    k, pairs, out = job
+    ext = _worker['ext']
+    path = shard_path(out, k)
+    timing = path.with_name(f'shard-{k:05d}.timing.tsv')
+    tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    rows, times = [], []
+    for metaphor_word, source_word in pairs:
+        start = time.perf_counter()
+        # extend_metaphor() prints the forms it uses: keep workers quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            matches = ext.extend_metaphor(metaphor_word, source_word,
+                                          _worker['index'], _worker['wsd'])
+        times.append((metaphor_word, source_word, time.perf_counter() - start, len(matches)))
+        for form, pos, match_type, sense_key, text, source_keys in matches:
+            rows.append((metaphor_word, source_word, form, pos, match_type, sense_key,
+                         text, ','.join(s for s in source_keys if s)))
+    with open(tmp, 'w', encoding='utf-8', newline='') as fh:
+        w = csv.writer(fh, delimiter='\t')
+        w.writerow(['metaphor_word', 'source_word', 'seconds', 'matches'])
+        w.writerows((m, s, f'{t:.3f}', n) for m, s, t, n in times)
+    os.replace(tmp, timing)
+    with open(tmp, 'w', encoding='utf-8', newline='') as fh:
+        w = csv.writer(fh, delimiter='\t')
+        w.writerow(COLUMNS)
+        w.writerows(rows)
+    os.replace(tmp, path)
+    return k, len(pairs), len(rows), sum(t for _, _, t, _ in times)
+
+
+def plan(out, pairs, shard_size, restart=False):
+    """
+    Check (or write) OUT/plan.json; returns the shards still to do.
+    """
+    out = Path(out)
+    digest = hashlib.sha256(json.dumps(pairs).encode('utf-8')).hexdigest()
+    want = {'pairs': len(pairs), 'digest': digest, 'shard_size': shard_size}
+    path = out / 'plan.json'
+    if restart and out.exists():
+        shutil.rmtree(out)
+    if path.exists():
+        with open(path) as fh:
+            have = json.load(fh)
+        if have != want:
+            sys.exit(f"{out} holds a run over other pairs or shard size: "
+                     f"use another --out, or --restart")
+    else:
+        (out / 'shards').mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as fh:
+            json.dump(want, fh)
+    shards = [pairs[i:i + shard_size] for i in range(0, len(pairs), shard_size)]
+    return [(k, shard, str(out)) for k, shard in enumerate(shards)
+            if not shard_path(out, k).exists()], len(shards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--pairs', help="TSV file of metaphor word, source word")
+    source.add_argument('--chainnet', help="ChainNet metaphor file (chainnet_metaphor.json)")
+    parser.add_argument('--out', default='build/extension', help="output directory")
+    parser.add_argument('--shard-size', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument('--restart', action='store_true', help="throw away earlier results in OUT")
+    args = parser.parse_args()
+
+    ext = load_extension()
+    pairs = read_pairs(args.pairs) if args.pairs else chainnet_pairs(args.chainnet, ext.wn)
+    todo, n_shards = plan(args.out, pairs, args.shard_size, args.restart)
+    print(f"{len(pairs)} pairs in {n_shards} shards, {n_shards - len(todo)} done already")
+    if not todo:
+        return
+
+    # build the indexes once here, so that the workers only load them
+    ext.load_gloss_index(ext.wn)
+    ext.load_lesk(ext.wn)
+
+    workers = args.workers or os.cpu_count() or 1
+    done = n_shards - len(todo)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(workers, len(todo)), mp_context=pool_context(),
+                             initializer=_init_worker) as pool:
+        futures = [pool.submit(run_shard, job) for job in todo]
+        for future in as_completed(futures):
+            k, n_pairs, n_rows, seconds = future.result()
+            done += 1
+            print(f"shard {k}: {n_pairs} pairs, {n_rows} matches, {seconds:.1f}s "
+                  f"({done}/{n_shards}, {time.perf_counter() - start:.0f}s so far)")
+    print(f"Results in {Path(args.out) / 'shards'}")
+
+
+if __name__ == "__main__":
+    main()
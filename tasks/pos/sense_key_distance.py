@@ -1,41 +1,24 @@
 from nltk.corpus import wordnet as wn
-from collections import deque
 
+from synset_distance import SynsetDistance
 
-def sense_key_distance(sense_key1, sense_key2):
+# longest path worth looking for (None: search the whole graph)
+MAX_DEPTH = None
+
+engine = SynsetDistance(wn, max_depth=MAX_DEPTH)
+
+
+def sense_key_distance(sense_key1, sense_key2, engine=engine):
     """
     Computes the distance between two WordNet sense keys in the synset hierarchy.
-    Searches both upwards (hypernyms) and downwards (hyponyms) using BFS.
+    Searches both upwards (hypernyms) and downwards (hyponyms), from both
+    ends at once (see synset_distance.py).
     
     Returns:
         int: number of steps between synsets
-        None: if no path exists
+        None: if no path exists (within the engine's max_depth)
     """
-    # convert sense keys to synsets
-    synset1 = wn.lemma_from_key(sense_key1).synset()
-    synset2 = wn.lemma_from_key(sense_key2).synset()
-
-    # if they are the same synset, distance is 0
-    if synset1 == synset2:
-        return 0
-
-    visited = {synset1}  # keep track of visited synsets
-    queue = deque([(synset1, 0)])  # BFS queue: (synset, distance)
-
-    while queue:
-        current, distance = queue.popleft()
-
-        # neighbors: hypernyms (up) and hyponyms (down)
-        neighbors = current.hypernyms() + current.hyponyms()
-        for neighbor in neighbors:
-            if neighbor == synset2:
-                return distance + 1  # found target, return distance
-            if neighbor not in visited:
-                visited.add(neighbor)
-                queue.append((neighbor, distance + 1))
-
-    # no path found
-    return None
+    return engine.distance(sense_key1, sense_key2)[0]
 
 metaphor_pairs = [
 ('clarity%1:07:01::', 'understand%2:31:00::'),
@@ -119,11 +102,11 @@ for key1, key2 in metaphor_pairs:
     print()"""
 
 
-for metaphor, source in metaphor_pairs:
-    dist = sense_key_distance(metaphor, source)
+results = engine.batch(metaphor_pairs)
 
-    # finds POS
-    pos_m = wn.lemma_from_key(metaphor).synset().pos()
-    pos_s = wn.lemma_from_key(source).synset().pos()
+for (metaphor, source), (dist, path) in zip(metaphor_pairs, results):
+    # finds POS (the synsets are cached by the engine)
+    pos_m = engine.synset(metaphor).pos()
+    pos_s = engine.synset(source).pos()
 
     print(f"{metaphor} ({pos_m}) & {source} ({pos_s}) / distance: {dist}")
\ No newline at end of file
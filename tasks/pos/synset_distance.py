@@ -0,0 +1,163 @@
+"""
+Distances between WordNet synsets over hypernym and hyponym links.
+
+The graph is the one sense_key_distance() has always used: each synset
+is linked to its hypernyms() and hyponyms() (NLTK WordNet), and the
+distance is the number of links on a shortest path between them.
+
+Instead of a breadth-first search from one side until the other synset
+turns up (which, for unrelated synsets, visits most of WordNet), the
+search grows from both ends, one whole level at a time, always on the
+side with the smaller frontier, and stops as soon as the two meet.  With
+max_depth set, pairs further apart than that are given up on early.
+
+Sense keys, synsets and neighbours are cached in the engine (in
+bounded LRU caches), so a batch of pairs that share senses resolves
+each of them only once.
+
+    from synset_distance import SynsetDistance
+    engine = SynsetDistance(max_depth=12)
+    for dist, path in engine.batch(pairs):
+        ...
+"""
+from functools import lru_cache
+
+from nltk.corpus import wordnet
+
+### entries kept in the sense key and neighbour caches
+SYNSET_CACHE = 1 << 16
+NEIGHBOUR_CACHE = 1 << 16
+
+
+class SynsetDistance:
+    """
+    Shortest hypernym/hyponym distances, with (bounded) caches shared
+    across calls.
+
+    wordnet:   the WordNet reader (NLTK's by default)
+    max_depth: longest path to look for (None: no limit)
+    """
+
+    def __init__(self, wordnet=wordnet, max_depth=None):
+        self.wn = wordnet
+        self.max_depth = max_depth
+        self._synset = lru_cache(maxsize=SYNSET_CACHE)(self._find_synset)
+        self._neighbours = lru_cache(maxsize=NEIGHBOUR_CACHE)(self._find_neighbours)
+
+    def _find_synset(self, sense_key):
+        try:
+            return self.wn.lemma_from_key(sense_key).synset()
+        except Exception:
+            print(f"Unknown sense key: {sense_key}")
+            return None
+
+    @staticmethod
+    def _find_neighbours(synset):
+        return synset.hypernyms() + synset.hyponyms()
+
+    def synset(self, sense_key):
+        """
+        The synset of a sense key (None if the key is not in WordNet).
+        """
+        return self._synset(sense_key)
+
+    def neighbours(self, synset):
+        """
+        Hypernyms and hyponyms of a synset.
+        """
+        return self._neighbours(synset)
+
+    def search(self, synset1, synset2):
+        """
+        Bidirectional breadth-first search.
+
+        Returns:
+            (distance, path): the number of links and the synsets on a
+            shortest path from synset1 to synset2, both ends included
+            (None, None): if there is no path within max_depth
+        """
+        if synset1 == synset2:
+            return 0, [synset1]
+        # parent[s] is the next synset towards the start of that side
+        parents = ({synset1: None}, {synset2: None})
+        dists = ({synset1: 0}, {synset2: 0})
+        frontiers = ([synset1], [synset2])
+        depth = [0, 0]
+        limit = self.max_depth
+        while frontiers[0] and frontiers[1]:
+            if limit is not None and depth[0] + depth[1] >= limit:
+                break
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            parent, dist, other = parents[side], dists[side], dists[1 - side]
+            depth[side] += 1
+            best = None
+            nxt = []
+            for current in frontiers[side]:
+                for neighbour in self.neighbours(current):
+                    if neighbour in dist:
+                        continue
+                    parent[neighbour] = current
+                    dist[neighbour] = depth[side]
+                    nxt.append(neighbour)
+                    if neighbour in other:
+                        total = depth[side] + other[neighbour]
+                        if best is None or total < best[0]:
+                            best = (total, neighbour)
+            if best is not None:
+                return best[0], self._path(parents, best[1])
+            frontiers = (nxt, frontiers[1]) if side == 0 else (frontiers[0], nxt)
+        return None, None
+
+    @staticmethod
+    def _path(parents, meet):
+        """
+        Join the two halves of the path at the synset where they meet.
+        """
+        path = []
+        s = meet
+        while s is not None:
+            path.append(s)
+            s = parents[0][s]
+        path.reverse()
+        s = parents[1][meet]
+        while s is not None:
+            path.append(s)
+            s = parents[1][s]
+        return path
+
+    def distance(self, sense_key1, sense_key2):
+        """
+        Distance and path between the synsets of two sense keys.
+        """
+        synset1 = self.synset(sense_key1)
+        synset2 = self.synset(sense_key2)
+        if synset1 is None or synset2 is None:
+            return None, None
+        return self.search(synset1, synset2)
+
+    def batch(self, pairs):
+        """
+        Distances and paths for a list of (sense key, sense key) pairs.
+
+        Returns:
+            list of (distance, path), in the order of the pairs
+        """
+        results = dict()
+        out = []
+        for key1, key2 in pairs:
+            synset1 = self.synset(key1)
+            synset2 = self.synset(key2)
+            if synset1 is None or synset2 is None:
+                out.append((None, None))
+                continue
+            # the graph is undirected: reuse the other direction too
+            found = results.get((synset1, synset2))
+            if found is None:
+                rev = results.get((synset2, synset1))
+                if rev is not None:
+                    found = (rev[0], rev[1] and rev[1][::-1])
+                else:
+                    found = self.search(synset1, synset2)
+                results[(synset1, synset2)] = found
+            out.append(found)
+        return out
@@ -0,0 +1,143 @@
+"""
+Mine affix patterns between the lemmas of trope source and target synsets
+
+For each trope and each wordnet we have the lemmas of the source synset
+(S) and of the target synset (T), from the ILI lemma table
+(ililemmas.py).  Lemmas are compared after Unicode normalisation (NFKC
+and case folding), and a link is one of
+
+  kind    example (src, tgt)      link
+  suffix  dancer   dance          wn+r     source = target + affix
+          dance    dancer         wn-r     target = source + affix
+  prefix  unhappy  happy          wn+un-   source = affix + target
+          happy    unhappy        wn-un-   target = affix + source
+  zero    Essen    essen          wn=      different, but the same after
+                                           normalisation
+
+Rather than compare every lemma in S with every lemma in T, the lemmas
+of each side go into a prefix and a suffix index (a trie flattened into
+a hash table: each (trope, wordnet, normalised lemma) is a key), and
+each lemma of the other side looks up its own prefixes and suffixes.
+So the work is linear in the length of the lemmas, and all the tropes
+in all the wordnets are done in one pass.
+
+The suffix links are the ones example-deriv.py used to find with
+startswith(); lemmas that differ only in case or Unicode form count as
+zero derivation, and identical lemmas (as example-deriv.py) are ignored.
+"""
+import unicodedata
+from collections import defaultdict as dd
+
+import pandas as pd
+
+KINDS = ('suffix', 'prefix', 'zero')
+
+
+def normalize(lemma):
+    """
+    the form lemmas are compared in: NFKC, case folded
+    """
+    return unicodedata.normalize('NFKC', lemma).casefold()
+
+
+def link_label(wn_id, kind, direction, affix):
+    """
+    the link column of deriv-links.tsv, e.g. omw-de+ung, omw-de-ge-, omw-de=
+    """
+    if kind == 'zero':
+        return f"{wn_id}="
+    if kind == 'prefix':
+        return f"{wn_id}{direction}{affix}-"
+    return f"{wn_id}{direction}{affix}"
+
+
+def lemma_index(side, norm):
+    """
+    {(trope, wordnet, normalised lemma): [(rank, lemma code), ...]}
+    for one side (a DataFrame from IliLemmas.members())
+    """
+    index = dd(list)
+    for item, wn_code, rank, lemma in side.itertuples(index=False):
+        index[(item, wn_code, norm[lemma])].append((rank, lemma))
+    return index
+
+
+def _matches(side, other, norm, min_stem, longer):
+    """
+    look up the prefixes and suffixes of every lemma of one side in the
+    index of the other side
+    yields (item, wn, kind, direction, affix, rank, lemma, other rank, other lemma),
+    with the longer lemma first
+    """
+    direction = '+' if longer == 'src' else '-'
+    for item, wn_code, rank, lemma in side.itertuples(index=False):
+        s = norm[lemma]
+        for k in range(max(min_stem, 1), len(s)):
+            ### s = stem + affix
+            for o_rank, o_lemma in other.get((item, wn_code, s[:k]), ()):
+                yield item, wn_code, 'suffix', direction, s[k:], rank, lemma, o_rank, o_lemma
+        for k in range(max(min_stem, 1), len(s)):
+            ### s = affix + stem
+            for o_rank, o_lemma in other.get((item, wn_code, s[-k:]), ()):
+                yield item, wn_code, 'prefix', direction, s[:-k], rank, lemma, o_rank, o_lemma
+
+
+def affix_links(table, src_ilis, tgt_ilis, min_stem=1):
+    """
+    all the affix links between the source and target lemmas, for
+    parallel lists of source and target ILIs, in every wordnet of the
+    table
+
+    min_stem: the shorter lemma must be at least this long
+
+    returns a DataFrame with columns pair (index into the lists), wn,
+    kind, link, affix, src_lemma and tgt_lemma, ordered by pair,
+    wordnet, source and target lemma rank
+    """
+    src = table.members(src_ilis)
+    tgt = table.members(tgt_ilis)
+    used = set(src['lemma']) | set(tgt['lemma'])
+    norm = {code: normalize(table.lemmas[code]) for code in used}
+    src_index = lemma_index(src, norm)
+    tgt_index = lemma_index(tgt, norm)
+
+    rows = []
+    ### source longer, then target longer
+    for (item, wn_code, kind, direction, affix,
+         s_rank, s_lemma, t_rank, t_lemma) in _matches(src, tgt_index, norm, min_stem, 'src'):
+        rows.append((item, wn_code, s_rank, t_rank, kind, direction, affix, s_lemma, t_lemma))
+    for (item, wn_code, kind, direction, affix,
+         t_rank, t_lemma, s_rank, s_lemma) in _matches(tgt, src_index, norm, min_stem, 'tgt'):
+        rows.append((item, wn_code, s_rank, t_rank, kind, direction, affix, s_lemma, t_lemma))
+    ### zero derivation: the same normalised lemma, but not the same lemma
+    for (item, wn_code, s), sources in src_index.items():
+        if len(s) < min_stem:
+            continue
+        for s_rank, s_lemma in sources:
+            for t_rank, t_lemma in tgt_index.get((item, wn_code, s), ()):
+                if s_lemma == t_lemma:
+                    ### ignore identical ones
+                    continue
+                rows.append((item, wn_code, s_rank, t_rank, 'zero', '=', '', s_lemma, t_lemma))
+
+    links = pd.DataFrame(rows, columns=['pair', 'wn', 'src_rank', 'tgt_rank', 'kind',
+                                        'direction', 'affix', 'src_lemma', 'tgt_lemma'])
+    links['order'] = links['kind'].map({kind: i for i, kind in enumerate(KINDS)})
+    links = links.sort_values(['pair', 'wn', 'src_rank', 'tgt_rank', 'order'], kind='stable')
+    lexicons = table.lexicons
+    links['wn'] = [lexicons[code] for code in links['wn']]
+    links['link'] = [link_label(w, k, d, a) for w, k, d, a in
+                     zip(links['wn'], links['kind'], links['direction'], links['affix'])]
+    links['src_lemma'] = [table.lemmas[code] for code in links['src_lemma']]
+    links['tgt_lemma'] = [table.lemmas[code] for code in links['tgt_lemma']]
+    return links[['pair', 'wn', 'kind', 'link', 'affix', 'src_lemma', 'tgt_lemma']].reset_index(drop=True)
+
+
+def pattern_counts(links):
+    """
+    how often each pattern (link) turns up in each wordnet
+    returns a DataFrame with columns wn, kind, link, count, most frequent first
+    """
+    counts = links.groupby(['wn', 'kind', 'link'], sort=False).size().reset_index(name='count')
+    return counts.sort_values(['wn', 'count', 'link'], ascending=[True, False, True],
+                              kind='stable').reset_index(drop=True)
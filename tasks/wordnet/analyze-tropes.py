@@ -2,6 +2,7 @@ import wn, wn.ic
 from wn.similarity import path, lin
 import json
 import os
+import pickle
 from collections import defaultdict as dd
 from pathlib import Path
 import seaborn as sns
@@ -9,6 +10,15 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 from scipy import stats
+import sensekeys, chainnet, taxonomy, features, measure as measure_mod, resample
+from sensekeys import lexicon_fingerprint, lexicon_specifier, load_sensekeys
+from chainnet import read_tropes
+from features import FEATURE_VERSION
+from measure import measure
+from stages import run_stage
+from bootstrap import ensure
+from resample import Resampler
+from render import FigureQueue, draw_errorbar, draw_errorbar_pairs, draw_heatmap, set_style
 
 ###
 ### Instead of average depth, look at difference per pair src-tgt
@@ -26,16 +36,19 @@ log = open('related.log', 'w')
 ### store local copy of wordnets
 os.makedirs('wn_data', exist_ok=True)
 wn.config.data_directory = 'wn_data'
+### processes used to measure the tropes, and tropes per chunk
+workers = os.cpu_count() or 1
+chunk_size = 500
+### resamples for the permutation tests and bootstrap CIs (see resample.py)
+n_resamples = 9999
+resample_seed = 0
+### figures are drawn in a pool of processes (see render.py):
+### 'png', or 'pdf'/'svg' for vector output
+figure_format = 'png'
+figure_queue = FigureQueue(outdir, fmt=figure_format, dpi=300, workers=workers)
 
 # Set Tufte-like style
-sns.set_style("ticks", {
-    'axes.linewidth': 0.5,
-    'axes.edgecolor': '0.2',
-    'grid.color': '0.9',
-    'grid.linewidth': 0.5,
-})
-sns.set_context("paper", font_scale=1.1)
-plt.rcParams['font.family'] = 'serif'
+set_style()
 
 
 PAIRED_MEASURES = [
@@ -54,6 +67,7 @@ TROPE_MEASURES = [
     ('depth_difference', 'Depth Difference'),
     ('abstract_difference', 'Abstract Difference'),
 ]
+ABSTRACT_ROOT = 'i35546' # physical_entity
 
   
 
@@ -61,77 +75,25 @@ TROPE_MEASURES = [
 
 def read_data(data_dir, my_wn):
     """
-    store all the tropes as a set
+    read all the tropes into a compact store, iterate over it for
     (trope, word, source_sense_id, target_sense_id)
     """
-    ### make mapping
-    skey = dict()
-    for s in my_wn.senses(pos='n'):
-        skey[s.metadata()['identifier']] = s.id
-    tropes = set()    
-    # Read in metaphors
-    with open(f"{data_dir}/chainnet_metaphor.json", "r") as fp:
-        metaphor = json.load(fp)
-    print('Read Metaphors')
-    for e in metaphor['content']:
-        w = e['wordform']
-        fr_s = e['from_sense']
-        to_s = e['to_sense']
-        tropes.add(('metaphor', w, skey[fr_s], skey[to_s]))
-    # Read in metonymy
-    with open(f"{data_dir}/chainnet_metonymy.json", "r") as fp:
-        metonymy = json.load(fp)
-    print('Read Metonymy')
-    for e in metonymy['content']:
-        w = e['wordform']
-        fr_s = e['from_sense']
-        to_s = e['to_sense']
-        tropes.add(('metonym', w, skey[fr_s], skey[to_s]))
-    return tropes   
+    ### sense key -> sense id (built once per lexicon, then memory-mapped)
+    skey = load_sensekeys(my_wn)
+    return read_tropes(data_dir, skey)
 
-def measure_tropes(tropes, my_wn):
+def measure_tropes(tropes, my_wn, workers=1, chunk_size=500):
     """
-    loop through the tropes and return some potentially interesting measures
+    return some potentially interesting measures for every trope
+
+    the measures of each synset (depth, topic, synonyms, abstractness)
+    are computed once per lexicon and stored (see features.py), so this
+    is a join; with workers > 1 the tropes are split into chunks of
+    chunk_size and joined in that many processes (see measure.py)
     """
     #ic = wn.ic.load('~/nltk_data/corpora/wordnet_ic/ic-brown.dat', my_wn)
-    
-    scores = []
-    for (trope, word, src_id, tgt_id) in tropes:
-        s1 = my_wn.sense(id=src_id)
-        s2 = my_wn.sense(id=tgt_id)
-        ss1 = s1.synset()
-        ss2 = s2.synset()
-        
-        path_dist = path(ss1, ss2)
-#        lin_dist = path(ss1, ss2)  # Using path for now
-        #lin_dist = lin(ss1, ss2, ic)
-        
-        scores.append({
-            'trope': trope,
-            'word': word,
-            'src_depth': ss1.min_depth(),
-            'tgt_depth': ss2.min_depth(),
-            'src_topic': ss1.lexfile(),
-            'tgt_topic': ss2.lexfile(),
-            'src_synonyms': len(ss1.lemmas()),
-            'tgt_synonyms': len(ss2.lemmas()),
-            'src_abstract': get_abstractness(ss1, my_wn),
-            'tgt_abstract': get_abstractness(ss2, my_wn),
-            'path_distance': path_dist,
-#            'lin_distance': lin_dist,
-            'depth_difference': ss1.min_depth() - ss2.min_depth(),
-            'abstract_difference': get_abstractness(ss1, my_wn) - get_abstractness(ss2, my_wn),
-        })
-    return pd.DataFrame(scores)
-
-def get_abstractness(ss, my_wn):
-    phys = my_wn.synsets(ili='i35546')[0]
-
-    for p in ss.hypernym_paths():
-        for s in p:
-            if s == phys:
-                return 0
-    return 1
+    return measure(tropes, lexicon_specifier(my_wn), ABSTRACT_ROOT,
+                   workers=workers, chunk_size=chunk_size)
 
 
 def perform_statistical_tests(df):
@@ -148,10 +110,23 @@ def perform_statistical_tests(df):
         'within_tropes': {}
     }
     
+    ### permutation p-values and bootstrap CIs of the mean differences,
+    ### all measures at once
+    resampler = Resampler(n_resamples=n_resamples, seed=resample_seed, workers=workers)
+    cols = [col for col, label in TROPE_MEASURES]
+    between = resampler.two_sample(meta_df[cols].to_numpy(dtype=float),
+                                   meto_df[cols].to_numpy(dtype=float))
+    cells = []
+    for measure_name, src_col, tgt_col, label in PAIRED_MEASURES:
+        for trope_type in ['metaphor', 'metonym']:
+            cells.append(np.where(df['trope'] == trope_type,
+                                  df[src_col] - df[tgt_col], np.nan))
+    within = resampler.paired(np.column_stack(cells))
+    
     # Between-trope comparisons (metaphor vs metonymy)
    
     print("\n=== Between-Trope Comparisons (Metaphor vs Metonymy) ===")
-    for col, label in TROPE_MEASURES:
+    for j, (col, label) in enumerate(TROPE_MEASURES):
         meta_vals = meta_df[col].dropna()
         meto_vals = meto_df[col].dropna()
         
@@ -174,18 +149,26 @@ def perform_statistical_tests(df):
             'cohens_d': cohens_d,
             'meta_mean': meta_vals.mean(),
             'meto_mean': meto_vals.mean(),
+            'mean_diff': between['estimate'][j],
+            'p_value_perm': between['p_perm'][j],
+            'ci_low': between['ci_low'][j],
+            'ci_high': between['ci_high'][j],
             # 'meta_median': meta_vals.median(),
             # 'meto_median': meto_vals.median()
         }
         
         print(f"\n{label}:")
         print(f"  Mann-Whitney U: U={u_stat:.1f}, p={p_value_mw:.4f}")
+        print(f"  Mean diff: {between['estimate'][j]:.3f} "
+              f"[{between['ci_low'][j]:.3f}, {between['ci_high'][j]:.3f}], "
+              f"permutation p={between['p_perm'][j]:.4f}")
         print(f"  Cohen's d: {cohens_d:.3f}")
     
     # Within-trope comparisons (source vs target)
     print("\n=== Within-Trope Comparisons (Source vs Target) ===")
     
    
+    j = 0
     for measure_name, src_col, tgt_col, label in PAIRED_MEASURES:
         print(measure_name, src_col, tgt_col, label)
         for trope_type, trope_df in [('metaphor', meta_df), ('metonym', meto_df)]:
@@ -217,19 +200,25 @@ def perform_statistical_tests(df):
                 'src_mean': src_vals.mean(),
                 'tgt_mean': tgt_vals.mean(),
                 'mean_diff': differences.mean(),
+                'p_value_perm': within['p_perm'][j],
+                'ci_low': within['ci_low'][j],
+                'ci_high': within['ci_high'][j],
                 # 'src_median': src_vals.median(),
                 # 'tgt_median': tgt_vals.median()
             }
             
             print(f"\n{trope_name} {label} (Source vs Target):")
             print(f"  Wilcoxon: W={w_stat:.1f}, p={p_value_w:.4f}")
-            print(f"  Mean diff: {differences.mean():.3f}")
+            print(f"  Mean diff: {differences.mean():.3f} "
+                  f"[{within['ci_low'][j]:.3f}, {within['ci_high'][j]:.3f}], "
+                  f"permutation p={within['p_perm'][j]:.4f}")
             print(f"  Cohen's d: {cohens_d:.3f}")
+            j += 1
     
     return results
 
 def create_comparison_plot_errorbar(df, src_col, tgt_col, ylabel, filename):
-    """Create error bar plot comparing source and target for both trope types"""
+    """Queue an error bar plot comparing source and target for both trope types"""
     # Calculate statistics for each group
     stats = []
     for trope in ['metaphor', 'metonym']:
@@ -250,46 +239,10 @@ def create_comparison_plot_errorbar(df, src_col, tgt_col, ylabel, filename):
     print(f"\nCreating {filename} (error bar version)")
     print(stats_df)
     
-    # Create figure
-    fig, ax = plt.subplots(figsize=(6, 4))
-    
-    # Colors
-    colors = {'Source': '#4878CF', 'Target': '#D65F5F'}
-    
-    # Plot error bars
-    x_offset = {'Source': -0.15, 'Target': 0.15}
-    
-    for pos in ['Source', 'Target']:
-        pos_data = stats_df[stats_df['Position'] == pos]
-        x_positions = [0 + x_offset[pos], 1 + x_offset[pos]]
-        
-        ax.errorbar(x_positions, 
-                   pos_data['Mean'].values,
-                   yerr=pos_data['SD'].values,
-                   fmt='o',
-                   color=colors[pos],
-                   markersize=6,
-                   capsize=4,
-                   capthick=1.5,
-                   linewidth=1.5,
-                   label=pos)
-    
-    # Tufte-like adjustments
-    sns.despine(trim=True, offset=5)
-    ax.set_ylabel(ylabel, fontweight='normal')
-    ax.set_xlabel('')
-    ax.set_xticks([0, 1])
-    ax.set_xticklabels(['Metaphor', 'Metonymy'])
-    ax.legend(frameon=False, loc='best', title='')
-    ax.grid(axis='y', alpha=0.3, linewidth=0.5)
-    
-    plt.tight_layout()
-    plt.savefig(f"{outdir}/{filename}", dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"Saved {filename}")
+    figure_queue.add(Path(filename).stem, draw_errorbar_pairs, stats_df, ylabel=ylabel)
 
 def create_distance_plots_errorbar(df):
-    """Create error bar plots for path and lin distances"""
+    """Queue error bar plots for path and lin distances"""
     for dist_type in ['path_distance',  'depth_difference',
                       'abstract_difference']:
         # Filter out None/NaN values
@@ -313,40 +266,12 @@ def create_distance_plots_errorbar(df):
         print(f"\nCreating {dist_type} plot (error bar version)")
         print(stats_df)
         
-        fig, ax = plt.subplots(figsize=(5, 4))
-        
-        # Colors
-        colors = {'Metaphor': '#6C8EBF', 'Metonymy': '#B85450'}
-        
-        # Plot error bars
-        for i, row in stats_df.iterrows():
-            ax.errorbar(i, 
-                       row['Mean'],
-                       yerr=row['SD'],
-                       fmt='o',
-                       color=colors[row['Trope']],
-                       markersize=8,
-                       capsize=5,
-                       capthick=1.5,
-                       linewidth=1.5)
-        
-        # Tufte-like adjustments
-        sns.despine(trim=True, offset=5)
         dist_label = dist_type.replace('_', ' ').title()
-        ax.set_ylabel(dist_label, fontweight='normal')
-        ax.set_xlabel('')
-        ax.set_xticks([0, 1])
-        ax.set_xticklabels(['Metaphor', 'Metonymy'])
-        ax.grid(axis='y', alpha=0.3, linewidth=0.5)
-        
-        plt.tight_layout()
-        filename = f"{dist_type}_comparison_errorbar.png"
-        plt.savefig(f"{outdir}/{filename}", dpi=300, bbox_inches='tight')
-        plt.close()
-        print(f"Saved {filename}")
+        figure_queue.add(f"{dist_type}_comparison_errorbar", draw_errorbar,
+                         stats_df, ylabel=dist_label)
 
 def create_topic_heatmaps(df):
-    """Create heatmaps showing source->target topic transitions"""
+    """Queue heatmaps showing source->target topic transitions"""
     for trope_type in ['metaphor', 'metonym']:
         trope_df = df[df['trope'] == trope_type].copy()
         
@@ -373,32 +298,9 @@ def create_topic_heatmaps(df):
             print(f"Not enough data for {trope_type} topic heatmap")
             continue
         
-        # Create figure
-        fig, ax = plt.subplots(figsize=(12, 10))
-        
-        # Create heatmap with muted colors
-        sns.heatmap(topic_matrix, 
-                    cmap='Blues', 
-                    annot=True, 
-                    fmt='d',
-                    linewidths=0.5,
-                    linecolor='white',
-                    cbar_kws={'label': 'Count'},
-                    ax=ax)
-        
-        # Tufte-like adjustments
-        ax.set_xlabel('Target Topic', fontweight='normal')
-        ax.set_ylabel('Source Topic', fontweight='normal')
-        
         trope_name = 'Metaphor' if trope_type == 'metaphor' else 'Metonymy'
-        ax.set_title(f'{trope_name} Topic Transitions', 
-                     fontweight='normal', pad=20)
-        
-        plt.tight_layout()
-        filename = f"{trope_type}_topic_heatmap.png"
-        plt.savefig(f"{outdir}/{filename}", dpi=300, bbox_inches='tight')
-        plt.close()
-        print(f"Saved {filename}")
+        figure_queue.add(f"{trope_type}_topic_heatmap", draw_heatmap, topic_matrix,
+                         title=f'{trope_name} Topic Transitions')
 
 def interpret_effect_size(d):
     """Interpret Cohen's d effect size"""
@@ -470,9 +372,9 @@ def generate_latex_summary(df, test_results):
     latex_output.append("\\centering")
     latex_output.append("\\caption{Statistical Comparison: Metaphor vs Metonymy}")
     latex_output.append("\\label{tab:between}")
-    latex_output.append("\\begin{tabular}{lrrr}")
+    latex_output.append("\\begin{tabular}{lrrrr}")
     latex_output.append("\\toprule")
-    latex_output.append("Measure & Mann-Whitney $U$ & Cohen's $d$ & Effect Size \\\\")
+    latex_output.append("Measure & Mean Diff [95\\% CI] & Mann-Whitney $U$ & Cohen's $d$ & Effect Size \\\\")
     latex_output.append("\\midrule")
     
     for col, label in TROPE_MEASURES:
@@ -480,7 +382,8 @@ def generate_latex_summary(df, test_results):
         p_formatted = format_p_value(result['p_value_mw'])
         effect = interpret_effect_size(result['cohens_d'])
         
-        latex_output.append(f"{result['label']} & {p_formatted} & {result['cohens_d']:.3f} & {effect} \\\\")
+        latex_output.append(f"{result['label']} & {result['mean_diff']:.2f} [{result['ci_low']:.2f}, {result['ci_high']:.2f}] & "
+                            f"{p_formatted} & {result['cohens_d']:.3f} & {effect} \\\\")
     
     latex_output.append("\\bottomrule")
     latex_output.append("\\end{tabular}")
@@ -495,7 +398,7 @@ def generate_latex_summary(df, test_results):
     latex_output.append("\\label{tab:within}")
     latex_output.append("\\begin{tabular}{lrrrr}")
     latex_output.append("\\toprule")
-    latex_output.append("Comparison & Mean Diff & Wilcoxon & Cohen's $d$ & Effect Size \\\\")
+    latex_output.append("Comparison & Mean Diff [95\\% CI] & Wilcoxon & Cohen's $d$ & Effect Size \\\\")
     latex_output.append("\\midrule")
     
     within_order = ['metaphor_depth', 'metaphor_synonyms',
@@ -508,7 +411,7 @@ def generate_latex_summary(df, test_results):
             p_formatted = format_p_value(result['p_value_w'])
             effect = interpret_effect_size(result['cohens_d'])
             
-            latex_output.append(f"{result['label']} & {result['mean_diff']:.2f} & {p_formatted} & "
+            latex_output.append(f"{result['label']} & {result['mean_diff']:.2f} [{result['ci_low']:.2f}, {result['ci_high']:.2f}] & {p_formatted} & "
                               f"{result['cohens_d']:.3f} & {effect} \\\\")
     
     latex_output.append("\\bottomrule")
@@ -535,6 +438,11 @@ def generate_latex_summary(df, test_results):
     latex_output.append("each trope instance provides a natural pairing of source and target synsets.")
     latex_output.append("")
     
+    latex_output.append("\\paragraph{Resampling}")
+    latex_output.append("Confidence intervals for the mean differences are 95\\% percentile bootstrap intervals ")
+    latex_output.append(f"from {n_resamples} resamples.")
+    latex_output.append("")
+    
     latex_output.append("\\paragraph{Effect Sizes}")
     latex_output.append("We report Cohen's $d$ as a standardized measure of effect size, ")
     latex_output.append("interpreted as: negligible ($|d| < 0.2$), small ($0.2 \\leq |d| < 0.5$), ")
@@ -625,35 +533,62 @@ def generate_latex_summary(df, test_results):
     
     print(f"\nSaved LaTeX summary tables to {outdir}/summary_tables.tex")
 
-if __name__ == "__main__":
-    print('Downloading OMW 1.4')
-    wn.download('omw-en:1.4')
-    ewn = wn.Wordnet(lexicon='omw-en:1.4')
-    
+def save_measurements(ewn, path):
     print('Reading trope data...')
     tropes = read_data(data_dir, ewn)
     print(f"Found {len(tropes)} tropes")
     
     print('Measuring tropes...')
-    df = measure_tropes(tropes, ewn)
+    df = measure_tropes(tropes, ewn, workers=workers, chunk_size=chunk_size)
     
     # Save raw data
-    df.to_csv(f"{outdir}/trope_measurements.csv", index=False)
+    df.to_csv(path, index=False)
     print(f"Saved measurements for {len(df)} tropes")
-    
-    # Perform statistical tests
 
+def save_test_results(df, path):
     print('\nPerforming statistical tests...')
     test_results = perform_statistical_tests(df)
+    with open(path, 'wb') as fh:
+        pickle.dump(test_results, fh)
+
+if __name__ == "__main__":
+    ### each stage is skipped if its inputs, settings and code are unchanged
+    ### (see stages.py); the code of the helper modules counts for measuring
+    lexicon = 'omw-en:1.4'
+    ### installed, restored from a snapshot, or (last resort) downloaded
+    ensure(lexicon)
+    ewn = wn.Wordnet(lexicon=lexicon)
+    
+    chainnet_files = [f"{data_dir}/chainnet_metaphor.json",
+                      f"{data_dir}/chainnet_metonymy.json"]
+    measurements = f"{outdir}/trope_measurements.csv"
+    run_stage('measure', lambda: save_measurements(ewn, measurements),
+              outputs=[measurements], files=chainnet_files,
+              values=[lexicon_fingerprint(lexicon), ABSTRACT_ROOT, FEATURE_VERSION],
+              code=[read_data, measure_tropes, sensekeys, chainnet,
+                    taxonomy, features, measure_mod],
+              builddir=outdir)
+    df = pd.read_csv(measurements)
+    
+    # Perform statistical tests
+    test_file = f"{outdir}/test_results.pkl"
+    run_stage('tests', lambda: save_test_results(df, test_file),
+              outputs=[test_file], files=[measurements],
+              values=[TROPE_MEASURES, PAIRED_MEASURES, n_resamples, resample_seed],
+              code=[save_test_results, perform_statistical_tests, resample],
+              builddir=outdir)
+    with open(test_file, 'rb') as fh:
+        test_results = pickle.load(fh)
     
     # Create visualizations - error bar version
+    ### the plots only compute their statistics and queue the figures;
+    ### figures whose statistics have not changed are not redrawn
     print('\nCreating error bar visualizations...')
-    create_comparison_plot_errorbar(df, 'src_depth', 'tgt_depth', 
-                          'Min Depth', 'depth_comparison_errorbar.png')
-    create_comparison_plot_errorbar(df, 'src_synonyms', 'tgt_synonyms', 
-                          'Number of Synonyms', 'synonyms_comparison_errorbar.png')
-    create_comparison_plot_errorbar(df, 'src_abstract', 'tgt_abstract', 
-                                    'Abstractness', 'abstract_comparison_errorbar.png')
+    for src_col, tgt_col, ylabel, filename in [
+            ('src_depth', 'tgt_depth', 'Min Depth', 'depth_comparison_errorbar.png'),
+            ('src_synonyms', 'tgt_synonyms', 'Number of Synonyms', 'synonyms_comparison_errorbar.png'),
+            ('src_abstract', 'tgt_abstract', 'Abstractness', 'abstract_comparison_errorbar.png')]:
+        create_comparison_plot_errorbar(df, src_col, tgt_col, ylabel, filename)
    
     create_distance_plots_errorbar(df)
     
@@ -661,9 +596,16 @@ if __name__ == "__main__":
     print('\nCreating topic heatmaps...')
     create_topic_heatmaps(df)
     
+    print(f'\nDrawing figures ({figure_format})...')
+    figure_queue.run()
+    
     # Generate LaTeX summary
     print('\nGenerating LaTeX summary...')
-    generate_latex_summary(df, test_results)
+    run_stage('latex', lambda: generate_latex_summary(df, test_results),
+              outputs=[f"{outdir}/summary_tables.tex"],
+              files=[measurements, test_file], values=[TROPE_MEASURES, n_resamples],
+              code=[generate_latex_summary, format_p_value, interpret_effect_size],
+              builddir=outdir)
     
     print('\nDone!')
     log.close()
@@ -0,0 +1,278 @@
+"""
+Offline-first set up of the wn lexicons
+
+    from bootstrap import ensure
+    ensure('omw-en:1.4')                             # a lexicon
+    ensure('omw:1.4', lexicons=['omw-en:1.4'])       # a project
+    ensure('omw-en:1.4.cn', lmf=['omw-en_1.4_cn.xml'], download=False)
+
+ensure() never touches the network if it can help it:
+
+  1. bootstrap.json in the wn data directory records what ensure() has
+     already installed, and the size and modification time of wn.db at
+     the time.  If wn.db has not changed, that is all we check.
+  2. Otherwise look in wn.db (read-only) for the lexicons.
+  3. If they are missing, restore a prebuilt snapshot of wn.db: a gzipped
+     copy of the database with a .json file listing its lexicons, from
+     <data directory>/snapshots/ or any directory in $WN_SNAPSHOTS.  This
+     is much faster than parsing the LMF XML again.  A snapshot only
+     replaces wn.db if it has every lexicon already installed, and the
+     same schema (see schema_hash()).  wn.db is swapped under wn's feet,
+     so call ensure() before anything in the process uses wn.
+  4. Then try the LMF files given (wn.add), and
+  5. only then wn.download().
+
+Make a snapshot once the lexicons are installed:
+
+    python bootstrap.py snapshot wn_data snapshots/omw-en_1.4_cn.db.gz
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+import wn
+
+from sensekeys import connect_ro
+
+MANIFEST = 'bootstrap.json'
+SNAPSHOT_SUFFIX = '.db.gz'
+
+
+def manifest_path():
+    return Path(wn.config.data_directory) / MANIFEST
+
+
+def db_stat():
+    """
+    size and modification time of wn.db (None if there is none)
+    """
+    try:
+        st = os.stat(wn.config.database_path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_manifest():
+    try:
+        with open(manifest_path()) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {'db': None, 'installed': {}}
+
+
+def write_manifest(manifest):
+    path = manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def installed_lexicons():
+    """
+    specifiers of the lexicons in wn.db, read without wn (and so
+    without creating the database if there is none)
+    """
+    if db_stat() is None:
+        return set()
+    conn = connect_ro()
+    try:
+        return {spec for (spec,) in conn.execute("SELECT specifier FROM lexicons")}
+    except sqlite3.DatabaseError:
+        return set()
+    finally:
+        conn.close()
+
+
+def schema_hash(path):
+    """
+    hash of the CREATE statements of the tables and indexes of a
+    database (from sqlite_master, whitespace normalised)
+    """
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("""SELECT type, name, sql FROM sqlite_master
+                               WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                               ORDER BY type, name""")
+        h = hashlib.sha256()
+        for kind, name, sql in rows:
+            h.update(f"{kind}\t{name}\t{' '.join(sql.split())}\n".encode())
+        return h.hexdigest()
+    finally:
+        conn.close()
+
+
+def compatible(info):
+    """
+    can the installed wn use a snapshot: it has the same schema as the
+    wn.db here or, if there is no wn.db yet, was made by this wn version
+    """
+    if db_stat() is None:
+        return info.get('wn') == wn.__version__
+    return info.get('schema') == schema_hash(wn.config.database_path)
+
+
+def is_open(path):
+    """
+    True if this process has the file open (as wn does with wn.db once
+    it has connected); only known where there is /proc/self/fd
+    """
+    path = os.path.realpath(path)
+    try:
+        fds = os.listdir('/proc/self/fd')
+    except OSError:
+        return False
+    for fd in fds:
+        try:
+            if os.readlink(f'/proc/self/fd/{fd}') == path:
+                return True
+        except OSError:
+            continue
+    return False
+
+
+def snapshot_dirs():
+    dirs = [Path(wn.config.data_directory) / 'snapshots']
+    dirs += [Path(d) for d in os.environ.get('WN_SNAPSHOTS', '').split(os.pathsep) if d]
+    return dirs
+
+
+def find_snapshots(lexicons, dirs=None):
+    """
+    yield (path, info) for the snapshots that have all the lexicons
+    """
+    for d in dirs or snapshot_dirs():
+        if not d.is_dir():
+            continue
+        for path in sorted(d.glob(f'*{SNAPSHOT_SUFFIX}')):
+            try:
+                with open(str(path) + '.json') as fh:
+                    info = json.load(fh)
+            except (FileNotFoundError, ValueError):
+                continue
+            if set(lexicons) <= set(info['lexicons']):
+                yield path, info
+
+
+def make_snapshot(out):
+    """
+    write a gzipped copy of wn.db (taken with the sqlite backup API, so
+    safe while it is in use) to out, and the list of its lexicons to
+    out.json
+    """
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + f'.{os.getpid()}.tmp')
+    src = connect_ro()
+    dst = sqlite3.connect(tmp)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    info = {'lexicons': sorted(installed_lexicons()),
+            'schema': schema_hash(tmp),
+            'wn': wn.__version__}
+    with open(tmp, 'rb') as fin, gzip.open(str(out) + '.tmp', 'wb', compresslevel=6) as fout:
+        shutil.copyfileobj(fin, fout, 1 << 20)
+    os.remove(tmp)
+    os.replace(str(out) + '.tmp', out)
+    with open(str(out) + '.json', 'w') as fh:
+        json.dump(info, fh, indent=1)
+    print(f"Saved snapshot of {', '.join(info['lexicons'])} to {out}")
+    return out
+
+
+def restore_snapshot(path):
+    """
+    replace wn.db with a snapshot; wn must not have connected to it yet
+    """
+    dbpath = Path(wn.config.database_path)
+    if is_open(dbpath):
+        raise wn.Error(f"{dbpath} is in use: restore snapshots before using wn")
+    dbpath.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dbpath.with_name(dbpath.name + f'.{os.getpid()}.tmp')
+    with gzip.open(path, 'rb') as fin, open(tmp, 'wb') as fout:
+        shutil.copyfileobj(fin, fout, 1 << 20)
+    os.replace(tmp, dbpath)
+
+
+def _restore(lexicons, installed):
+    """
+    restore the first usable snapshot with all the lexicons,
+    returns its path (or None)
+    """
+    for path, info in find_snapshots(lexicons):
+        if not installed <= set(info['lexicons']):
+            ### it would lose lexicons we have
+            continue
+        if not compatible(info):
+            print(f"Snapshot {path} was made with an incompatible version of wn ({info.get('wn')})")
+            continue
+        print(f"Restoring {', '.join(lexicons)} from {path}")
+        restore_snapshot(path)
+        return path
+    return None
+
+
+def ensure(name, lexicons=None, lmf=(), download=True):
+    """
+    make sure the lexicons are installed, without the network if
+    possible (see above); returns how they were found: 'manifest',
+    'database', 'snapshot', 'lmf' or 'download'
+
+    name:     lexicon specifier or project to download, e.g. 'omw:1.4'
+    lexicons: specifiers that must be installed (default: [name])
+    lmf:      LMF files to wn.add() if there is no snapshot
+    download: wn.download(name) as a last resort
+    """
+    lexicons = sorted(lexicons or [name])
+    manifest = read_manifest()
+    entry = manifest['installed'].get(name)
+    if entry and entry['lexicons'] == lexicons and manifest['db'] == db_stat():
+        return 'manifest'
+
+    installed = installed_lexicons()
+    if set(lexicons) <= installed:
+        how = 'database'
+    elif _restore(lexicons, installed):
+        how = 'snapshot'
+    else:
+        how = None
+        for path in lmf:
+            if os.path.exists(path):
+                print(f"Installing {', '.join(lexicons)} from {path}")
+                wn.add(path)
+                how = 'lmf'
+                break
+        if how is None and download:
+            print(f"Downloading {name}")
+            wn.download(name)
+            how = 'download'
+        if how is None or not set(lexicons) <= installed_lexicons():
+            raise wn.Error(f"lexicon not installed and no snapshot or file to install it from: "
+                           f"{', '.join(lexicons)}")
+
+    ### entries for lexicons that have gone are dropped
+    installed = installed_lexicons()
+    manifest['installed'] = {k: v for k, v in manifest['installed'].items()
+                             if set(v['lexicons']) <= installed}
+    manifest['installed'][name] = {'lexicons': lexicons, 'source': how}
+    manifest['db'] = db_stat()
+    write_manifest(manifest)
+    return how
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != 'snapshot':
+        print(f"usage: {sys.argv[0]} snapshot DATA_DIRECTORY OUT{SNAPSHOT_SUFFIX}")
+        sys.exit(1)
+    wn.config.data_directory = sys.argv[2]
+    make_snapshot(sys.argv[3])
@@ -0,0 +1,239 @@
+"""
+Streaming, compact loader for ChainNet trope files
+
+The ChainNet files (chainnet_metaphor.json, chainnet_metonymy.json, ...)
+are a small metadata header and a long 'content' array.  iter_content()
+reads the array one record at a time, so we never hold the whole file.
+
+Tropes are stored column by column rather than as a tuple per trope:
+
+  kind[i]    trope type code   (index into .kinds, e.g. 'metaphor')
+  word[i]    wordform code     (index into .words, interned)
+  src[i]     source sense      (integer sense id)
+  tgt[i]     target sense      (integer sense id)
+  source[i]  file/release code (index into .sources)
+
+Integer sense ids are the ordinals from a SenseKeyIndex (see sensekeys.py),
+or, if no index is given, codes for the interned sense keys themselves.
+
+Iterating gives the same (trope, word, source_sense_id, target_sense_id)
+tuples as the old read_data(), in file order.
+"""
+import json
+from array import array
+from pathlib import Path
+
+CHUNK = 1 << 16
+
+
+def iter_content(path, chunk=CHUNK):
+    """
+    yield the records of the top-level 'content' array of a ChainNet file,
+    one at a time, reading the file in chunks
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as fh:
+        buf = ''
+        ### find the start of the content array
+        while True:
+            i = buf.find('"content"')
+            if i >= 0:
+                j = buf.find('[', i)
+                if j >= 0:
+                    buf = buf[j + 1:]
+                    break
+            data = fh.read(chunk)
+            if not data:
+                return
+            buf += data
+        ### decode one record at a time
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                data = fh.read(chunk)
+                if not data:
+                    raise
+                buf = buf[pos:] + data
+                pos = 0
+                continue
+            yield obj
+            pos = end
+            if pos > chunk:
+                buf = buf[pos:]
+                pos = 0
+
+
+def read_metadata(path, chunk=CHUNK):
+    """
+    return the 'metadata' object from the head of a ChainNet file
+    (without reading the content)
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as fh:
+        buf = ''
+        while True:
+            data = fh.read(chunk)
+            buf += data
+            i = buf.find('"metadata"')
+            if i >= 0:
+                j = buf.find('{', i)
+                if j >= 0:
+                    try:
+                        return decoder.raw_decode(buf, j)[0]
+                    except json.JSONDecodeError:
+                        pass
+            if not data or '"content"' in buf:
+                return {}
+
+
+class Intern:
+    """
+    a table of distinct strings, each with a small integer code
+    """
+
+    def __init__(self):
+        self.strings = []
+        self.codes = dict()
+
+    def code(self, s):
+        c = self.codes.get(s)
+        if c is None:
+            c = self.codes[s] = len(self.strings)
+            self.strings.append(s)
+        return c
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class Tropes:
+    """
+    columnar store of tropes from one or more ChainNet files
+
+    skey: a SenseKeyIndex to turn sense keys into integer sense ids
+          (if None, sense keys are interned and yielded as is)
+    dedup: drop repeated tropes (read_data() kept them in a set)
+    skip_unknown: count and skip tropes with a sense key the index does
+          not know, rather than raise KeyError (as read_data() did)
+    """
+
+    def __init__(self, skey=None, dedup=True, skip_unknown=False):
+        self.skey = skey
+        self.kinds = Intern()
+        self.words = Intern()
+        self.sources = Intern()
+        self._senses = Intern() if skey is None else None
+        self.kind = array('B')
+        self.word = array('I')
+        self.src = array('i')
+        self.tgt = array('i')
+        self.source = array('H')
+        self.missing = 0
+        self.skip_unknown = skip_unknown
+        self._seen = set() if dedup else None
+
+    def sense_code(self, key):
+        """
+        integer id of a sense key (-1 if the index does not know it)
+        """
+        if self.skey is None:
+            return self._senses.code(key)
+        return self.skey.ordinal(key)
+
+    def sense_id(self, code):
+        """
+        the sense id (or sense key, without an index) for an integer id
+        """
+        if self.skey is None:
+            return self._senses[code]
+        return self.skey.sense_id(code)
+
+    def add(self, trope, word, from_sense, to_sense, source=''):
+        """
+        add one trope; returns False if it was a duplicate, or (with
+        skip_unknown) one of its senses is unknown
+        """
+        s = self.sense_code(from_sense)
+        t = self.sense_code(to_sense)
+        if s < 0 or t < 0:
+            if not self.skip_unknown:
+                raise KeyError(from_sense if s < 0 else to_sense)
+            self.missing += 1
+            return False
+        k = self.kinds.code(trope)
+        w = self.words.code(word)
+        if self._seen is not None:
+            ### pack into a single int rather than keep a tuple per trope
+            packed = ((k << 32 | w) << 32 | s) << 32 | t
+            if packed in self._seen:
+                return False
+            self._seen.add(packed)
+        self.kind.append(k)
+        self.word.append(w)
+        self.src.append(s)
+        self.tgt.append(t)
+        self.source.append(self.sources.code(source))
+        return True
+
+    def read(self, path, trope, source=None):
+        """
+        stream a ChainNet trope file (records with wordform, from_sense
+        and to_sense) into the store; returns the number of tropes added
+        """
+        source = Path(path).name if source is None else source
+        n = 0
+        for e in iter_content(path):
+            if self.add(trope, e['wordform'], e['from_sense'], e['to_sense'], source):
+                n += 1
+        return n
+
+    def __len__(self):
+        return len(self.kind)
+
+    def row(self, i):
+        """
+        the i-th trope as (trope, word, source_sense_id, target_sense_id)
+        """
+        return (self.kinds[self.kind[i]], self.words[self.word[i]],
+                self.sense_id(self.src[i]), self.sense_id(self.tgt[i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def select(self, trope):
+        """
+        iterate over the rows of one trope type
+        """
+        k = self.kinds.codes.get(trope)
+        for i in range(len(self)):
+            if self.kind[i] == k:
+                yield self.row(i)
+
+
+def read_tropes(data_dir, skey=None, files=None, skip_unknown=False):
+    """
+    read the standard ChainNet metaphor and metonymy files from data_dir
+
+    files: optional list of (filename, trope) to read instead
+    skip_unknown: skip tropes with unknown sense keys (and say how many)
+          instead of raising KeyError
+    """
+    files = files or [('chainnet_metaphor.json', 'metaphor'),
+                      ('chainnet_metonymy.json', 'metonym')]
+    tropes = Tropes(skey, skip_unknown=skip_unknown)
+    for fname, trope in files:
+        n = tropes.read(Path(data_dir) / fname, trope)
+        print(f'Read {n} {trope} tropes from {fname}')
+    if tropes.missing:
+        print(f'Skipped {tropes.missing} tropes with unknown sense keys')
+    return tropes
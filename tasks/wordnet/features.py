@@ -0,0 +1,187 @@
+"""
+Per-synset feature table
+
+The measures in measure_tropes() only depend on the synsets, and the
+same synsets turn up again and again (ChainNet senses chain).  So we
+compute them once for every synset in the lexicon:
+
+  depth      minimum taxonomy depth (Synset.min_depth())
+  lexfile    lexicographer file (Synset.lexfile())
+  synonyms   number of lemmas (len(Synset.lemmas()))
+  abstract   0 if under physical_entity, else 1
+  hyponyms   number of distinct hyponyms below the synset
+
+in one pass (the compiled taxonomy plus one query for the lemma counts),
+store them as one .npy file per column next to the wn database, and
+measuring tropes becomes a join on synset numbers.
+
+The table is rebuilt if the lexicon changes, the abstractness root
+changes, or FEATURE_VERSION is bumped because a feature changed.
+"""
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from sensekeys import chunked_in_query, connect_ro, index_path, lexicon_specifier
+from taxonomy import AncestorIndex, load_taxonomy, path_similarity
+
+FEATURE_VERSION = 1
+COLUMNS = ('depth', 'lexfile', 'synonyms', 'abstract', 'hyponyms')
+PHYSICAL_ENTITY = 'i35546'
+
+
+def lemma_counts(specifier, tax, conn):
+    """
+    number of senses (lemmas) of every synset, in taxonomy order
+    """
+    rows = conn.execute("""SELECT ss.id, COUNT(s.rowid) FROM synsets AS ss
+                           JOIN lexicons AS l ON ss.lexicon_rowid = l.rowid
+                           LEFT JOIN senses AS s ON s.synset_rowid = ss.rowid
+                           WHERE l.specifier = ?
+                           GROUP BY ss.rowid""", (specifier,))
+    counts = np.zeros(len(tax), dtype=np.int32)
+    for sid, n in rows:
+        i = tax.ordinal(sid)
+        if i >= 0:
+            counts[i] = n
+    return counts
+
+
+class SynsetFeatures:
+    """
+    the feature columns for every synset of a lexicon, aligned with the
+    synset numbers of its Taxonomy
+    """
+
+    def __init__(self, tax, columns, meta):
+        self.tax = tax
+        self.columns = columns
+        self.meta = meta
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def frame(self):
+        """
+        the whole table as a DataFrame indexed by synset id
+        """
+        df = pd.DataFrame({name: np.asarray(self.columns[name]) for name in COLUMNS},
+                          index=pd.Index(self.tax.ids, name='synset'))
+        df['lexfile'] = np.array(self.tax.lexfiles, dtype=object)[df['lexfile']]
+        return df
+
+    def save(self, path):
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in COLUMNS:
+            np.save(tmp / f'{name}.npy', self.columns[name])
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump(self.meta, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, tax):
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        columns = {name: np.load(path / f'{name}.npy', mmap_mode='r')
+                   for name in COLUMNS}
+        return cls(tax, columns, meta)
+
+
+def build_features(specifier, abstract_root=PHYSICAL_ENTITY):
+    """
+    compute the feature table for a lexicon in one pass
+    """
+    tax = load_taxonomy(specifier)
+    conn = connect_ro()
+    try:
+        synonyms = lemma_counts(specifier, tax, conn)
+    finally:
+        conn.close()
+    under = AncestorIndex(tax, {'abstract_root': abstract_root})
+    columns = {
+        'depth': tax.min_depth().astype(np.int32),
+        'lexfile': np.asarray(tax.lexfile),
+        'synonyms': synonyms,
+        'abstract': np.where(under.classify()[:, 0], 0, 1).astype(np.int8),
+        'hyponyms': tax.descendant_counts().astype(np.int32),
+    }
+    meta = {'lexicon': specifier, 'fingerprint': tax.fingerprint,
+            'version': FEATURE_VERSION, 'abstract_root': abstract_root}
+    return SynsetFeatures(tax, columns, meta)
+
+
+@lru_cache(maxsize=None)
+def _load_features(specifier, fingerprint, abstract_root):
+    tax = load_taxonomy(specifier)
+    path = index_path(specifier, 'feat')
+    want = {'lexicon': specifier, 'fingerprint': fingerprint,
+            'version': FEATURE_VERSION, 'abstract_root': abstract_root}
+    if (path / 'meta.json').exists():
+        feats = SynsetFeatures.load(path, tax)
+        if feats.meta == want:
+            return feats
+    feats = build_features(specifier, abstract_root)
+    feats.save(path)
+    return feats
+
+
+def load_features(lexicon, abstract_root=PHYSICAL_ENTITY):
+    """
+    return the SynsetFeatures of a lexicon (specifier, wn.Lexicon or
+    wn.Wordnet), computing and saving them first if needed
+    """
+    specifier = lexicon_specifier(lexicon)
+    tax = load_taxonomy(specifier)
+    return _load_features(specifier, tax.fingerprint, abstract_root)
+
+
+def sense_synsets(conn, specifier, sense_ids):
+    """
+    {sense id: synset id} for the senses, within one lexicon
+    """
+    return dict(chunked_in_query(conn, """SELECT s.id, ss.id FROM senses AS s
+                                          JOIN synsets AS ss ON s.synset_rowid = ss.rowid
+                                          JOIN lexicons AS l ON s.lexicon_rowid = l.rowid
+                                          WHERE l.specifier = ? AND s.id IN ({marks})""",
+                                 sense_ids, (specifier,)))
+
+
+def trope_frame(feats, rows, conn):
+    """
+    join the features onto tropes: rows are
+    (trope, word, src_sense_id, tgt_sense_id) and the result has the
+    columns of measure_tropes(), one row per trope in the same order
+    """
+    tax = feats.tax
+    specifier = tax.lexicon
+    synset = sense_synsets(conn, specifier,
+                           [r[2] for r in rows] + [r[3] for r in rows])
+    src = tax.ordinals([synset[r[2]] for r in rows])
+    tgt = tax.ordinals([synset[r[3]] for r in rows])
+    depth = np.asarray(feats['depth'], dtype=np.int64)
+    synonyms = np.asarray(feats['synonyms'], dtype=np.int64)
+    abstract = np.asarray(feats['abstract'], dtype=np.int64)
+    lexfiles = np.array([name or None for name in tax.lexfiles], dtype=object)
+    lexfile = np.asarray(feats['lexfile'])
+    return pd.DataFrame({
+        'trope': [r[0] for r in rows],
+        'word': [r[1] for r in rows],
+        'src_depth': depth[src],
+        'tgt_depth': depth[tgt],
+        'src_topic': lexfiles[lexfile[src]],
+        'tgt_topic': lexfiles[lexfile[tgt]],
+        'src_synonyms': synonyms[src],
+        'tgt_synonyms': synonyms[tgt],
+        'src_abstract': abstract[src],
+        'tgt_abstract': abstract[tgt],
+        'path_distance': path_similarity(tax, src, tgt),
+        'depth_difference': depth[src] - depth[tgt],
+        'abstract_difference': abstract[src] - abstract[tgt],
+    })
@@ -0,0 +1,240 @@
+"""
+Cross-lingual ILI -> {lexicon: [lemmas]} table
+
+For every ILI, the lemmas of the first synset with that ILI in each
+installed lexicon of one version (e.g. all the OMW 1.4 wordnets), in the
+same order as twn.synsets(ili=...)[0].lemmas().  It is read from the wn
+database in one query and stored in wn_data/index/ili-lemmas_<version>/:
+
+  ili.npy      ILI number (i35546 -> 35546)       one row per lemma,
+  lexicon.npy  lexicon code (index into meta)     sorted by ILI, then
+  rank.npy     position of the lemma in the list  lexicon, then rank
+  lemma.npy    lemma code (line in lemmas.txt)
+  lemmas.txt   the distinct lemmas, one per line
+  meta.json    lexicons and their fingerprints
+
+The table is rebuilt if any of the lexicons changes or one is added or
+removed.  join() pairs up the lemmas of two lists of ILIs lexicon by
+lexicon, as a hash join.
+"""
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from sensekeys import chunked_in_query, connect_ro, index_dir, lexicon_fingerprint
+
+TABLE_VERSION = 1
+
+
+def ili_number(ili):
+    """
+    'i35546' -> 35546
+    """
+    return int(ili[1:])
+
+
+def version_lexicons(version, conn):
+    """
+    (rowid, specifier, id) of the installed lexicons of a version, in
+    the order wn.lexicons() gives them
+    """
+    return conn.execute("""SELECT rowid, specifier, id FROM lexicons
+                           WHERE version = ? ORDER BY rowid""", (version,)).fetchall()
+
+
+def table_fingerprint(version, conn):
+    return '\n'.join(lexicon_fingerprint(spec, conn)
+                     for _, spec, _ in version_lexicons(version, conn))
+
+
+class IliLemmas:
+    """
+    the lemmas of each ILI in each lexicon of one version
+    """
+
+    def __init__(self, columns, lemmas, meta):
+        self.ili = columns['ili']
+        self.lexicon = columns['lexicon']
+        self.rank = columns['rank']
+        self.lemma = columns['lemma']
+        self.lemmas = lemmas
+        self.meta = meta
+        self.lexicons = meta['lexicons']
+
+    def __len__(self):
+        return len(self.ili)
+
+    def get(self, ili):
+        """
+        {lexicon id: [lemmas]} for one ILI
+        """
+        n = ili_number(ili)
+        lo, hi = np.searchsorted(self.ili, [n, n + 1])
+        out = dict()
+        for i in range(lo, hi):
+            out.setdefault(self.lexicons[self.lexicon[i]], []).append(self.lemmas[self.lemma[i]])
+        return out
+
+    def frame(self):
+        """
+        the table as a DataFrame with columns ili (number), wn (lexicon
+        id, as a categorical), rank and lemma (code into .lemmas)
+        """
+        return pd.DataFrame({
+            'ili': np.asarray(self.ili),
+            'wn': pd.Categorical.from_codes(np.asarray(self.lexicon), self.lexicons),
+            'rank': np.asarray(self.rank),
+            'lemma': np.asarray(self.lemma),
+        })
+
+    def members(self, ilis):
+        """
+        the lemmas of a list of ILIs in every wordnet, as a DataFrame with
+        columns item (index into the list), wn (lexicon code), rank and
+        lemma (code into .lemmas)
+        """
+        items = pd.DataFrame({'item': np.arange(len(ilis)),
+                              'ili': np.array([ili_number(i) for i in ilis], dtype=np.int32)})
+        table = pd.DataFrame({'ili': np.asarray(self.ili), 'wn': np.asarray(self.lexicon),
+                              'rank': np.asarray(self.rank), 'lemma': np.asarray(self.lemma)})
+        return items.merge(table, on='ili')[['item', 'wn', 'rank', 'lemma']]
+
+    def join(self, src_ilis, tgt_ilis):
+        """
+        every (source lemma, target lemma) pair in every lexicon that
+        has both ILIs, for parallel lists of source and target ILIs
+
+        returns a DataFrame with columns pair (index into the lists), wn,
+        src_lemma, tgt_lemma ordered by pair, lexicon and lemma rank
+        """
+        both = self.members(src_ilis).merge(self.members(tgt_ilis), on=['item', 'wn'],
+                                            suffixes=('_src', '_tgt'))
+        both = both.sort_values(['item', 'wn', 'rank_src', 'rank_tgt'], kind='stable')
+        lemmas = np.array(self.lemmas, dtype=object)
+        return pd.DataFrame({
+            'pair': both['item'].to_numpy(),
+            'wn': np.array(self.lexicons, dtype=object)[both['wn'].to_numpy()],
+            'src_lemma': lemmas[both['lemma_src'].to_numpy()],
+            'tgt_lemma': lemmas[both['lemma_tgt'].to_numpy()],
+        })
+
+    def save(self, path):
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in ('ili', 'lexicon', 'rank', 'lemma'):
+            np.save(tmp / f'{name}.npy', getattr(self, name))
+        with open(tmp / 'lemmas.txt', 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(self.lemmas))
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump(self.meta, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        with open(path / 'lemmas.txt', encoding='utf-8') as fh:
+            lemmas = fh.read().split('\n')
+        columns = {name: np.load(path / f'{name}.npy', mmap_mode='r')
+                   for name in ('ili', 'lexicon', 'rank', 'lemma')}
+        return cls(columns, lemmas, meta)
+
+
+def build_ili_lemmas(version, conn=None):
+    """
+    read the table for all lexicons of a version in one query
+    """
+    own = conn is None
+    conn = conn or connect_ro()
+    try:
+        lexicons = version_lexicons(version, conn)
+        fingerprint = table_fingerprint(version, conn)
+        rows = conn.execute("""SELECT i.id, l.rowid, ss.rowid, f.form
+                               FROM synsets AS ss
+                               JOIN ilis AS i ON ss.ili_rowid = i.rowid
+                               JOIN lexicons AS l ON ss.lexicon_rowid = l.rowid
+                               JOIN senses AS s ON s.synset_rowid = ss.rowid
+                               JOIN forms AS f ON f.entry_rowid = s.entry_rowid
+                                              AND f.rank = 0
+                               WHERE l.version = ?
+                               ORDER BY ss.rowid, s.synset_rank, s.rowid""", (version,))
+        lex_code = {rowid: i for i, (rowid, _, _) in enumerate(lexicons)}
+        ili, lexicon, rank, lemma = [], [], [], []
+        lemmas = dict()
+        ### only the first synset with an ILI in each lexicon
+        first = dict()
+        for ili_id, lex_rowid, ss_rowid, form in rows:
+            key = (ili_id, lex_rowid)
+            if first.setdefault(key, [ss_rowid, 0])[0] != ss_rowid:
+                continue
+            ili.append(ili_number(ili_id))
+            lexicon.append(lex_code[lex_rowid])
+            rank.append(first[key][1])
+            first[key][1] += 1
+            lemma.append(lemmas.setdefault(form, len(lemmas)))
+    finally:
+        if own:
+            conn.close()
+    ili = np.array(ili, dtype=np.int32)
+    lexicon = np.array(lexicon, dtype=np.int16)
+    rank = np.array(rank, dtype=np.int16)
+    order = np.lexsort((rank, lexicon, ili))
+    columns = {'ili': ili[order], 'lexicon': lexicon[order], 'rank': rank[order],
+               'lemma': np.array(lemma, dtype=np.int32)[order]}
+    meta = {'version': version, 'table_version': TABLE_VERSION,
+            'lexicons': [lexid for _, _, lexid in lexicons],
+            'fingerprint': fingerprint}
+    return IliLemmas(columns, list(lemmas), meta)
+
+
+@lru_cache(maxsize=None)
+def _load_ili_lemmas(version, fingerprint):
+    path = index_dir() / f'ili-lemmas_{version}'
+    if (path / 'meta.json').exists():
+        table = IliLemmas.load(path)
+        if (table.meta.get('fingerprint') == fingerprint and
+                table.meta.get('table_version') == TABLE_VERSION):
+            return table
+    print(f'Building the ILI lemma table for version {version}')
+    table = build_ili_lemmas(version)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table.save(path)
+    return table
+
+
+def load_ili_lemmas(version='1.4'):
+    """
+    return the IliLemmas of all installed lexicons of a version,
+    building and saving it first if needed
+    """
+    conn = connect_ro()
+    try:
+        fingerprint = table_fingerprint(version, conn)
+    finally:
+        conn.close()
+    return _load_ili_lemmas(version, fingerprint)
+
+
+def sense_ilis(specifier, sense_ids, conn=None):
+    """
+    {sense id: ILI id} for senses of one lexicon (senses whose synset
+    has no ILI are left out)
+    """
+    own = conn is None
+    conn = conn or connect_ro()
+    try:
+        return dict(chunked_in_query(conn, """SELECT s.id, i.id FROM senses AS s
+                                              JOIN synsets AS ss ON s.synset_rowid = ss.rowid
+                                              JOIN ilis AS i ON ss.ili_rowid = i.rowid
+                                              JOIN lexicons AS l ON s.lexicon_rowid = l.rowid
+                                              WHERE l.specifier = ? AND s.id IN ({marks})""",
+                                     sense_ids, (specifier,)))
+    finally:
+        if own:
+            conn.close()
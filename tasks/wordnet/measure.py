@@ -0,0 +1,71 @@
+"""
+Measure tropes, optionally in parallel
+
+measure() joins the per-synset feature table (features.py) onto the
+tropes.  With more than one worker the tropes are split into chunks and
+each chunk is measured in a worker process.  Workers do not share the
+wn connection of the main process: each opens its own read-only
+connection to the wn database, and the feature arrays are memory-mapped.
+
+The rows are the same as measure_tropes() in analyze-tropes.py makes,
+in the same order as the input tropes, whatever the number of workers.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import wn
+
+from sensekeys import connect_ro
+from features import PHYSICAL_ENTITY, load_features, trope_frame
+from pools import pool_context
+
+_worker = dict()
+
+
+def _init_worker(data_directory, specifier, abstract_root):
+    """
+    set up one worker: its own read-only connection and the feature table
+    """
+    wn.config.data_directory = data_directory
+    _worker['conn'] = connect_ro()
+    _worker['feats'] = load_features(specifier, abstract_root)
+
+
+def _measure_chunk(job):
+    """
+    measure one chunk of tropes in a worker
+    job is (start, [(trope, word, src_id, tgt_id), ...])
+    """
+    start, rows = job
+    return start, trope_frame(_worker['feats'], rows, _worker['conn'])
+
+
+def measure(tropes, specifier, abstract_root=PHYSICAL_ENTITY, workers=1, chunk_size=500):
+    """
+    measure the tropes, return a DataFrame with one row per trope
+
+    tropes:        iterable of (trope, word, src_sense_id, tgt_sense_id)
+    specifier:     the lexicon, e.g. 'omw-en:1.4'
+    abstract_root: synsets under this (ILI or synset id) count as concrete
+    workers:       number of processes (None: all cores)
+    chunk_size:    number of tropes sent to a worker at a time
+    """
+    workers = workers or os.cpu_count() or 1
+    rows = list(tropes)
+    ### build the caches once here, rather than racing in every worker
+    feats = load_features(specifier, abstract_root)
+    if workers == 1 or len(rows) <= chunk_size:
+        conn = connect_ro()
+        try:
+            return trope_frame(feats, rows, conn)
+        finally:
+            conn.close()
+    jobs = [(i, rows[i:i + chunk_size]) for i in range(0, len(rows), chunk_size)]
+    data_directory = str(wn.config.data_directory)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                             initializer=_init_worker,
+                             initargs=(data_directory, specifier, abstract_root)) as pool:
+        frames = [frame for _, frame in sorted(pool.map(_measure_chunk, jobs),
+                                               key=lambda job: job[0])]
+    return pd.concat(frames, ignore_index=True)
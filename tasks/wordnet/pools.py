@@ -0,0 +1,13 @@
+"""
+Process pool helpers shared by the scripts that fan work out to workers
+"""
+import multiprocessing
+
+
+def pool_context():
+    """
+    fork where we can (cheap, and read-only data built before the pool
+    is shared with the workers), otherwise spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
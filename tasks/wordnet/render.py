@@ -0,0 +1,225 @@
+"""
+Render figures in a pool of processes
+
+Drawing with matplotlib is slow (the heatmaps especially), and with
+breakdowns by language or POS there are many figures.  So the plotting
+functions only work out the numbers to plot (a small DataFrame) and add a
+figure spec to a FigureQueue:
+
+    queue = FigureQueue('build', fmt='pdf')
+    queue.add('depth_comparison_errorbar', draw_errorbar_pairs, stats,
+              ylabel='Min Depth')
+    queue.run()
+
+run() draws the figures in worker processes.  A figure is only redrawn if
+its statistics, its options, the drawing code or the format change: the
+hash of these is recorded in build/.stages/figure-<name>.json (see
+stages.py).
+
+Drawing functions are called as draw(data, path, dpi, **options); they
+live here (not in the script) so that workers can import them.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from stages import is_fresh, record, stage_key
+from pools import pool_context
+
+FORMATS = ('png', 'pdf', 'svg')
+
+
+def set_style():
+    """
+    Tufte-like style, set in the main process and in every worker
+    """
+    sns.set_style("ticks", {
+        'axes.linewidth': 0.5,
+        'axes.edgecolor': '0.2',
+        'grid.color': '0.9',
+        'grid.linewidth': 0.5,
+    })
+    sns.set_context("paper", font_scale=1.1)
+    plt.rcParams['font.family'] = 'serif'
+
+
+def _init_worker():
+    matplotlib.use('Agg')
+    set_style()
+
+
+def _draw(job):
+    draw, data, path, dpi, options = job
+    draw(data, path, dpi, **options)
+    plt.close('all')
+    print(f"Saved {Path(path).name}")
+    return path
+
+
+def draw_errorbar_pairs(data, path, dpi, ylabel):
+    """
+    source and target means (with SD) for each trope
+    data has columns Trope, Position, Mean, SD
+    """
+    fig, ax = plt.subplots(figsize=(6, 4))
+
+    # Colors
+    colors = {'Source': '#4878CF', 'Target': '#D65F5F'}
+
+    # Plot error bars
+    x_offset = {'Source': -0.15, 'Target': 0.15}
+
+    for pos in ['Source', 'Target']:
+        pos_data = data[data['Position'] == pos]
+        x_positions = [0 + x_offset[pos], 1 + x_offset[pos]]
+
+        ax.errorbar(x_positions,
+                    pos_data['Mean'].values,
+                    yerr=pos_data['SD'].values,
+                    fmt='o',
+                    color=colors[pos],
+                    markersize=6,
+                    capsize=4,
+                    capthick=1.5,
+                    linewidth=1.5,
+                    label=pos)
+
+    # Tufte-like adjustments
+    sns.despine(trim=True, offset=5)
+    ax.set_ylabel(ylabel, fontweight='normal')
+    ax.set_xlabel('')
+    ax.set_xticks([0, 1])
+    ax.set_xticklabels(['Metaphor', 'Metonymy'])
+    ax.legend(frameon=False, loc='best', title='')
+    ax.grid(axis='y', alpha=0.3, linewidth=0.5)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+
+
+def draw_errorbar(data, path, dpi, ylabel):
+    """
+    one mean (with SD) for each trope
+    data has columns Trope, Mean, SD
+    """
+    fig, ax = plt.subplots(figsize=(5, 4))
+
+    # Colors
+    colors = {'Metaphor': '#6C8EBF', 'Metonymy': '#B85450'}
+
+    # Plot error bars
+    for i, row in data.reset_index(drop=True).iterrows():
+        ax.errorbar(i,
+                    row['Mean'],
+                    yerr=row['SD'],
+                    fmt='o',
+                    color=colors[row['Trope']],
+                    markersize=8,
+                    capsize=5,
+                    capthick=1.5,
+                    linewidth=1.5)
+
+    # Tufte-like adjustments
+    sns.despine(trim=True, offset=5)
+    ax.set_ylabel(ylabel, fontweight='normal')
+    ax.set_xlabel('')
+    ax.set_xticks([0, 1])
+    ax.set_xticklabels(['Metaphor', 'Metonymy'])
+    ax.grid(axis='y', alpha=0.3, linewidth=0.5)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+
+
+def draw_heatmap(data, path, dpi, title):
+    """
+    annotated count matrix, source topics by target topics
+    """
+    fig, ax = plt.subplots(figsize=(12, 10))
+
+    # Create heatmap with muted colors
+    sns.heatmap(data,
+                cmap='Blues',
+                annot=True,
+                fmt='d',
+                linewidths=0.5,
+                linecolor='white',
+                cbar_kws={'label': 'Count'},
+                ax=ax)
+
+    # Tufte-like adjustments
+    ax.set_xlabel('Target Topic', fontweight='normal')
+    ax.set_ylabel('Source Topic', fontweight='normal')
+    ax.set_title(title, fontweight='normal', pad=20)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+
+
+class FigureQueue:
+    """
+    figures waiting to be drawn
+
+    outdir:  where the figures (and build/.stages/) go
+    fmt:     'png', 'pdf' or 'svg'
+    dpi:     resolution of png figures (and of any raster parts of pdf/svg)
+    workers: number of processes (None: all cores)
+    """
+
+    def __init__(self, outdir, fmt='png', dpi=300, workers=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown figure format {fmt!r}, expected one of {FORMATS}")
+        self.outdir = outdir
+        self.fmt = fmt
+        self.dpi = dpi
+        self.workers = workers or os.cpu_count() or 1
+        self.specs = []
+
+    def path(self, name):
+        return os.path.join(self.outdir, f"{name}.{self.fmt}")
+
+    def add(self, name, draw, data, **options):
+        """
+        queue a figure: draw(data, path, dpi, **options) makes it
+        returns the path it will be written to
+        """
+        path = self.path(name)
+        self.specs.append((name, draw, data, path, options))
+        return path
+
+    def key(self, name, draw, data, options):
+        ### the statistics are small, so hash them as text
+        return stage_key(f'figure-{name}',
+                         values=[data.to_csv(), sorted(options.items()),
+                                 self.fmt, self.dpi],
+                         code=[draw, set_style])
+
+    def run(self, force=False):
+        """
+        draw every queued figure whose statistics or code changed
+        returns the paths of the figures drawn
+        """
+        todo = []
+        for name, draw, data, path, options in self.specs:
+            key = self.key(name, draw, data, options)
+            if not force and is_fresh(f'figure-{name}', key, [path], self.outdir):
+                print(f"Skipping {os.path.basename(path)} (unchanged)")
+                continue
+            todo.append((name, key, (draw, data, path, self.dpi, options)))
+        self.specs = []
+        jobs = [job for _, _, job in todo]
+        if self.workers == 1 or len(jobs) <= 1:
+            for job in jobs:
+                _draw(job)
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                     mp_context=pool_context(),
+                                     initializer=_init_worker) as pool:
+                list(pool.map(_draw, jobs))
+        for name, key, job in todo:
+            record(f'figure-{name}', key, [job[2]], self.outdir)
+        return [job[2] for job in jobs]
@@ -0,0 +1,208 @@
+"""
+Permutation tests and bootstrap confidence intervals, batched
+
+The statistic is always a difference of means:
+
+  two_sample(a, b)  mean(a) - mean(b), a and b independent
+                    (e.g. metaphor vs metonymy)
+  paired(d)         mean(d), d = source - target for each trope
+
+Each column of the input is one cell (a measure, or a measure for one
+language and trope, ...), and NaN means "not in this cell".  Columns
+with the same rows are resampled together: one block of resamples is a
+(resamples x rows) matrix of permuted labels, sign flips or bootstrap
+counts, multiplied by the (rows x columns) data.  Blocks are spread
+over a pool of processes.
+
+Every block has its own random stream, spawned from the seed, so the
+results depend on the seed and the number of resamples but not on the
+number of workers.
+
+For each column you get
+
+  estimate   the observed difference
+  ci_low     percentile bootstrap confidence interval
+  ci_high
+  p_perm     two-sided permutation p-value, (1 + #|perm| >= |obs|) / (1 + n)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pools import pool_context
+
+### cells (resamples x rows) in one block
+BLOCK_CELLS = 1 << 22
+
+_worker = dict()
+
+
+def _init_worker(kind, groups):
+    _worker['kind'] = kind
+    _worker['groups'] = groups
+
+
+def _counts(rng, size, n):
+    """
+    how often each of n rows is drawn, in size bootstrap resamples
+    """
+    draws = rng.integers(0, n, (size, n)) + (np.arange(size) * n)[:, None]
+    return np.bincount(draws.ravel(), minlength=size * n).reshape(size, n).astype(float)
+
+
+def _two_sample_block(x, is_a, seed, size):
+    """
+    size permutations and bootstrap resamples of mean(a) - mean(b)
+    x is (rows x columns) with no NaN, is_a says which rows are in a
+    """
+    rng = np.random.default_rng(seed)
+    n = len(is_a)
+    na = int(is_a.sum())
+    nb = n - na
+    total = x.sum(axis=0)
+    ### permutation: the na rows with the smallest random keys are a
+    keys = rng.random((size, n))
+    cut = np.partition(keys, na - 1, axis=1)[:, na - 1:na]
+    sum_a = (keys <= cut).astype(x.dtype) @ x
+    perm = sum_a / na - (total - sum_a) / nb
+    ### bootstrap: resample each group with replacement (as counts)
+    boot = (_counts(rng, size, na) @ x[is_a]) / na - (_counts(rng, size, nb) @ x[~is_a]) / nb
+    return perm, boot
+
+
+def _paired_block(d, seed, size):
+    """
+    size sign flips and bootstrap resamples of mean(d)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(d)
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(size, n))
+    perm = signs @ d / n
+    boot = _counts(rng, size, n) @ d / n
+    return perm, boot
+
+
+def _run_block(job):
+    g, start, seed, size = job
+    if _worker['kind'] == 'paired':
+        (d,) = _worker['groups'][g]
+        return g, start, _paired_block(d, seed, size)
+    x, is_a = _worker['groups'][g]
+    return g, start, _two_sample_block(x, is_a, seed, size)
+
+
+def _collect(results, perm, boot):
+    for g, start, (p, bt) in results:
+        perm[g][start:start + len(p)] = p
+        boot[g][start:start + len(bt)] = bt
+
+
+def column_groups(valid):
+    """
+    group the columns by which rows they have
+    returns a list of (row mask, column indices)
+    """
+    groups = dict()
+    for j in range(valid.shape[1]):
+        groups.setdefault(valid[:, j].tobytes(), (valid[:, j], []))[1].append(j)
+    return [(rows, np.array(cols)) for rows, cols in groups.values()]
+
+
+class Resampler:
+    """
+    n_resamples: permutations and bootstrap resamples per column
+    confidence:  level of the bootstrap interval
+    seed:        seed for all the random streams
+    workers:     number of processes (None: all cores)
+    """
+
+    def __init__(self, n_resamples=9999, confidence=0.95, seed=0, workers=1,
+                 block_cells=BLOCK_CELLS):
+        self.n_resamples = n_resamples
+        self.confidence = confidence
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.block_cells = block_cells
+
+    def two_sample(self, a, b):
+        """
+        compare the columns of a (rows x columns) with those of b
+        returns a dict of arrays, one value per column
+        """
+        a = np.asarray(a, dtype=float)
+        b = np.asarray(b, dtype=float)
+        x = np.vstack([a, b])
+        is_a = np.arange(len(x)) < len(a)
+        valid = ~np.isnan(x)
+        groups, data = [], []
+        for rows, cols in column_groups(valid):
+            xg = x[np.ix_(rows, cols)]
+            ag = is_a[rows]
+            if ag.all() or not ag.any():
+                continue
+            groups.append(cols)
+            data.append((xg, ag))
+        estimate = np.full(x.shape[1], np.nan)
+        for cols, (xg, ag) in zip(groups, data):
+            estimate[cols] = xg[ag].mean(axis=0) - xg[~ag].mean(axis=0)
+        return self._summarise('two_sample', groups, data, estimate)
+
+    def paired(self, d):
+        """
+        test whether the columns of d (rows x columns) have mean 0
+        returns a dict of arrays, one value per column
+        """
+        d = np.asarray(d, dtype=float)
+        valid = ~np.isnan(d)
+        groups, data = [], []
+        for rows, cols in column_groups(valid):
+            if not rows.any():
+                continue
+            groups.append(cols)
+            data.append((d[np.ix_(rows, cols)],))
+        estimate = np.full(d.shape[1], np.nan)
+        for cols, (dg,) in zip(groups, data):
+            estimate[cols] = dg.mean(axis=0)
+        return self._summarise('paired', groups, data, estimate)
+
+    def jobs(self, data):
+        """
+        split the resamples of every group into blocks, each with its
+        own seed
+        """
+        blocks = []
+        for g, arrays in enumerate(data):
+            rows = len(arrays[0])
+            size = max(1, self.block_cells // max(rows, 1))
+            for start in range(0, self.n_resamples, size):
+                blocks.append((g, start, min(size, self.n_resamples - start)))
+        seeds = np.random.SeedSequence(self.seed).spawn(len(blocks))
+        return [(g, start, seed, size) for (g, start, size), seed in zip(blocks, seeds)]
+
+    def _summarise(self, kind, groups, data, estimate):
+        m = len(estimate)
+        perm = [np.empty((self.n_resamples, len(cols))) for cols in groups]
+        boot = [np.empty((self.n_resamples, len(cols))) for cols in groups]
+        jobs = self.jobs(data)
+        if self.workers == 1 or len(jobs) <= 1:
+            _init_worker(kind, data)
+            _collect(map(_run_block, jobs), perm, boot)
+            _worker.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                     mp_context=pool_context(),
+                                     initializer=_init_worker,
+                                     initargs=(kind, data)) as pool:
+                _collect(pool.map(_run_block, jobs), perm, boot)
+
+        alpha = (1 - self.confidence) / 2
+        out = {name: np.full(m, np.nan) for name in
+               ('ci_low', 'ci_high', 'p_perm')}
+        out['estimate'] = estimate
+        for cols, p, bt in zip(groups, perm, boot):
+            ### allow for rounding in the permuted sums
+            obs = np.abs(estimate[cols]) - 1e-12
+            out['p_perm'][cols] = (1 + (np.abs(p) >= obs).sum(axis=0)) / (1 + self.n_resamples)
+            out['ci_low'][cols], out['ci_high'][cols] = np.quantile(bt, [alpha, 1 - alpha], axis=0)
+        return out
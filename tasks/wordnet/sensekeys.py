@@ -0,0 +1,301 @@
+"""
+Persistent sense key -> sense id index for a wn lexicon
+
+Mapping WordNet sense keys (e.g. can%1:06:00::) to wn sense ids
+(omw-en-can-02946921-n) means looking at the metadata of every sense,
+which is slow if done through the wn objects.  We do it once per
+lexicon version, straight from the wn database, and store the result
+next to the database (wn_data/index/) in a flat file that is opened
+with mmap, so later runs only pay for the lookups they make.
+
+The index is keyed on the lexicon id and version, and also stores a
+fingerprint of the lexicon in the database: if the lexicon is removed
+and added again, or modified, the index is rebuilt automatically.
+
+Usage:
+
+    from sensekeys import load_sensekeys
+    skey = load_sensekeys(ewn)
+    skey['can%1:06:00::']          # -> 'omw-en-can-02946921-n'
+    skey.ordinal('can%1:06:00::')  # -> small integer id for the sense
+"""
+import json
+import mmap
+import os
+import sqlite3
+import struct
+from bisect import bisect_left
+from pathlib import Path
+
+import wn
+
+MAGIC = b'SKEYIDX1'
+### header: magic, length of the json metadata
+HEADER = struct.Struct('<8sI')
+### limit on the number of ids in one IN (...) query
+BATCH = 500
+
+
+def index_dir():
+    """
+    the directory the indexes live in: next to the wn database
+    """
+    return Path(wn.config.data_directory) / 'index'
+
+
+def connect_ro(dbpath=None):
+    """
+    open a read-only connection to the wn database
+    (safe to use from many processes at once)
+    """
+    dbpath = Path(dbpath or wn.config.database_path)
+    return sqlite3.connect(f"{dbpath.resolve().as_uri()}?mode=ro", uri=True)
+
+
+def chunked_in_query(conn, sql, ids, params=(), batch=BATCH):
+    """
+    run sql once per batch of (distinct) ids and yield all the rows
+
+    sql has a {marks} placeholder for the ?s of the IN (...) list;
+    params are bound before the ids
+    """
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        yield from conn.execute(sql.format(marks=','.join('?' * len(chunk))),
+                                (*params, *chunk))
+
+
+def lexicon_specifier(lexicon):
+    """
+    accept a specifier ('omw-en:1.4'), a wn.Lexicon or a wn.Wordnet
+    with a single lexicon, and return the specifier
+    """
+    if isinstance(lexicon, str):
+        return lexicon
+    if isinstance(lexicon, wn.Wordnet):
+        lexicons = lexicon.lexicons()
+        if len(lexicons) != 1:
+            raise ValueError(f"expected a wordnet with one lexicon, got {lexicons}")
+        lexicon = lexicons[0]
+    return lexicon.specifier()
+
+
+def lexicon_fingerprint(specifier, conn=None):
+    """
+    return a string that changes whenever the lexicon in the database does:
+    its database rowid, modified flag and the range and number of its senses
+    """
+    own = conn is None
+    conn = conn or connect_ro()
+    try:
+        row = conn.execute("SELECT rowid, modified FROM lexicons WHERE specifier = ?",
+                           (specifier,)).fetchone()
+        if row is None:
+            raise wn.Error(f"lexicon not installed: {specifier}")
+        lex_rowid, modified = row
+        count, lo, hi = conn.execute(
+            "SELECT COUNT(*), MIN(rowid), MAX(rowid) FROM senses WHERE lexicon_rowid = ?",
+            (lex_rowid,)).fetchone()
+    finally:
+        if own:
+            conn.close()
+    return f"{specifier}|{lex_rowid}|{int(modified)}|{count}|{lo}|{hi}"
+
+
+def index_path(specifier, suffix='skey'):
+    """
+    where the index for a lexicon is stored, e.g. wn_data/index/omw-en_1.4.skey
+    """
+    lexid, _, version = specifier.partition(':')
+    return index_dir() / f"{lexid}_{version}.{suffix}"
+
+
+def read_sense_keys(specifier, conn):
+    """
+    yield (sense_key, sense_id) for every sense in the lexicon that has one,
+    in database order
+    """
+    rows = conn.execute("""SELECT s.id, s.metadata FROM senses AS s
+                           JOIN lexicons AS l ON s.lexicon_rowid = l.rowid
+                           WHERE l.specifier = ? ORDER BY s.rowid""", (specifier,))
+    for sid, meta in rows:
+        if not meta:
+            continue
+        if isinstance(meta, bytes):
+            meta = meta.decode('utf-8')
+        key = json.loads(meta).get('identifier')
+        if key:
+            yield key, sid
+
+
+def build_sensekeys(specifier, path=None):
+    """
+    build the index for a lexicon and write it to path
+
+    file layout (all integers are little-endian uint32):
+      header, json metadata, padding to 4 bytes
+      n               number of keys
+      key_off[n+1]    offsets into the key blob, keys sorted
+      key_ord[n]      ordinal of the sense for each sorted key
+      id_off[n+1]     offsets into the id blob, ids in ordinal order
+      key blob, id blob
+    """
+    path = Path(path or index_path(specifier))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = connect_ro()
+    try:
+        fingerprint = lexicon_fingerprint(specifier, conn)
+        ids = []
+        key2ord = dict()
+        for key, sid in read_sense_keys(specifier, conn):
+            if key not in key2ord:
+                key2ord[key] = len(ids)
+                ids.append(sid)
+    finally:
+        conn.close()
+    keys = sorted(key2ord, key=lambda k: k.encode('utf-8'))
+    key_blob = [k.encode('utf-8') for k in keys]
+    id_blob = [i.encode('utf-8') for i in ids]
+
+    def offsets(blobs):
+        off = [0]
+        for b in blobs:
+            off.append(off[-1] + len(b))
+        return off
+
+    meta = json.dumps({'lexicon': specifier,
+                       'fingerprint': fingerprint}).encode('utf-8')
+    head = HEADER.pack(MAGIC, len(meta)) + meta
+    head += b'\0' * (-len(head) % 4)
+    n = len(keys)
+    tmp = path.with_suffix(path.suffix + f'.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as out:
+        out.write(head)
+        out.write(struct.pack('<I', n))
+        out.write(struct.pack(f'<{n + 1}I', *offsets(key_blob)))
+        out.write(struct.pack(f'<{n}I', *(key2ord[k] for k in keys)))
+        out.write(struct.pack(f'<{n + 1}I', *offsets(id_blob)))
+        out.write(b''.join(key_blob))
+        out.write(b''.join(id_blob))
+    ### atomic, so parallel readers never see half a file
+    os.replace(tmp, path)
+    return path
+
+
+class SenseKeyIndex:
+    """
+    read-only, memory-mapped view of an index made by build_sensekeys()
+    behaves like a dict from sense key to sense id
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, metalen = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a sense key index: {self.path}")
+        pos = HEADER.size
+        meta = json.loads(self._mm[pos:pos + metalen])
+        self.lexicon = meta['lexicon']
+        self.fingerprint = meta['fingerprint']
+        pos += metalen
+        pos += -pos % 4
+        (n,) = struct.unpack_from('<I', self._mm, pos)
+        pos += 4
+        view = memoryview(self._mm)
+        self._n = n
+        self._key_off = view[pos:pos + 4 * (n + 1)].cast('I')
+        pos += 4 * (n + 1)
+        self._key_ord = view[pos:pos + 4 * n].cast('I')
+        pos += 4 * n
+        self._id_off = view[pos:pos + 4 * (n + 1)].cast('I')
+        pos += 4 * (n + 1)
+        self._key_base = pos
+        self._id_base = pos + self._key_off[n]
+        self._count = len(self._id_off) - 1
+
+    def _key(self, i):
+        a = self._key_base + self._key_off[i]
+        b = self._key_base + self._key_off[i + 1]
+        return self._mm[a:b]
+
+    def _find(self, key):
+        k = key.encode('utf-8')
+        i = bisect_left(range(self._n), k, key=self._key)
+        if i < self._n and self._key(i) == k:
+            return i
+        return -1
+
+    def ordinal(self, key):
+        """
+        return the integer id of the sense with this key (-1 if unknown)
+        ordinals are dense: 0 <= ordinal < self.num_senses
+        """
+        i = self._find(key)
+        return self._key_ord[i] if i >= 0 else -1
+
+    def sense_id(self, ordinal):
+        """
+        return the wn sense id for an ordinal
+        """
+        a = self._id_base + self._id_off[ordinal]
+        b = self._id_base + self._id_off[ordinal + 1]
+        return self._mm[a:b].decode('utf-8')
+
+    @property
+    def num_senses(self):
+        return self._count
+
+    def get(self, key, default=None):
+        o = self.ordinal(key)
+        return self.sense_id(o) if o >= 0 else default
+
+    def __getitem__(self, key):
+        o = self.ordinal(key)
+        if o < 0:
+            raise KeyError(key)
+        return self.sense_id(o)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __len__(self):
+        return self._n
+
+    def keys(self):
+        for i in range(self._n):
+            yield self._key(i).decode('utf-8')
+
+    def items(self):
+        for i in range(self._n):
+            yield self._key(i).decode('utf-8'), self.sense_id(self._key_ord[i])
+
+    def close(self):
+        for v in (self._key_off, self._key_ord, self._id_off):
+            v.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_sensekeys(lexicon):
+    """
+    return the SenseKeyIndex for a lexicon (specifier, wn.Lexicon or wn.Wordnet),
+    building it first if it is missing or out of date
+    """
+    specifier = lexicon_specifier(lexicon)
+    path = index_path(specifier)
+    fingerprint = lexicon_fingerprint(specifier)
+    if path.exists():
+        idx = SenseKeyIndex(path)
+        if idx.fingerprint == fingerprint:
+            return idx
+        idx.close()
+    build_sensekeys(specifier, path)
+    return SenseKeyIndex(path)
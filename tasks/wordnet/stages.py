@@ -0,0 +1,123 @@
+"""
+Content-hashed stage cache for scripts that run in several stages
+
+Each stage declares what it depends on:
+
+  files   input files (hashed by content)
+  values  anything else that changes the result (lexicon fingerprint,
+          lists of measures, ...), hashed by repr()
+  code    functions or modules whose source changes the result
+
+and the files it writes.  The hash of all of this is the key of the
+stage.  After a stage runs, its key and the hashes of its outputs are
+recorded in build/.stages/<name>.json; next time, if the key is the same
+and the outputs are still there, unchanged, the stage is skipped.
+
+So editing the LaTeX table code only reruns the LaTeX stage, not the
+measurement or the figures.
+
+Usage:
+
+    run_stage('tests', lambda: save(perform_statistical_tests(df), out),
+              outputs=[out], files=[measurements],
+              values=[TROPE_MEASURES], code=[perform_statistical_tests])
+"""
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+BLOCK = 1 << 20
+
+
+def digest_file(path):
+    """
+    sha256 of the contents of a file
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def digest_code(obj):
+    """
+    sha256 of the source of a function, class or module
+    """
+    return hashlib.sha256(inspect.getsource(obj).encode('utf-8')).hexdigest()
+
+
+def stage_key(name, files=(), values=(), code=()):
+    """
+    the content hash of everything a stage depends on
+    """
+    h = hashlib.sha256()
+    h.update(name.encode('utf-8'))
+    for f in files:
+        h.update(f"\0file:{Path(f).name}:{digest_file(f)}".encode('utf-8'))
+    for v in values:
+        h.update(f"\0value:{v!r}".encode('utf-8'))
+    for c in code:
+        h.update(f"\0code:{getattr(c, '__qualname__', c)}:{digest_code(c)}".encode('utf-8'))
+    return h.hexdigest()
+
+
+def manifest_path(name, builddir):
+    return Path(builddir) / '.stages' / f'{name}.json'
+
+
+def is_fresh(name, key, outputs, builddir):
+    """
+    True if the stage last ran with this key and its outputs are unchanged
+    """
+    path = manifest_path(name, builddir)
+    if not path.exists():
+        return False
+    with open(path) as fh:
+        manifest = json.load(fh)
+    if manifest.get('key') != key:
+        return False
+    recorded = manifest.get('outputs', {})
+    for out in outputs:
+        out = str(out)
+        if out not in recorded:
+            return False
+        if recorded[out] is None:
+            ### the stage chose not to write it last time
+            if os.path.exists(out):
+                return False
+        elif not os.path.exists(out) or digest_file(out) != recorded[out]:
+            return False
+    return True
+
+
+def record(name, key, outputs, builddir):
+    path = manifest_path(name, builddir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {'key': key,
+                'outputs': {str(out): digest_file(out) if os.path.exists(out) else None
+                            for out in outputs}}
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def run_stage(name, fn, outputs, files=(), values=(), code=(), builddir='build', force=False):
+    """
+    run fn() unless the stage is already up to date
+    fn writes the outputs (it may skip some, e.g. a plot without data)
+    returns True if the stage was run
+    """
+    key = stage_key(name, files, values, code)
+    if not force and is_fresh(name, key, outputs, builddir):
+        print(f"Skipping {name} (unchanged)")
+        return False
+    fn()
+    for out in outputs:
+        if not os.path.exists(out):
+            print(f"Stage {name} did not write {out}")
+    record(name, key, outputs, builddir)
+    return True
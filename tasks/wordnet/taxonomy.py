@@ -0,0 +1,547 @@
+"""
+Compiled hypernym taxonomy of a wn lexicon
+
+Walking hypernym_paths() through the wn objects is slow when it is done
+for every trope.  Here we read the synsets and their hypernym and
+instance_hypernym links once, straight from the wn database, and keep
+them as integer arrays:
+
+  ids[i]       synset id of synset number i
+  pos[i]       part of speech
+  ili[i]       ILI id ('' if none)
+  lexfile[i]   code of the lexicographer file (names in .lexfiles)
+  indptr, parents
+               hypernyms of i are parents[indptr[i]:indptr[i+1]] (CSR)
+  level[i]     longest number of hypernym links from i up to a root,
+               so parents always have a smaller level than children
+
+The arrays are cached next to the wn database (wn_data/index/) and
+rebuilt automatically if the lexicon changes (see sensekeys.py).
+
+AncestorIndex uses them to answer 'is X under physical_entity / PERSON /
+ANIMAL / ...' with a bitset lookup, for a programmable list of roots.
+
+shortest_path_lengths() and path_similarity() compute the same thing as
+wn.similarity.path() for whole arrays of (source, target) pairs at once.
+"""
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+
+from sensekeys import connect_ro, index_path, lexicon_fingerprint, lexicon_specifier
+
+HYPERNYMS = ('hypernym', 'instance_hypernym')
+
+### some useful roots: an ILI, or a PWN 3.0 offset-pos that is
+### prefixed with the lexicon id (omw-en-00007846-n, oewn-00007846-n)
+DEFAULT_ROOTS = {
+    'physical_entity': 'i35546',  # physical_entity.n.01
+    'person': '00007846-n',       # person.n.01
+    'animal': '00015388-n',       # animal.n.01
+}
+
+ARRAYS = ('pos', 'ili', 'lexfile', 'indptr', 'parents', 'level')
+
+
+def read_taxonomy(specifier, conn):
+    """
+    read the synsets and hypernym links of a lexicon from the database
+    return (ids, arrays, lexfile names)
+    """
+    lex_rowid = conn.execute("SELECT rowid FROM lexicons WHERE specifier = ?",
+                             (specifier,)).fetchone()[0]
+    rows = conn.execute("""SELECT s.rowid, s.id, s.pos, i.id, lf.name
+                           FROM synsets AS s
+                           LEFT JOIN ilis AS i ON s.ili_rowid = i.rowid
+                           LEFT JOIN lexfiles AS lf ON s.lexfile_rowid = lf.rowid
+                           WHERE s.lexicon_rowid = ? ORDER BY s.rowid""",
+                        (lex_rowid,)).fetchall()
+    ids = [r[1] for r in rows]
+    rowid2i = {r[0]: i for i, r in enumerate(rows)}
+    lexfiles = sorted({r[4] or '' for r in rows})
+    lf_code = {name: c for c, name in enumerate(lexfiles)}
+    pos = np.array([r[2] or '' for r in rows], dtype='U1')
+    ili = np.array([r[3] or '' for r in rows])
+    lexfile = np.array([lf_code[r[4] or ''] for r in rows], dtype=np.int16)
+
+    marks = ','.join('?' * len(HYPERNYMS))
+    edges = conn.execute(f"""SELECT r.source_rowid, r.target_rowid
+                             FROM synset_relations AS r
+                             JOIN relation_types AS t ON r.type_rowid = t.rowid
+                             WHERE r.lexicon_rowid = ? AND t.type IN ({marks})""",
+                         (lex_rowid, *HYPERNYMS)).fetchall()
+    src, tgt = [], []
+    for s, t in edges:
+        if s in rowid2i and t in rowid2i and s != t:
+            src.append(rowid2i[s])
+            tgt.append(rowid2i[t])
+    n = len(ids)
+    indptr, parents = to_csr(n, np.array(src, dtype=np.int32),
+                             np.array(tgt, dtype=np.int32))
+    arrays = {'pos': pos, 'ili': ili, 'lexfile': lexfile,
+              'indptr': indptr, 'parents': parents,
+              'level': levels(n, indptr, parents)}
+    return ids, arrays, lexfiles
+
+
+def to_csr(n, src, tgt):
+    """
+    turn edges src -> tgt into CSR arrays (indptr, indices), without duplicates
+    """
+    if len(src):
+        pairs = np.unique(np.stack([src, tgt], axis=1), axis=0)
+        src, tgt = pairs[:, 0], pairs[:, 1]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, tgt.astype(np.int32)
+
+
+def transpose(n, indptr, indices):
+    """
+    reverse the edges of a CSR graph (e.g. hypernyms -> hyponyms)
+    """
+    src = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    t_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=n), out=t_indptr[1:])
+    return t_indptr, src[order]
+
+
+def levels(n, indptr, parents):
+    """
+    longest distance from each synset up to a root, one frontier at a time
+    (synsets caught in a hypernym cycle, if any, get level -1)
+    """
+    level = np.full(n, -1, dtype=np.int32)
+    waiting = np.diff(indptr).astype(np.int64)
+    c_indptr, children = transpose(n, indptr, parents)
+    frontier = np.flatnonzero(waiting == 0)
+    depth = 0
+    while len(frontier):
+        level[frontier] = depth
+        kids = children[csr_ranges(c_indptr, frontier)]
+        np.subtract.at(waiting, kids, 1)
+        frontier = np.unique(kids[waiting[kids] == 0])
+        depth += 1
+    return level
+
+
+def csr_ranges(indptr, nodes):
+    """
+    indices of all the CSR entries of nodes, concatenated
+    """
+    starts = indptr[nodes]
+    lens = indptr[nodes + 1] - starts
+    if lens.sum() == 0:
+        return np.zeros(0, dtype=np.int64)
+    offs = np.repeat(starts - np.cumsum(lens) + lens, lens)
+    return offs + np.arange(lens.sum())
+
+
+class Taxonomy:
+    """
+    the hypernym DAG of one lexicon, as integer arrays
+    """
+
+    def __init__(self, specifier, fingerprint, ids, arrays, lexfiles):
+        self.lexicon = specifier
+        self.fingerprint = fingerprint
+        self.ids = ids
+        self.lexfiles = lexfiles
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.index = {sid: i for i, sid in enumerate(ids)}
+        self._ili_index = None
+        self._children = None
+        self._min_depth = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ordinal(self, synset):
+        """
+        synset number for a wn.Synset or synset id (-1 if not in the lexicon)
+        """
+        return self.index.get(getattr(synset, 'id', synset), -1)
+
+    def ordinals(self, synsets):
+        """
+        synset numbers for a sequence of synsets or ids, as an array
+        """
+        return np.fromiter((self.ordinal(s) for s in synsets), dtype=np.int64)
+
+    def by_ili(self, ili):
+        """
+        synset number for an ILI id (-1 if none)
+        """
+        if self._ili_index is None:
+            self._ili_index = {x: i for i, x in enumerate(self.ili) if x}
+        return self._ili_index.get(ili, -1)
+
+    def resolve(self, ref):
+        """
+        synset number for an ILI ('i35546'), a synset id, a wn.Synset or
+        an id without the lexicon prefix ('00007846-n')
+        """
+        if isinstance(ref, str) and ref[:1] == 'i' and ref[1:].isdigit():
+            return self.by_ili(ref)
+        i = self.ordinal(ref)
+        if i < 0 and isinstance(ref, str):
+            lexid = self.lexicon.partition(':')[0]
+            i = self.ordinal(f"{lexid}-{ref}")
+        return i
+
+    def hypernyms(self, i):
+        return self.parents[self.indptr[i]:self.indptr[i + 1]]
+
+    def up_distances(self, i, memo=None):
+        """
+        {ancestor: shortest number of hypernym links} for synset number i,
+        including i itself at distance 0
+
+        memo: a dict shared by the calls of one batch (not kept on the
+              taxonomy, which lives as long as the process)
+        """
+        memo = dict() if memo is None else memo
+        up = memo.get(i)
+        if up is None:
+            up = {i: 0}
+            memo[i] = up  # guards against cycles
+            for p in self.hypernyms(i):
+                for a, d in self.up_distances(int(p), memo).items():
+                    if d + 1 < up.get(a, d + 2):
+                        up[a] = d + 1
+        return up
+
+    def children(self):
+        """
+        the hyponym CSR arrays (indptr, children), made on first use
+        """
+        if self._children is None:
+            self._children = transpose(len(self), self.indptr, self.parents)
+        return self._children
+
+    def topological(self):
+        """
+        synset numbers ordered so that hypernyms come before hyponyms
+        """
+        return np.argsort(self.level, kind='stable')
+
+    def edges_by_level(self):
+        """
+        yield (children, parents) arrays of the hypernym links, one level
+        of children at a time, from the top down: a sweep over these sees
+        every parent finished before its children
+        """
+        child = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        parent = np.asarray(self.parents)
+        edge_level = np.asarray(self.level)[child]
+        order = np.argsort(edge_level, kind='stable')
+        bounds = np.searchsorted(edge_level[order],
+                                 np.arange(edge_level.max(initial=0) + 2))
+        for lv in range(1, len(bounds) - 1):
+            e = order[bounds[lv]:bounds[lv + 1]]
+            if len(e):
+                yield child[e], parent[e]
+
+    def min_depth(self):
+        """
+        array of the minimum taxonomy depth of every synset
+        (the same as Synset.min_depth(): 0 for roots)
+        """
+        if self._min_depth is None:
+            depth = np.where(np.diff(self.indptr) == 0, 0,
+                             np.iinfo(np.int32).max).astype(np.int64)
+            for child, parent in self.edges_by_level():
+                np.minimum.at(depth, child, depth[parent] + 1)
+            self._min_depth = depth
+        return self._min_depth
+
+    def descendant_counts(self):
+        """
+        array of the number of distinct hyponyms (direct or not, instances
+        included) under every synset
+        """
+        n = len(self)
+        anc = [frozenset()] * n
+        flat = []
+        for v in self.topological():
+            ps = self.hypernyms(v)
+            if len(ps) == 0:
+                continue
+            s = set()
+            for p in ps:
+                p = int(p)
+                s |= anc[p]
+                s.add(p)
+            anc[v] = frozenset(s)
+            flat.extend(s)
+        return np.bincount(np.array(flat, dtype=np.int64), minlength=n)
+
+    def save(self, path):
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(tmp / f'{name}.npy', getattr(self, name))
+        with open(tmp / 'ids.json', 'w') as fh:
+            json.dump(self.ids, fh)
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump({'lexicon': self.lexicon, 'fingerprint': self.fingerprint,
+                       'lexfiles': self.lexfiles}, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        with open(path / 'ids.json') as fh:
+            ids = json.load(fh)
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r')
+                  for name in ARRAYS}
+        return cls(meta['lexicon'], meta['fingerprint'], ids, arrays,
+                   meta['lexfiles'])
+
+
+def build_taxonomy(specifier):
+    conn = connect_ro()
+    try:
+        fingerprint = lexicon_fingerprint(specifier, conn)
+        ids, arrays, lexfiles = read_taxonomy(specifier, conn)
+    finally:
+        conn.close()
+    return Taxonomy(specifier, fingerprint, ids, arrays, lexfiles)
+
+
+@lru_cache(maxsize=None)
+def _load_taxonomy(specifier, fingerprint):
+    path = index_path(specifier, 'tax')
+    if (path / 'meta.json').exists():
+        tax = Taxonomy.load(path)
+        if tax.fingerprint == fingerprint:
+            return tax
+    tax = build_taxonomy(specifier)
+    tax.save(path)
+    return tax
+
+
+_checked = dict()
+
+
+def load_taxonomy(lexicon):
+    """
+    return the Taxonomy for a lexicon (specifier, wn.Lexicon or wn.Wordnet),
+    compiling it first if it is missing or out of date
+
+    the database is checked once per process, after that this is a dict lookup
+    """
+    specifier = lexicon_specifier(lexicon)
+    if specifier not in _checked:
+        _checked[specifier] = lexicon_fingerprint(specifier)
+    return _load_taxonomy(specifier, _checked[specifier])
+
+
+class AncestorIndex:
+    """
+    for every synset, a bitset of which roots it is (strictly) under
+
+    roots: dict of name -> ILI, synset id or wn.Synset
+           (or a list, in which case the names are the roots themselves)
+
+    'under' follows hypernym_paths(): a synset is not under itself, so
+    is_under(x, 'physical_entity') is False for physical_entity itself
+    """
+
+    def __init__(self, tax, roots=None):
+        roots = DEFAULT_ROOTS if roots is None else roots
+        if not isinstance(roots, dict):
+            roots = {r: r for r in roots}
+        self.tax = tax
+        self.names = list(roots)
+        self.roots = np.array([tax.resolve(r) for r in roots.values()],
+                              dtype=np.int64)
+        self.missing = [n for n, r in zip(self.names, self.roots) if r < 0]
+        self.bits = self._closure()
+
+    def _closure(self):
+        tax = self.tax
+        n, k = len(tax), len(self.names)
+        words = max(1, (k + 63) // 64)
+        own = np.zeros((n, words), dtype=np.uint64)
+        for b, r in enumerate(self.roots):
+            if r >= 0:
+                own[r, b // 64] |= np.uint64(1) << np.uint64(b % 64)
+        bits = np.zeros((n, words), dtype=np.uint64)
+        ### parents are at a lower level than their children, so one sweep
+        ### over the levels in order propagates the bits all the way down
+        for child, parent in tax.edges_by_level():
+            np.bitwise_or.at(bits, child, bits[parent] | own[parent])
+        return bits
+
+    def mask(self, names):
+        """
+        bitset (one row of words) for a list of root names
+        """
+        m = np.zeros(self.bits.shape[1], dtype=np.uint64)
+        for name in names:
+            b = self.names.index(name)
+            m[b // 64] |= np.uint64(1) << np.uint64(b % 64)
+        return m
+
+    def is_under(self, synset, name):
+        """
+        True if the synset (wn.Synset or id) has the root called name as a hypernym
+        """
+        i = self.tax.ordinal(synset)
+        if i < 0:
+            return False
+        b = self.names.index(name)
+        return bool(self.bits[i, b // 64] >> np.uint64(b % 64) & np.uint64(1))
+
+    def under(self, ordinals, name):
+        """
+        vectorised is_under for an array of synset numbers (-1 gives False)
+        """
+        ordinals = np.asarray(ordinals)
+        b = self.names.index(name)
+        ok = ordinals >= 0
+        out = np.zeros(len(ordinals), dtype=bool)
+        out[ok] = (self.bits[ordinals[ok], b // 64] >> np.uint64(b % 64)) & np.uint64(1)
+        return out
+
+    def classify(self, ordinals=None):
+        """
+        boolean matrix (synsets x roots): which roots each synset is under
+        (all synsets in the lexicon if ordinals is None)
+        """
+        bits = self.bits if ordinals is None else self.bits[np.asarray(ordinals)]
+        cols = [(bits[:, b // 64] >> np.uint64(b % 64)) & np.uint64(1)
+                for b in range(len(self.names))]
+        return np.stack(cols, axis=1).astype(bool) if cols else \
+            np.zeros((len(bits), 0), dtype=bool)
+
+    def labels(self, ordinals=None, names=None):
+        """
+        for each synset, the first of names (default: all roots, in order)
+        it is under, or '' if none: e.g. PERSON vs ANIMAL
+        """
+        names = names or self.names
+        cols = [self.names.index(n) for n in names]
+        matrix = self.classify(ordinals)[:, cols]
+        first = matrix.argmax(axis=1)
+        return np.where(matrix.any(axis=1), np.array(names, dtype=object)[first], '')
+
+
+@lru_cache(maxsize=None)
+def _ancestor_index(tax, roots):
+    return AncestorIndex(tax, dict(roots))
+
+
+def ancestor_index(lexicon, roots=None):
+    """
+    cached AncestorIndex for a lexicon and a set of roots
+    """
+    roots = DEFAULT_ROOTS if roots is None else roots
+    if not isinstance(roots, dict):
+        roots = {r: r for r in roots}
+    return _ancestor_index(load_taxonomy(lexicon), tuple(roots.items()))
+
+
+### Path distances for many pairs at once
+###
+### The shortest path between two synsets goes up from each of them to a
+### common hypernym (wn.taxonomy.shortest_path), so its length is the
+### minimum over common ancestors c of up(a, c) + up(b, c).  We make a
+### padded table of (ancestor, distance) for each synset involved, then
+### compare the rows of every pair with one broadcast per chunk of pairs.
+
+NO_PATH = -1
+
+
+def ancestor_table(tax, nodes):
+    """
+    for synset numbers nodes, return (anc, dist) arrays of shape
+    (len(nodes), K): the ancestors of each (itself included) and their
+    up distances, padded with -1
+    """
+    memo = dict()
+    ups = [tax.up_distances(int(i), memo) for i in nodes]
+    width = max((len(u) for u in ups), default=1)
+    anc = np.full((len(ups), width), -1, dtype=np.int32)
+    dist = np.full((len(ups), width), -1, dtype=np.int32)
+    for r, u in enumerate(ups):
+        anc[r, :len(u)] = list(u.keys())
+        dist[r, :len(u)] = list(u.values())
+    return anc, dist
+
+
+def _as_ordinals(tax, synsets):
+    """
+    synset numbers from an array of numbers, or a sequence of ids or wn.Synsets
+    """
+    if not isinstance(synsets, np.ndarray):
+        synsets = list(synsets)
+        if not synsets or isinstance(synsets[0], (int, np.integer)):
+            synsets = np.asarray(synsets, dtype=np.int64)
+    if isinstance(synsets, np.ndarray) and synsets.dtype.kind in 'iu':
+        return synsets.astype(np.int64)
+    return tax.ordinals(synsets)
+
+
+def shortest_path_lengths(tax, src, tgt, chunk_cells=1 << 24):
+    """
+    number of links on the shortest hypernym/hyponym path between each
+    pair src[i], tgt[i] (synset numbers, ids or wn.Synsets);
+    NO_PATH (-1) if they share no hypernym or a synset is unknown
+    """
+    src = _as_ordinals(tax, src)
+    tgt = _as_ordinals(tax, tgt)
+    if len(src) != len(tgt):
+        raise ValueError("src and tgt must have the same length")
+    out = np.full(len(src), NO_PATH, dtype=np.int64)
+    known = (src >= 0) & (tgt >= 0)
+    if not known.any():
+        return out
+    nodes, inv = np.unique(np.concatenate([src[known], tgt[known]]),
+                           return_inverse=True)
+    anc, dist = ancestor_table(tax, nodes)
+    m = known.sum()
+    a_rows, b_rows = inv[:m], inv[m:]
+    width = anc.shape[1]
+    step = max(1, chunk_cells // (width * width))
+    big = np.iinfo(np.int32).max
+    res = np.empty(m, dtype=np.int64)
+    for lo in range(0, m, step):
+        ar, br = a_rows[lo:lo + step], b_rows[lo:lo + step]
+        A, B = anc[ar][:, :, None], anc[br][:, None, :]
+        same = (A == B) & (A >= 0)
+        total = dist[ar][:, :, None] + dist[br][:, None, :]
+        best = np.where(same, total, big).min(axis=(1, 2))
+        res[lo:lo + step] = np.where(best == big, NO_PATH, best)
+    out[known] = res
+    return out
+
+
+def path_similarity(tax, src, tgt):
+    """
+    wn.similarity.path() for arrays of pairs: 1 / (shortest path + 1),
+    0.0 if there is no path, nan if a synset is unknown or the parts of
+    speech are not comparable (wn raises an error for those)
+    """
+    src = _as_ordinals(tax, src)
+    tgt = _as_ordinals(tax, tgt)
+    lengths = shortest_path_lengths(tax, src, tgt)
+    sim = np.zeros(len(lengths))
+    np.divide(1.0, lengths + 1.0, out=sim, where=lengths >= 0)
+    known = (src >= 0) & (tgt >= 0)
+    pos = np.asarray(tax.pos)
+    ps = np.where(known, pos[np.where(known, src, 0)], '')
+    pt = np.where(known, pos[np.where(known, tgt, 0)], '')
+    ps = np.where(ps == 's', 'a', ps)
+    pt = np.where(pt == 's', 'a', pt)
+    sim[~known | (ps != pt)] = np.nan
+    return sim
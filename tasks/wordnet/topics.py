@@ -0,0 +1,175 @@
+"""
+Topic (TLA) of every synset, propagated top down from anchor synsets
+
+tasks/pos/find_topic.py gives each noun and verb the topic of the
+deepest anchor synset (from nouns.tsv and verbs.tsv) above it, and every
+other synset the topic of its lexicographer file (from topics.toml).
+Enumerating hypernym_paths() to find that anchor is slow for verbs and
+for nouns with several hypernyms, so here it is done once for the whole
+lexicon, in one sweep over the compiled taxonomy (taxonomy.py), level by
+level from the roots down:
+
+  key[s] = max(own anchor of s, key of each hypernym of s)
+
+where the key of an anchor is (depth, topic), so the deepest anchor on
+any path wins (ties go to the topic listed later in the anchor files).
+An anchor is its own topic.  Nouns and verbs with no anchor above them
+are UNKNOWN.
+
+The result is one small integer per synset (a code into .labels), stored
+next to the wn database (wn_data/index/) and rebuilt if the lexicon, the
+anchors or the lexfile topics change.
+
+    from topics import load_topics
+    tops = load_topics('oewn:2024', anchors, lexfile_topics)
+    tops.get('oewn-02084071-n')   # -> 'anm'
+    tops.labels_of(ordinals)      # array of TLAs
+"""
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+
+from sensekeys import index_path, lexicon_specifier
+from stages import stage_key
+from taxonomy import load_taxonomy
+
+TOPIC_VERSION = 1
+UNKNOWN = 'UNKNOWN'
+
+
+def lexfile_topics(tml):
+    """
+    {lexfile name: TLA} from topics.toml, e.g. 'noun.act' -> 'act'
+    """
+    return {f"{pos}.{name}": entry['abv']
+            for pos, names in tml.items() for name, entry in names.items()}
+
+
+class Topics:
+    """
+    the topic of every synset of a lexicon
+    """
+
+    def __init__(self, tax, code, meta):
+        self.tax = tax
+        self.code = code
+        self.meta = meta
+        self.labels = meta['labels']
+        self._labels = np.array(self.labels, dtype=object)
+
+    def __len__(self):
+        return len(self.code)
+
+    def get(self, synset):
+        """
+        TLA of a wn.Synset or synset id (UNKNOWN if not in the lexicon)
+        """
+        i = self.tax.ordinal(synset)
+        if i < 0:
+            return UNKNOWN
+        return self.labels[self.code[i]]
+
+    def labels_of(self, ordinals):
+        """
+        array of the TLAs of an array of synset numbers
+        """
+        return self._labels[np.asarray(self.code)[np.asarray(ordinals)]]
+
+    def save(self, path):
+        tmp = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        np.save(tmp / 'code.npy', self.code)
+        with open(tmp / 'meta.json', 'w') as fh:
+            json.dump(self.meta, fh)
+        if path.exists():
+            shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, tax):
+        with open(path / 'meta.json') as fh:
+            meta = json.load(fh)
+        return cls(tax, np.load(path / 'code.npy', mmap_mode='r'), meta)
+
+
+def propagate(tax, anchor, rank):
+    """
+    the highest ranked anchor at or above every synset
+
+    anchor: array of synset numbers of the anchors
+    rank:   their rank (larger wins)
+    returns an array with the index into anchor for each synset, -1 if none
+    """
+    key = np.full(len(tax), -1, dtype=np.int64)
+    key[anchor] = rank * len(anchor) + np.arange(len(anchor))
+    for child, parent in tax.edges_by_level():
+        np.maximum.at(key, child, key[parent])
+    return np.where(key < 0, -1, key % max(len(anchor), 1))
+
+
+def build_topics(tax, anchors, lexfile_abv, key):
+    """
+    anchors:     {synset id: (depth, TLA, name)}, as find_topic.py reads them
+    lexfile_abv: {lexfile name: TLA}
+    """
+    labels = [UNKNOWN]
+    code_of = {UNKNOWN: 0}
+
+    def code(label):
+        if label not in code_of:
+            code_of[label] = len(labels)
+            labels.append(label)
+        return code_of[label]
+
+    ### anchors in file order, so that later ones win ties
+    found = [(tax.ordinal(sid), depth, code(tla))
+             for sid, (depth, tla, _) in anchors.items()]
+    missing = sum(1 for i, _, _ in found if i < 0)
+    if missing:
+        print(f"{missing} topic anchors are not in {tax.lexicon}")
+    found = [f for f in found if f[0] >= 0]
+    anchor = np.array([i for i, _, _ in found], dtype=np.int64)
+    depth = np.array([d for _, d, _ in found], dtype=np.int64)
+    best = propagate(tax, anchor, depth)
+
+    anchor_code = np.array([c for _, _, c in found] + [0], dtype=np.int16)
+    out = anchor_code[best]  # -1 picks the trailing UNKNOWN
+    lf_code = np.array([code(lexfile_abv[name]) if name in lexfile_abv else 0
+                        for name in tax.lexfiles], dtype=np.int16)
+    other = ~np.isin(np.asarray(tax.pos), ['n', 'v'])
+    out[other] = lf_code[np.asarray(tax.lexfile)[other]]
+    meta = {'lexicon': tax.lexicon, 'fingerprint': tax.fingerprint,
+            'version': TOPIC_VERSION, 'key': key, 'labels': labels}
+    return Topics(tax, out, meta)
+
+
+@lru_cache(maxsize=None)
+def _load_topics(specifier, fingerprint, key, anchors, lexfile_abv):
+    tax = load_taxonomy(specifier)
+    path = index_path(specifier, 'topics')
+    if (path / 'meta.json').exists():
+        tops = Topics.load(path, tax)
+        if (tops.meta.get('fingerprint') == fingerprint and
+                tops.meta.get('version') == TOPIC_VERSION and
+                tops.meta.get('key') == key):
+            return tops
+    print(f'Building the topic index for {specifier}')
+    tops = build_topics(tax, dict(anchors), dict(lexfile_abv), key)
+    tops.save(path)
+    return tops
+
+
+def load_topics(lexicon, anchors, lexfile_abv):
+    """
+    return the Topics of a lexicon (specifier, wn.Lexicon or wn.Wordnet),
+    building and saving them first if needed
+    """
+    specifier = lexicon_specifier(lexicon)
+    tax = load_taxonomy(specifier)
+    anchors = tuple((sid, tuple(v)) for sid, v in anchors.items())
+    lexfile_abv = tuple(sorted(lexfile_abv.items()))
+    key = stage_key('topics', values=[anchors, lexfile_abv])
+    return _load_topics(specifier, tax.fingerprint, key, anchors, lexfile_abv)
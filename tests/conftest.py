@@ -0,0 +1,132 @@
+"""
+Shared fixtures
+
+The task scripts are flat modules that import each other by putting
+their directories on sys.path; the tests do the same.  toy_wn is a small
+English wordnet (data/toy-en.xml: a hypernym DAG with instance
+hypernyms, sense keys, examples, derivations, variant forms and case
+variants such as turkey/Turkey) added to a temporary wn data directory,
+and nltk_wn is the same lexicon behind the part of the NLTK WordNet
+interface the pos scripts use (no NLTK data is needed).
+"""
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import pytest
+import wn
+
+ROOT = Path(__file__).resolve().parent.parent
+for task in ('wordnet', 'pos', 'dbnary', 'lcmap', 'morph'):
+    sys.path.insert(0, str(ROOT / 'tasks' / task))
+
+DATA = Path(__file__).resolve().parent / 'data'
+TOY = 'toy-en:1.0'
+
+
+@pytest.fixture(scope='session')
+def toy_wn(tmp_path_factory):
+    wn.config.data_directory = tmp_path_factory.mktemp('wn_data')
+    wn.add(DATA / 'toy-en.xml', progress_handler=None)
+    return wn.Wordnet(TOY)
+
+
+@lru_cache(maxsize=None)
+def hyponym_index():
+    """
+    {synset id: hyponyms}: the toy data only has hypernym links, NLTK has both
+    """
+    out = dict()
+    for synset in wn.Wordnet(TOY).synsets():
+        for hyper in synset.hypernyms():
+            out.setdefault(hyper.id, []).append(synset)
+    return out
+
+
+class NltkLemma:
+    def __init__(self, sense, synset):
+        self._sense = sense
+        self._synset = synset
+
+    def name(self):
+        return self._sense.word().lemma().replace(' ', '_')
+
+    def key(self):
+        return self._sense.metadata().get('identifier')
+
+    def synset(self):
+        return self._synset
+
+    def derivationally_related_forms(self):
+        return [NltkLemma(s, NltkSynset(s.synset())) for s in self._sense.get_related('derivation')]
+
+
+class NltkSynset:
+    def __init__(self, synset):
+        self._synset = synset
+
+    def name(self):
+        return self._synset.id
+
+    def pos(self):
+        return self._synset.pos
+
+    def definition(self):
+        return self._synset.definition() or ''
+
+    def examples(self):
+        return self._synset.examples()
+
+    def lemmas(self):
+        return [NltkLemma(s, self) for s in self._synset.senses()]
+
+    def hypernyms(self):
+        return [NltkSynset(s) for s in self._synset.hypernyms()]
+
+    def hyponyms(self):
+        return [NltkSynset(s) for s in hyponym_index().get(self._synset.id, ())]
+
+    def __eq__(self, other):
+        return isinstance(other, NltkSynset) and other._synset.id == self._synset.id
+
+    def __hash__(self):
+        return hash(self._synset.id)
+
+    def __repr__(self):
+        return f"NltkSynset({self._synset.id!r})"
+
+
+class NltkWordNet:
+    """
+    wn.Wordnet with the NLTK WordNet methods the pos scripts call
+    """
+
+    def __init__(self, wordnet):
+        self.wordnet = wordnet
+
+    def synsets(self, word, pos=None):
+        return [NltkSynset(s) for s in self.wordnet.synsets(word.replace('_', ' '), pos=pos)]
+
+    def synset(self, name):
+        return NltkSynset(self.wordnet.synset(name))
+
+    def all_synsets(self):
+        return (NltkSynset(s) for s in self.wordnet.synsets())
+
+    def lemma_from_key(self, key):
+        for sense in self.wordnet.senses():
+            if sense.metadata().get('identifier') == key:
+                return NltkLemma(sense, NltkSynset(sense.synset()))
+        raise KeyError(key)
+
+    def morphy(self, form):
+        found = self.wordnet.lemmas(form)
+        return found[0] if found else None
+
+    def get_version(self):
+        return TOY
+
+
+@pytest.fixture(scope='session')
+def nltk_wn(toy_wn):
+    return NltkWordNet(toy_wn)
@@ -0,0 +1,40 @@
+import random
+
+from nltk.wsd import lesk
+
+from batch_lesk import build_lesk, Lesk
+
+
+def contexts(toy_wn, rng, n):
+    words = [w for s in toy_wn.synsets() for t in [s.definition()] + s.examples() for w in t.split()]
+    return [rng.sample(words, rng.randint(1, 12)) for _ in range(n)]
+
+
+def test_same_synsets_as_lesk(nltk_wn, toy_wn):
+    wsd = build_lesk(nltk_wn)
+    lemmas = sorted({lemma.replace(' ', '_') for s in toy_wn.synsets() for lemma in s.lemmas()})
+    rng = random.Random(0)
+    for tokens in contexts(toy_wn, rng, 300):
+        words = rng.sample(lemmas, 5) + ['light', 'run', 'nosuchword']
+        chosen = wsd.disambiguate(tokens, words)
+        for word, synset in zip(words, chosen):
+            assert synset == lesk(tokens, word, synsets=nltk_wn.synsets(word)), (tokens, word)
+
+
+def test_sense_keys(nltk_wn, monkeypatch):
+    import batch_lesk
+    monkeypatch.setattr(batch_lesk, 'word_tokenize', str.split)
+    wsd = build_lesk(nltk_wn)
+    text = 'electromagnetic radiation can produce a visual sensation'
+    [key] = wsd.sense_keys(text, ['light'])
+    synset = lesk(text.split(), 'light', synsets=nltk_wn.synsets('light'))
+    assert key == next(lm.key() for lm in synset.lemmas() if lm.name() == 'light')
+    assert wsd.sense_keys(text, ['nosuchword']) == [None]
+
+
+def test_saved_signatures(nltk_wn, tmp_path):
+    wsd = build_lesk(nltk_wn)
+    wsd.save(tmp_path / 'sig')
+    again = Lesk.load(tmp_path / 'sig', nltk_wn)
+    tokens = 'make lighter or brighter'.split()
+    assert again.disambiguate(tokens, ['light']) == wsd.disambiguate(tokens, ['light'])
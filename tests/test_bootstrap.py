@@ -0,0 +1,33 @@
+import json
+import sqlite3
+
+import pytest
+import wn
+
+import bootstrap
+from conftest import TOY
+
+
+def test_snapshot_schema(toy_wn, tmp_path):
+    out = bootstrap.make_snapshot(tmp_path / 'toy.db.gz')
+    with open(str(out) + '.json') as fh:
+        info = json.load(fh)
+    assert info['lexicons'] == [TOY]
+    assert info['schema'] == bootstrap.schema_hash(wn.config.database_path)
+    assert bootstrap.compatible(info)
+    assert [p for p, _ in bootstrap.find_snapshots([TOY], [tmp_path])] == [out]
+
+    other = tmp_path / 'other.db'
+    conn = sqlite3.connect(other)
+    conn.execute("CREATE TABLE lexicons (rowid INTEGER PRIMARY KEY, specifier TEXT)")
+    conn.close()
+    assert not bootstrap.compatible(dict(info, schema=bootstrap.schema_hash(other)))
+
+
+def test_no_restore_under_wn(toy_wn, tmp_path):
+    ### wn has the database open: swapping it now must fail, not go stale
+    toy_wn.synsets()
+    out = bootstrap.make_snapshot(tmp_path / 'toy.db.gz')
+    with pytest.raises(wn.Error, match='in use'):
+        bootstrap.restore_snapshot(out)
+    assert {s.id for s in toy_wn.synsets()}
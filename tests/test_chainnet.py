@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from chainnet import Tropes, iter_content, read_metadata, read_tropes
+from conftest import ROOT
+from sensekeys import load_sensekeys
+
+CHAINNET = [ROOT / 'tasks' / 'lcmap' / 'chainnet_metaphor.json',
+            ROOT / 'tasks' / 'lcmap' / 'chainnet_metonymy.json']
+
+
+@pytest.mark.parametrize('path', CHAINNET, ids=lambda p: p.name)
+def test_iter_content_matches_json_load(path):
+    with open(path, encoding='utf-8') as fh:
+        data = json.load(fh)
+    assert list(iter_content(path)) == data['content']
+    assert list(iter_content(path, chunk=997)) == data['content']
+    assert read_metadata(path) == data['metadata']
+
+
+@pytest.mark.parametrize('chunk', [1, 2, 7, 64, 1 << 16])
+def test_chunk_boundaries(tmp_path, chunk):
+    records = [{'wordform': 'light', 'from_sense': 'light%1:19:00::', 'to_sense': 'light%1:09:00::',
+                'note': 'brackets ] and braces } in a "string", ünïcode'},
+               {'wordform': 'x' * 300, 'from_sense': 'a', 'to_sense': 'b', 'list': [1, [2, 3]]}] * 5
+    path = tmp_path / 'tropes.json'
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({'metadata': {'name': 'test'}, 'content': records}, fh, indent=2, ensure_ascii=False)
+    assert list(iter_content(path, chunk=chunk)) == records
+
+
+def test_empty_and_missing_content(tmp_path):
+    path = tmp_path / 'empty.json'
+    path.write_text('{"metadata": {}, "content": []}')
+    assert list(iter_content(path)) == []
+    path.write_text('{"metadata": {}}')
+    assert list(iter_content(path)) == []
+
+
+def test_unknown_sense_keys(toy_wn, tmp_path):
+    skey = load_sensekeys(toy_wn)
+    known = [s.metadata()['identifier'] for s in toy_wn.senses()][:2]
+    records = [{'wordform': 'x', 'from_sense': known[0], 'to_sense': known[1]},
+               {'wordform': 'y', 'from_sense': known[0], 'to_sense': 'nosuchword%1:00:00::'}]
+    path = tmp_path / 'chainnet_metaphor.json'
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({'metadata': {}, 'content': records}, fh)
+    files = [(path.name, 'metaphor')]
+    with pytest.raises(KeyError, match='nosuchword'):
+        read_tropes(tmp_path, skey, files)
+    tropes = read_tropes(tmp_path, skey, files, skip_unknown=True)
+    assert len(tropes) == 1 and tropes.missing == 1
+    ### without an index every key is kept
+    assert len(read_tropes(tmp_path, None, files)) == 2
+    with pytest.raises(KeyError):
+        Tropes(skey).add('metaphor', 'z', 'nosuchword%1:00:00::', known[0])
@@ -0,0 +1,47 @@
+from analyze_shifts_final import build_corelex_index, get_noun_senses
+from sensekeys import connect_ro
+
+from conftest import TOY
+
+
+def old_corelex_type(word, sense_id, noun_senses, corelex_map):
+    """
+    get_corelex_type() as analyze_shifts_final.py had it before the index
+    """
+    index = next((i for i, s in enumerate(noun_senses) if s.id == sense_id), -1)
+    if index == -1:
+        return None
+    return corelex_map.get(f"{word}.n.{index + 1:02d}") or corelex_map.get(f"{word}.n.{index + 1}")
+
+
+def corelex_map(toy_wn):
+    ### a type for every possible key, zero-padded or not
+    lemmas = {s.word().lemma() for s in toy_wn.senses()}
+    out = dict()
+    for lemma in lemmas:
+        for n in range(1, 6):
+            out[f"{lemma}.n.{n:02d}" if n % 2 else f"{lemma}.n.{n}"] = f"{lemma}/{n}"
+    return out
+
+
+def test_index_matches_wn_lookup(toy_wn):
+    corelex = corelex_map(toy_wn)
+    conn = connect_ro()
+    try:
+        index = build_corelex_index(TOY, corelex, conn)
+    finally:
+        conn.close()
+    expected = dict()
+    for sense in toy_wn.senses():
+        if sense.synset().pos != 'n':
+            continue
+        word = sense.word().lemma()
+        ctype = old_corelex_type(word, sense.id, get_noun_senses(toy_wn, word), corelex)
+        if ctype:
+            expected[sense.id] = ctype
+    assert index == expected
+    ### the case variants: turkey.n.02 is Turkey's, so the event is turkey.n.03
+    assert index['toy-en-turkey-n-07339098'] == 'turkey/3'
+    assert index['toy-en-Turkey-n-09049599'] == 'Turkey/1'
+    ### a variant form: ewn.senses('colour') finds the color entry too
+    assert index['toy-en-colour-n-04956594'] == 'colour/2'
@@ -0,0 +1,30 @@
+import random
+from difflib import get_close_matches
+
+from fuzzy_index import FuzzyIndex
+
+
+def random_words(rng, n, alphabet='abcde', longest=8):
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, longest))) for _ in range(n)]
+
+
+def test_random_vocabularies():
+    rng = random.Random(0)
+    for _ in range(200):
+        vocabulary = random_words(rng, rng.randint(0, 40))
+        index = FuzzyIndex(vocabulary)
+        for word in random_words(rng, 10):
+            for n, cutoff in ((1, 0.8), (3, 0.6), (5, 0.0), (2, 1.0)):
+                assert index.close_matches(word, n, cutoff) == \
+                    get_close_matches(word, vocabulary, n, cutoff), (word, n, cutoff)
+
+
+def test_lexicon_lemmas(toy_wn):
+    vocabulary = sorted({lemma.lower() for s in toy_wn.synsets() for lemma in s.lemmas()})
+    index = FuzzyIndex(vocabulary)
+    queries = vocabulary + ['lights', 'understood', 'mamal', 'gooses', 'runing', 'turky', 'x']
+    best = index.best_many(queries, cutoff=0.8)
+    for word in queries:
+        expected = get_close_matches(word, vocabulary, n=1, cutoff=0.8)
+        assert best[word] == (expected[0] if expected else None), word
+        assert index.close_matches(word) == get_close_matches(word, vocabulary), word
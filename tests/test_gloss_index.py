@@ -0,0 +1,29 @@
+from gloss_index import build_gloss_index, GlossIndex
+
+
+def docs_with_substring(index, nltk_wn, forms):
+    found = []
+    for doc in range(len(index)):
+        text = index.doc_text(doc)
+        if any(form in text for form in forms):
+            found.append(doc)
+    return found
+
+
+def test_candidates_cover_substring_matches(nltk_wn, toy_wn):
+    index = build_gloss_index(nltk_wn)
+    lemmas = sorted({lemma.replace(' ', '_') for s in toy_wn.synsets() for lemma in s.lemmas()})
+    for forms in [{'understand'}, {'light', 'lighter'}, {'stand', 'bird'}, {'warm_up'},
+                  {'move', 'travel'}, set(lemmas[:10]), set(lemmas)]:
+        expected = docs_with_substring(index, nltk_wn, forms)
+        candidates = set(index.candidates(forms).tolist())
+        assert set(expected) <= candidates, forms
+
+
+def test_synset_docs(nltk_wn, tmp_path):
+    index = build_gloss_index(nltk_wn)
+    index.save(tmp_path / 'gi')
+    index = GlossIndex.load(tmp_path / 'gi', nltk_wn)
+    for synset in nltk_wn.all_synsets():
+        texts = [index.doc_text(d, synset) for d in index.synset_docs(synset)]
+        assert texts == [synset.definition()] + synset.examples()
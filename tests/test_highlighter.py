@@ -0,0 +1,53 @@
+import random
+import re
+
+from highlighter import Highlighter
+
+
+def old_highlight(text, word_list):
+    """
+    highlight() as extend_metaphor 5.py had it before highlighter.py
+    """
+    word_list = sorted(word_list, key=len, reverse=True)
+
+    def replace_word(word):
+        for w in word_list:
+            if w.lower() in word.lower():
+                start = word.lower().find(w.lower())
+                end = start + len(w)
+                return word[:start] + f'<<{word[start:end]}>>' + word[end:]
+        return word
+
+    tokens = re.findall(r'\w+|\W+', text)
+    highlighted = [replace_word(token) if token.isalnum() else token for token in tokens]
+    return ''.join(highlighted)
+
+
+def test_glosses(toy_wn):
+    texts = [t for s in toy_wn.synsets() for t in [s.definition()] + s.examples()]
+    lemmas = sorted({lemma for s in toy_wn.synsets() for lemma in s.lemmas()})
+    rng = random.Random(0)
+    for _ in range(50):
+        forms = rng.sample(lemmas, 6) + ['light', 'Light', 'under', 'stand', 'understand']
+        rng.shuffle(forms)
+        hl = Highlighter(forms)
+        for text in texts:
+            assert hl.highlight(text) == old_highlight(text, forms), (forms, text)
+
+
+def test_random_texts():
+    rng = random.Random(1)
+    alphabet = 'abcAB é'
+    for _ in range(2000):
+        forms = [''.join(rng.choice('abcé') for _ in range(rng.randint(1, 3)))
+                 for _ in range(rng.randint(1, 5))]
+        text = ''.join(rng.choice(alphabet + '-_,1') for _ in range(rng.randint(0, 30)))
+        assert Highlighter(forms).highlight(text) == old_highlight(text, forms), (forms, text)
+
+
+def test_spans():
+    hl = Highlighter(['understand', 'stand'])
+    spans = hl.spans('Misunderstanding, standing.')
+    assert [(s.start, s.end, s.text, s.form) for s in spans] == [
+        (3, 13, 'understand', 'understand'), (18, 23, 'stand', 'stand')]
+    assert Highlighter(['warm_up']).spans('warm_up') == []
@@ -0,0 +1,71 @@
+import bz2
+
+import pytest
+
+from rdfstream import Literal, ParseError, RDF, XSD, open_dump, triples
+
+DOC = r'''@prefix ex: <http://ex.org/> .
+@prefix : <http://d.org/> .
+PREFIX sk: <http://skos/>
+@base <http://base.org/> .
+# a comment
+ex:dog a ex:Entry , ex:Word ;
+   ex:label "dog"@en-GB , 'chien'@fr ;
+   ex:def [ ex:value """a "long"
+line"""@en ; ex:n "1"^^<http://www.w3.org/2001/XMLSchema#string> ] ;
+   ex:num 1.5e+3 , -2 , 3.25 , true ;
+   ex:list ( ex:a "b" ) ;;
+   .
+<rel> ex:p :x\.y , :dog__Noun__1 , ex:caf%C3%A9 .
+_:b1 ex:p "escé\n\"é" .
+[ ex:p ex:o ] .
+[] ex:q ex:r .
+ex:long ex:def """LONG""" , QQQSINGLEQQQ , "SHORT" .
+ex:z ex:p ex:o.
+'''.replace('LONG', 'x' * 600).replace('SINGLE', "'y" * 300).replace('SHORT', 'z' * 400) \
+    .replace('QQQ', "'''")
+
+SIZES = [1, 7, 50, 255, 256, 300, 1000, 1 << 20]
+
+
+def parse(tmp_path, text, chunk, name='doc.ttl'):
+    path = tmp_path / name
+    if name.endswith('.bz2'):
+        path.write_bytes(bz2.compress(text.encode('utf-8')))
+    else:
+        path.write_text(text, encoding='utf-8')
+    with open_dump(path, chunk) as dump:
+        return list(triples(dump))
+
+
+def test_document(tmp_path):
+    found = parse(tmp_path, DOC, 1 << 20)
+    assert ('http://ex.org/dog', RDF + 'type', 'http://ex.org/Entry') in found
+    assert ('http://ex.org/dog', 'http://ex.org/label', Literal('dog', 'en-gb', None)) in found
+    assert ('http://ex.org/dog', 'http://ex.org/num', Literal('1.5e+3', None, XSD + 'double')) in found
+    assert ('http://base.org/rel', 'http://ex.org/p', 'http://d.org/x.y') in found
+    assert ('_:b1', 'http://ex.org/p', Literal('escé\n"é', None, None)) in found
+    values = [o.value for s, p, o in found if s == 'http://ex.org/long']
+    assert values == ['x' * 600, "'y" * 300, 'z' * 400]
+    assert found[-1] == ('http://ex.org/z', 'http://ex.org/p', 'http://ex.org/o')
+
+
+@pytest.mark.parametrize('chunk', SIZES)
+def test_chunk_sizes(tmp_path, chunk):
+    assert parse(tmp_path, DOC, chunk) == parse(tmp_path, DOC, 1 << 20)
+
+
+@pytest.mark.parametrize('chunk', [50, 300])
+def test_long_literal_across_chunks(tmp_path, chunk):
+    text = 'ex:a ex:def """' + 'x' * 600 + '""" .'
+    found = parse(tmp_path, '@prefix ex: <http://ex.org/> .\n' + text, chunk)
+    assert found == [('http://ex.org/a', 'http://ex.org/def', Literal('x' * 600, None, None))]
+
+
+def test_compressed(tmp_path):
+    assert parse(tmp_path, DOC, 64, 'doc.ttl.bz2') == parse(tmp_path, DOC, 1 << 20)
+
+
+def test_errors(tmp_path):
+    with pytest.raises(ParseError):
+        parse(tmp_path, 'nope:a nope:b nope:c .', 1 << 20)
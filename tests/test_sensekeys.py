@@ -0,0 +1,45 @@
+from sensekeys import chunked_in_query, connect_ro, lexicon_specifier, load_sensekeys
+
+
+def test_index_matches_wn(toy_wn):
+    skey = load_sensekeys(toy_wn)
+    senses = {s.metadata()['identifier']: s.id for s in toy_wn.senses()}
+    assert len(skey) == len(senses)
+    for key, sense_id in senses.items():
+        assert key in skey
+        assert skey[key] == sense_id
+        assert skey.sense_id(skey.ordinal(key)) == sense_id
+    assert dict(skey.items()) == senses
+
+
+def test_unknown_keys(toy_wn):
+    skey = load_sensekeys(toy_wn)
+    assert 'nosuchword%1:00:00::' not in skey
+    assert skey.get('nosuchword%1:00:00::') is None
+    assert skey.ordinal('nosuchword%1:00:00::') == -1
+
+
+def test_reloaded_index(toy_wn):
+    first = load_sensekeys(toy_wn)
+    again = load_sensekeys(toy_wn)
+    assert again.fingerprint == first.fingerprint
+    assert list(again.keys()) == list(first.keys())
+
+
+def test_chunked_in_query(toy_wn):
+    specifier = lexicon_specifier(toy_wn)
+    ids = [s.id for s in toy_wn.senses()]
+    sql = """SELECT s.id, ss.id FROM senses AS s
+             JOIN synsets AS ss ON s.synset_rowid = ss.rowid
+             JOIN lexicons AS l ON s.lexicon_rowid = l.rowid
+             WHERE l.specifier = ? AND s.id IN ({marks})"""
+    expected = {s.id: s.synset().id for s in toy_wn.senses()}
+    conn = connect_ro()
+    try:
+        for batch in (1, 3, 500):
+            rows = list(chunked_in_query(conn, sql, ids + ids[:5], (specifier,), batch=batch))
+            assert len(rows) == len(ids)
+            assert dict(rows) == expected
+        assert list(chunked_in_query(conn, sql, [], (specifier,))) == []
+    finally:
+        conn.close()
@@ -0,0 +1,34 @@
+from collections import deque
+
+from synset_distance import NEIGHBOUR_CACHE, SYNSET_CACHE, SynsetDistance
+
+
+def bfs_distance(start, goal):
+    seen = {start: 0}
+    queue = deque([start])
+    while queue:
+        s = queue.popleft()
+        if s == goal:
+            return seen[s]
+        for n in s.hypernyms() + s.hyponyms():
+            if n not in seen:
+                seen[n] = seen[s] + 1
+                queue.append(n)
+    return None
+
+
+def test_batch_matches_bfs(toy_wn, nltk_wn):
+    keys = [s.metadata()['identifier'] for s in toy_wn.senses() if s.synset().pos == 'n'][:15]
+    pairs = [(a, b) for a in keys for b in keys] + [(keys[0], 'nosuchword%1:00:00::')]
+    engine = SynsetDistance(nltk_wn)
+    results = engine.batch(pairs)
+    assert results[-1] == (None, None)
+    for (a, b), (dist, path) in zip(pairs, results[:-1]):
+        s1, s2 = nltk_wn.lemma_from_key(a).synset(), nltk_wn.lemma_from_key(b).synset()
+        assert dist == bfs_distance(s1, s2)
+        if dist is not None:
+            assert len(path) == dist + 1 and path[0] == s1 and path[-1] == s2
+            assert all(y in x.hypernyms() + x.hyponyms() for x, y in zip(path, path[1:]))
+    assert engine._synset.cache_info().maxsize == SYNSET_CACHE
+    assert engine._neighbours.cache_info().maxsize == NEIGHBOUR_CACHE
+    assert engine._synset.cache_info().currsize == len(keys) + 1
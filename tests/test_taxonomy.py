@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+import pytest
+import wn
+import wn.similarity
+
+from taxonomy import NO_PATH, load_taxonomy, path_similarity, shortest_path_lengths
+
+
+def all_pairs(toy_wn):
+    synsets = toy_wn.synsets()
+    return [(a, b) for a in synsets for b in synsets]
+
+
+def test_shortest_path_lengths(toy_wn):
+    tax = load_taxonomy(toy_wn)
+    pairs = all_pairs(toy_wn)
+    lengths = shortest_path_lengths(tax, [a.id for a, _ in pairs], [b.id for _, b in pairs])
+    for (a, b), length in zip(pairs, lengths):
+        try:
+            expected = len(a.shortest_path(b))
+        except wn.Error:
+            expected = NO_PATH
+        assert length == expected, (a.id, b.id)
+
+
+def test_path_similarity(toy_wn):
+    tax = load_taxonomy(toy_wn)
+    pairs = all_pairs(toy_wn)
+    sims = path_similarity(tax, [a.id for a, _ in pairs], [b.id for _, b in pairs])
+    for (a, b), sim in zip(pairs, sims):
+        try:
+            expected = wn.similarity.path(a, b)
+        except wn.Error:
+            assert math.isnan(sim), (a.id, b.id)
+        else:
+            assert sim == pytest.approx(expected), (a.id, b.id)
+
+
+def test_unknown_synsets(toy_wn):
+    tax = load_taxonomy(toy_wn)
+    dog = toy_wn.synsets('dog')[0].id
+    assert shortest_path_lengths(tax, [dog, 'nosuch-n'], ['nosuch-n', dog]).tolist() == [NO_PATH] * 2
+    assert np.isnan(path_similarity(tax, [dog], ['nosuch-n'])).all()